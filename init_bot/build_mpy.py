@@ -0,0 +1,172 @@
+# init_bot/build_mpy.py -- precompile the robot's lib to .mpy. V02
+#
+# V02 - builds whichever lib it is given, each into its own tree. V01
+#       always compiled nhs_lib, so -d factory_alivk -m shipped nhs_lib
+#       over the factory library.
+#
+# Every boot, MicroPython compiles each .py it imports, on the ESP32, out
+# of the same heap the program then has to run in: nhs_robotics,
+# qwiic_huskylens (728 lines), ssd1306, controller, ucPack and the Alvik
+# library itself. mpy-cross does that once, on the laptop. This mirrors a
+# robot dir's lib (nhs_lib if none is named) into init_bot/build with
+# every .py compiled to .mpy and everything else (the pages, their .gz)
+# copied as it is. The build is named after where the lib really is, so
+# the robot dirs whose lib links to nhs_lib share one, and factory_alivk's
+# own lib gets another. initialize_robot.sh -m runs it on SOURCE_DIR/lib
+# and ships that tree as /lib.
+#
+# manifest.json in the build records mpy-cross's version and a SHA-256 of
+# every source. A file whose source and compiler are unchanged is not
+# compiled again, so a rebuild after editing one module compiles one
+# module. The manifest goes to the robot with the rest, so what is on a
+# robot can be matched against a checkout.
+#
+# The .mpy format moves with MicroPython releases: mpy-cross has to come
+# from the release the robot's firmware was built from, or every import
+# fails with "incompatible .mpy file". MPY_CROSS names a binary other than
+# the mpy-cross on the PATH.
+#
+# Usage: python3 init_bot/build_mpy.py [--check | --where] [LIB]
+#
+# --where prints the build LIB goes to, without building it.
+
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.dirname(HERE)
+NHS_LIB = os.path.join(REPO, "nhs_lib")
+MANIFEST = "manifest.json"
+
+# Never shipped, compiled or not. Same list initialize_robot.sh strips.
+JUNK = ("__pycache__", ".DS_Store")
+
+
+def compiler():
+    return [os.environ.get("MPY_CROSS", "mpy-cross")]
+
+
+def out_for(source):
+    """The build for a lib: init_bot/build/<where it really is>_mpy."""
+    real = os.path.relpath(os.path.realpath(source), os.path.realpath(REPO))
+    name = real.replace("..", "up").replace(os.sep, "_")
+    return os.path.join(HERE, "build", name + "_mpy")
+
+
+def sources(folder=NHS_LIB):
+    """Every file under folder, relative to it, junk left out. Follows the
+    symlinks nhs_lib uses for the libraries pulled from GitHub."""
+    found = []
+    for top, dirs, files in os.walk(folder, followlinks=True):
+        dirs[:] = sorted(d for d in dirs if d not in JUNK)
+        for name in files:
+            if name in JUNK or name.endswith(".pyc"):
+                continue
+            path = os.path.join(top, name)
+            if not os.path.exists(path):
+                # Shipping the rest would delete it from the robot
+                raise OSError("%s is a broken link; run sync_submodules.py"
+                              % path)
+            found.append(os.path.relpath(path, folder))
+    return sorted(found)
+
+
+def digest(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def target(name):
+    """Where a source ends up in the build: .py becomes .mpy."""
+    if name.endswith(".py"):
+        return name[:-3] + ".mpy"
+    return name
+
+
+def version(command):
+    """mpy-cross --version, which names the .mpy format it writes."""
+    try:
+        done = subprocess.run(command + ["--version"], capture_output=True,
+                              text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return done.stdout.strip()
+
+
+def build(source=NHS_LIB, out=None, command=None, check=False):
+    """Bring out (source's own build if not given) up to date with source.
+    Returns the names that were (or with check, would be) rebuilt. Raises
+    OSError with no mpy-cross."""
+    out = out or out_for(source)
+    command = command or compiler()
+    made = version(command)
+    if made is None:
+        raise OSError("no %s: pip install mpy-cross==<the robot's MicroPython "
+                      "version>, or set MPY_CROSS" % command[0])
+    try:
+        with open(os.path.join(out, MANIFEST)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+    built = manifest.get("files", {}) if manifest.get("compiler") == made else {}
+
+    names = sources(source)
+    files = {}
+    stale = []
+    for name in names:
+        files[name] = digest(os.path.join(source, name))
+        if built.get(name) == files[name] and \
+                os.path.exists(os.path.join(out, target(name))):
+            continue
+        stale.append(name)
+        if check:
+            continue
+        dest = os.path.join(out, target(name))
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        if name.endswith(".py"):
+            subprocess.run(command + ["-o", dest, "-s", name,
+                                      os.path.join(source, name)], check=True)
+        else:
+            shutil.copyfile(os.path.join(source, name), dest)
+        print("   - %s" % target(name))
+    if check:
+        return stale
+
+    # Whatever is left in the build with no source any more goes, or it
+    # would ship, and still be imported, after its .py was deleted.
+    keep = set(target(name) for name in names) | {MANIFEST}
+    for name in sources(out):
+        if name not in keep:
+            os.remove(os.path.join(out, name))
+            stale.append(name)
+    with open(os.path.join(out, MANIFEST), "w") as f:
+        json.dump({"compiler": made, "files": files}, f, indent=1,
+                  sort_keys=True)
+    return stale
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    check = "--check" in args
+    libs = [a for a in args if not a.startswith("--")]
+    source = libs[0] if libs else NHS_LIB
+    if "--where" in args:
+        print(out_for(source))
+        sys.exit()
+    if not os.path.isdir(source):
+        print("❌ ERROR: %s is not a directory" % source)
+        sys.exit(1)
+    try:
+        stale = build(source, check=check)
+    except (OSError, subprocess.CalledProcessError) as e:
+        # mpy-cross has already said what it did not like
+        print("❌ ERROR: %s" % e)
+        sys.exit(1)
+    if check and stale:
+        print("Stale: " + ", ".join(stale))
+        sys.exit(1)
+    print("   - %d file(s) %s" % (len(stale), "stale" if check else "rebuilt"))
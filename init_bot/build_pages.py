@@ -0,0 +1,66 @@
+# init_bot/build_pages.py -- gzip the robot's web pages. V02
+#
+# Controller and WebGamepad serve their pages pre-compressed: the robot
+# reads <page>.html.gz once and sends it with Content-Encoding: gzip, a
+# third of the bytes over the air and no compression on the ESP32. This
+# writes the .gz next to every .html in nhs_lib. initialize_robot.sh runs it
+# before each sync; the host tests fail if a .gz is older than its page.
+#
+# A .gz is stale when it does not unpack to its page. The compressed bytes
+# are not compared: another zlib may pack the same page differently, and
+# that is no reason to rewrite it. No timestamp or file name goes in the
+# gzip header, so a rebuild on the same zlib is byte-for-byte the same.
+#
+# Usage: python3 init_bot/build_pages.py [--check]
+
+import gzip
+import os
+import sys
+import zlib
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+NHS_LIB = os.path.join(os.path.dirname(HERE), "nhs_lib")
+
+
+def compress(data):
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def pages(folder=NHS_LIB):
+    return sorted(os.path.join(folder, name) for name in os.listdir(folder)
+                  if name.endswith(".html"))
+
+
+def unpacks_to(target, data):
+    """True if the .gz at target unpacks to data."""
+    try:
+        with open(target, "rb") as f:
+            return gzip.decompress(f.read()) == data
+    except (OSError, EOFError, zlib.error):
+        return False
+
+
+def build(check=False):
+    """Write every stale page's .gz, or with check just list them."""
+    stale = []
+    for page in pages():
+        with open(page, "rb") as f:
+            data = f.read()
+        target = page + ".gz"
+        if unpacks_to(target, data):
+            continue
+        stale.append(target)
+        if not check:
+            packed = compress(data)
+            with open(target, "wb") as f:
+                f.write(packed)
+            print("   - %s (%d bytes)" % (os.path.relpath(target), len(packed)))
+    return stale
+
+
+if __name__ == "__main__":
+    check = "--check" in sys.argv[1:]
+    stale = build(check)
+    if check and stale:
+        print("Stale: " + ", ".join(os.path.relpath(p) for p in stale))
+        sys.exit(1)
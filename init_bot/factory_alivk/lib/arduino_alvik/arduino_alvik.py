@@ -1,6 +1,7 @@
 import sys
 import gc
 import struct
+import micropython
 from machine import I2C
 import _thread
 from time import sleep_ms, ticks_ms, ticks_diff
@@ -17,8 +18,6 @@ from .constants import *
 class ArduinoAlvik:
     _update_thread_running = False
     _update_thread_id = None
-    _touch_events_thread_running = False
-    _touch_events_thread_id = None
 
     def __new__(cls):
         if not hasattr(cls, '_instance'):
@@ -70,6 +69,7 @@ class ArduinoAlvik:
         self._waiting_ack = None
         self._version = [None, None, None]
         self._touch_events = _ArduinoAlvikTouchEvents()
+        self._dispatch_touch_events = self._touch_events.dispatch
 
     @staticmethod
     def is_on() -> bool:
@@ -181,9 +181,6 @@ class ArduinoAlvik:
             self._idle(1000)
         self._begin_update_thread()
         sleep_ms(100)
-        if self._touch_events.has_callbacks():
-            print('Starting touch events')
-            self._start_touch_events_thread()
         self._reset_hw()
         self._flush_uart()
         self._snake_robot(1000)
@@ -312,9 +309,6 @@ class ArduinoAlvik:
         # stop the update thread
         self._stop_update_thread()
 
-        # stop touch events thread
-        self._stop_touch_events_thread()
-
         # delete _instance
         del self.__class__._instance
         gc.collect()
@@ -601,8 +595,14 @@ class ArduinoAlvik:
             # distance sensor
             _, self._left_tof, self._center_tof, self._right_tof = self._packeter.unpacketC3I()
         elif code == ord('t'):
-            # touch input
+            # touch input: pads that went down are counted as the packet arrives,
+            # and their callbacks run on the main thread
             _, self._touch_byte = self._packeter.unpacketC1B()
+            if self._touch_events.update_touch_state(self._touch_byte) and self._touch_events.has_callbacks():
+                try:
+                    micropython.schedule(self._dispatch_touch_events, None)
+                except RuntimeError:
+                    pass    # schedule queue full: the edges wait in ours for the next one
         elif code == ord('b'):
             # behaviour
             _, self._behaviour = self._packeter.unpacketC1B()
@@ -656,6 +656,15 @@ class ArduinoAlvik:
         """
         return (self._touch_byte & 0xFF) if self._touch_byte is not None else 0x00
 
+    def get_touch_presses(self, pad: str = 'any') -> int:
+        """
+        Returns how many times a touch pad has been pressed, counted as each touch packet arrives.
+        A press shows up here however short it was and however seldom this is called
+        :param pad: 'any', 'ok', 'cancel', 'center', 'up', 'left', 'down' or 'right'
+        :return: number of presses since begin
+        """
+        return self._touch_events.presses(pad)
+
     def get_touch_any(self) -> bool:
         """
         Returns true if any button is pressed
@@ -1039,36 +1048,6 @@ class ArduinoAlvik:
         """
         self._touch_events.register_callback('on_right_pressed', callback, args)
 
-    def _start_touch_events_thread(self) -> None:
-        """
-        Starts the touch events thread
-        :return:
-        """
-        if not self.__class__._touch_events_thread_running:
-            self.__class__._touch_events_thread_running = True
-            self.__class__._touch_events_thread_id = _thread.start_new_thread(self._update_touch_events, (50,))
-
-    def _update_touch_events(self, delay_: int = 100):
-        """
-        Updates the touch state so that touch events can be generated
-        :param delay_:
-        :return:
-        """
-        while True:
-            if self.is_on() and self._touch_byte is not None:
-                self._touch_events.update_touch_state(self._touch_byte)
-            if not ArduinoAlvik._touch_events_thread_running:
-                break
-            sleep_ms(delay_)
-
-    @classmethod
-    def _stop_touch_events_thread(cls):
-        """
-        Stops the touch events thread
-        :return:
-        """
-        cls._touch_events_thread_running = False
-
 
 class _ArduinoAlvikWheel:
 
@@ -1229,109 +1208,71 @@ class _ArduinoAlvikTouchEvents(_ArduinoAlvikEvents):
                         'on_right_pressed', 'on_up_pressed',
                         'on_down_pressed']
 
+    # event -> its bit in the touch byte, in the order callbacks run
+    _event_bits = (('on_ok_pressed', 0b00000010), ('on_cancel_pressed', 0b00000100),
+                   ('on_center_pressed', 0b00001000), ('on_up_pressed', 0b00010000),
+                   ('on_left_pressed', 0b00100000), ('on_down_pressed', 0b01000000),
+                   ('on_right_pressed', 0b10000000))
+
+    pads = ('any', 'ok', 'cancel', 'center', 'up', 'left', 'down', 'right')
+
     def __init__(self):
         self._current_touch_state = 0
+        self._presses = [0] * 8         # presses counted per bit
+        # Edges waiting for their callbacks. Only update_touch_state moves
+        # _head and only dispatch moves _tail, so it needs no lock
+        self._queue = bytearray(16)
+        self._head = 0
+        self._tail = 0
         super().__init__()
 
-    @staticmethod
-    def _is_ok_pressed(current_state, new_state) -> bool:
+    def update_touch_state(self, touch_state: int) -> int:
         """
-        True if OK was pressed
-        :param current_state:
-        :param new_state:
-        :return:
-        """
-        return not bool(current_state & 0b00000010) and bool(new_state & 0b00000010)
-
-    @staticmethod
-    def _is_cancel_pressed(current_state, new_state) -> bool:
-        """
-        True if CANCEL was pressed
-        :param current_state:
-        :param new_state:
-        :return:
-        """
-        return not bool(current_state & 0b00000100) and bool(new_state & 0b00000100)
-
-    @staticmethod
-    def _is_center_pressed(current_state, new_state) -> bool:
-        """
-        True if CENTER was pressed
-        :param current_state:
-        :param new_state:
-        :return:
-        """
-        return not bool(current_state & 0b00001000) and bool(new_state & 0b00001000)
-
-    @staticmethod
-    def _is_up_pressed(current_state, new_state) -> bool:
-        """
-        True if UP was pressed
-        :param current_state:
-        :param new_state:
-        :return:
+        Updates the internal touch state, counts the pads that went down and queues them for callbacks
+        :param touch_state:
+        :return: bits that went from released to touched
         """
-        return not bool(current_state & 0b00010000) and bool(new_state & 0b00010000)
+        touch_state = touch_state & 0xFF
+        pressed = (self._current_touch_state ^ touch_state) & touch_state
+        self._current_touch_state = touch_state
+        if not pressed:
+            return 0
 
-    @staticmethod
-    def _is_left_pressed(current_state, new_state) -> bool:
-        """
-        True if LEFT was pressed
-        :param current_state:
-        :param new_state:
-        :return:
-        """
-        return not bool(current_state & 0b00100000) and bool(new_state & 0b00100000)
+        bit = 0
+        mask = pressed
+        while mask:
+            if mask & 1:
+                self._presses[bit] += 1
+            mask >>= 1
+            bit += 1
 
-    @staticmethod
-    def _is_down_pressed(current_state, new_state) -> bool:
-        """
-        True if DOWN was pressed
-        :param current_state:
-        :param new_state:
-        :return:
-        """
-        return not bool(current_state & 0b01000000) and bool(new_state & 0b01000000)
+        if self._callbacks:
+            head = (self._head + 1) % len(self._queue)
+            if head != self._tail:      # full: the oldest waiting are kept
+                self._queue[self._head] = pressed
+                self._head = head
+        return pressed
 
-    @staticmethod
-    def _is_right_pressed(current_state, new_state) -> bool:
+    def presses(self, pad: str) -> int:
         """
-        True if RIGHT was pressed
-        :param current_state:
-        :param new_state:
+        Number of presses counted for a pad
+        :param pad: one of pads
         :return:
         """
-        return not bool(current_state & 0b10000000) and bool(new_state & 0b10000000)
+        return self._presses[self.__class__.pads.index(pad)]
 
-    def update_touch_state(self, touch_state: int):
+    def dispatch(self, _=None):
         """
-        Updates the internal touch state and executes any possible callback
-        :param touch_state:
+        Executes the callbacks of every queued edge, oldest first
+        :param _: unused, for micropython.schedule
         :return:
         """
-
-        if self._is_ok_pressed(self._current_touch_state, touch_state):
-            self.execute_callback('on_ok_pressed')
-
-        if self._is_cancel_pressed(self._current_touch_state, touch_state):
-            self.execute_callback('on_cancel_pressed')
-
-        if self._is_center_pressed(self._current_touch_state, touch_state):
-            self.execute_callback('on_center_pressed')
-
-        if self._is_up_pressed(self._current_touch_state, touch_state):
-            self.execute_callback('on_up_pressed')
-
-        if self._is_left_pressed(self._current_touch_state, touch_state):
-            self.execute_callback('on_left_pressed')
-
-        if self._is_down_pressed(self._current_touch_state, touch_state):
-            self.execute_callback('on_down_pressed')
-
-        if self._is_right_pressed(self._current_touch_state, touch_state):
-            self.execute_callback('on_right_pressed')
-
-        self._current_touch_state = touch_state
+        while self._tail != self._head:
+            pressed = self._queue[self._tail]
+            self._tail = (self._tail + 1) % len(self._queue)
+            for event_name, bit in self.__class__._event_bits:
+                if pressed & bit:
+                    self.execute_callback(event_name)
 
     def register_callback(self, event_name: str, callback: callable, args: tuple = None):
         if event_name not in self.__class__.available_events:
@@ -1341,10 +1282,12 @@ class _ArduinoAlvikTouchEvents(_ArduinoAlvikEvents):
 
 # UPDATE FIRMWARE METHOD #
 
-def update_firmware(file_path: str):
+def update_firmware(file_path: str, differential: bool = False):
     """
 
     :param file_path: path of your FW bin
+    :param differential: if True, erase, write and verify only the pages that differ from what is flashed,
+                         found from the record of the last update or by reading the flash back
     :return:
     """
 
@@ -1353,9 +1296,16 @@ def update_firmware(file_path: str):
         CHECK_STM32,
         STM32_endCommunication,
         STM32_startCommunication,
+        STM32_ACK,
         STM32_NACK,
+        STM32_MANIFEST,
+        STM32_changedPages,
         STM32_eraseMEM,
-        STM32_writeMEM, )
+        STM32_forgetManifest,
+        STM32_imagePages,
+        STM32_writeManifest,
+        STM32_writeMEM,
+        STM32_writePages, )
 
     if CHECK_STM32.value() is not 1:
         print("Turn on your Alvik to continue...")
@@ -1369,11 +1319,34 @@ def update_firmware(file_path: str):
 
     print('\nSTM32 FOUND')
 
+    if differential:
+        print('\nCOMPARING MEM')
+        pages = STM32_changedPages(file_path, STM32_MANIFEST)
+        total = STM32_imagePages(file_path)
+        print(f"\n{len(pages)} OF {total} PAGES CHANGED")
+        # A page written alone is erased alone and read back to verify,
+        # about twice what it costs in a full update
+        if len(pages) * 2 <= total:
+            print("\nWRITING CHANGED PAGES")
+            if pages:
+                STM32_forgetManifest()
+            if STM32_writePages(file_path, pages):
+                STM32_writeManifest(file_path)
+                print("\nDONE")
+                print("\nLower Boot0 and reset STM32")
+                STM32_endCommunication()
+                return
+            print('\nDIFFERENTIAL UPDATE FAILED, WRITING ALL')
+
     print('\nERASING MEM')
-    STM32_eraseMEM(0xFFFF)
+    STM32_forgetManifest()
+    if STM32_eraseMEM(STM32_imagePages(file_path)) != STM32_ACK:
+        print('\nPAGE ERASE REFUSED, ERASING ALL')
+        STM32_eraseMEM(0xFFFF)
 
     print("\nWRITING MEM")
-    STM32_writeMEM(file_path)
+    if STM32_writeMEM(file_path):
+        STM32_writeManifest(file_path)
     print("\nDONE")
     print("\nLower Boot0 and reset STM32")
 
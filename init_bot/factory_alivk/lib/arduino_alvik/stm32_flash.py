@@ -1,6 +1,7 @@
 import os
 import sys
-from time import sleep_ms
+from hashlib import sha256
+from time import sleep_ms, ticks_ms, ticks_diff
 from machine import UART, Pin
 
 A6 = 13                                         # ESP32 pin13 -> nano A6/D23
@@ -21,6 +22,18 @@ STM32_ERASE = b'\x44'   # 0x44 is Extended Erase for bootloader v3.0 and higher.
 
 STM32_ADDRESS = bytes.fromhex('08000000')  # [b'\x08',b'\x00',b'\x00',b'\x00']
 
+# Flash erase page, for erasing only what an image covers. 2 KB on the
+# STM32L4; a part with other page or sector sizes needs this changed, and
+# update_firmware falls back to mass erase if the bootloader refuses.
+FLASH_PAGE_SIZE = 2048
+
+# What update_firmware last flashed, one line of hashes per erase page, so a
+# differential update need not read the whole flash back to compare. The one
+# piece of per-robot state allowed on the filesystem (REFERENCE.md), and
+# initialize_robot.sh leaves it alone: it is checked against the flash
+# before it is trusted, so losing it only costs a read-back.
+STM32_MANIFEST = '/stm32_flash.pages'
+
 # NANO ESP32 SETTINGS
 _D2 = 5     # ESP32 pin5 -> nano D2
 _D3 = 6     # ESP32 pin6 -> nano D3
@@ -35,12 +48,18 @@ _BAUDRATE = 115200
 _BITS = 8
 _PARITY = 0
 _STOP = 1
+_TIMEOUT_MS = 100       # longest a single read waits for its first byte
+_PAGE_TIMEOUT_MS = 1000
 
 readAddress = bytearray(STM32_ADDRESS)
 writeAddress = bytearray(STM32_ADDRESS)
 
 uart = UART(_UART_ID, baudrate=_BAUDRATE, bits=_BITS, parity=_PARITY, stop=_STOP, tx=_TX_PIN,
-            rx=_RX_PIN)  # parity 0 equals to Even, 1 to Odd
+            rx=_RX_PIN, timeout=_TIMEOUT_MS)  # parity 0 equals to Even, 1 to Odd
+
+# One write page as it goes down the wire: length, 256 bytes, checksum
+_page_frame = bytearray(258)
+_page_frame[0] = 0xFF
 
 
 def STM32_startCommunication() -> bytes:
@@ -69,12 +88,12 @@ def _STM32_waitForAnswer() -> bytes:
     :return: returns ACK or NACK
     """
 
+    # read() itself waits up to _TIMEOUT_MS for a byte, so the answer is
+    # seen as soon as it arrives rather than at the next 10 ms poll
     while True:
         res = uart.read(1)
         if res == STM32_ACK or res == STM32_NACK:
             break
-        else:
-            sleep_ms(10)
 
     return res
 
@@ -105,9 +124,7 @@ def STM32_sendCommand(cmd: bytes):
     :param cmd: the command byte
     :return:
     """
-    _cmd = bytes([cmd[0] ^ 0xFF])
-    uart.write(cmd)
-    uart.write(_cmd)
+    uart.write(bytes((cmd[0], cmd[0] ^ 0xFF)))
 
 
 def STM32_readResponse() -> [bytearray, bytes]:
@@ -210,12 +227,29 @@ def _STM32_sendAddress(address: bytes) -> bytes:
     assert len(address) == 4
 
     checksum = address[0] ^ address[1] ^ address[2] ^ address[3]
-    uart.write(address)
-    uart.write(bytes([checksum]))
+    uart.write(bytes(address) + bytes([checksum]))
 
     return _STM32_waitForAnswer()
 
 
+def _checksum(data, start: int = 0) -> int:
+    """
+    XOR of start and every byte of data, as AN3155 checksums are. The bytes
+    are folded as one long integer, halving it each time, rather than
+    XORed one at a time in a Python loop
+    :param data: bytes to check
+    :param start: value to XOR in as well, e.g. the length byte
+    :return: the checksum byte
+    """
+    n = len(data)
+    x = int.from_bytes(data, 'big')
+    while n > 1:
+        half = n // 2
+        x = (x >> (8 * half)) ^ (x & ((1 << (8 * half)) - 1))
+        n = n - half
+    return (x ^ start) & 0xFF
+
+
 def _incrementAddress(address: bytearray):
     """
     Increments address by one page (256 bytes)
@@ -223,17 +257,18 @@ def _incrementAddress(address: bytearray):
     :return:
     """
 
-    address[2] = address[2] + 1
+    address[2] = (address[2] + 1) & 0xFF
     if address[2] == 0:
-        address[1] = address[1] + 1
+        address[1] = (address[1] + 1) & 0xFF
         if address[1] == 0:
-            address[0] = address[0] + 1
+            address[0] = (address[0] + 1) & 0xFF
 
 
-def _STM32_readPage() -> bytearray:
+def _STM32_readPage(timeout_ms: int = _PAGE_TIMEOUT_MS) -> bytearray:
     """
     Reads a 256 bytes data page from STM32. Returns a 256 bytearray. Blocking
-    :return: page bytearray
+    :param timeout_ms: longest to wait for the whole page
+    :return: page bytearray, empty if it did not all arrive in time
     """
 
     STM32_sendCommand(b'\xFF')
@@ -241,14 +276,17 @@ def _STM32_readPage() -> bytearray:
     if res != STM32_ACK:
         print("READ PAGE: Cannot read STM32")
         return bytearray(0)
-    out = bytearray(0)
-    i = 0
-    while i < 256:
-        b = uart.read(1)
-        if b is None:
-            continue
-        out.append(b[0])
-        i = i+1
+    out = bytearray(256)
+    view = memoryview(out)
+    got = 0
+    start = ticks_ms()
+    while got < 256:
+        n = uart.readinto(view[got:], 256 - got)
+        if n:
+            got = got + n
+        elif ticks_diff(ticks_ms(), start) > timeout_ms:
+            print("READ PAGE: Timeout")
+            return bytearray(0)
     return out
 
 
@@ -261,14 +299,11 @@ def _STM32_flashPage(data: bytearray) -> bytes:
 
     assert len(data) == 256
 
-    uart.write(b'\xff')     # page length
-    checksum = 0xff         # starting checksum = page length
-
-    for d in data:
-        uart.write(bytes([d]))
-        checksum = checksum ^ d
-
-    uart.write(bytes([checksum]))
+    # Length, data and checksum in one write; the checksum starts from
+    # the length byte
+    _page_frame[1:257] = data
+    _page_frame[257] = _checksum(data, 0xff)
+    uart.write(_page_frame)
 
     return _STM32_waitForAnswer()
 
@@ -296,104 +331,323 @@ def STM32_readMEM(pages: int):
         _incrementAddress(readAddress)
 
 
-def STM32_writeMEM(file_path: str):
+def STM32_imagePages(file_path: str) -> int:
+    """
+    How many FLASH_PAGE_SIZE erase pages, from the start of flash, an image covers
+    :param file_path: path of the FW bin
+    :return: number of erase pages
+    """
+    file_size = os.stat(file_path)[-4]
+    return (file_size + FLASH_PAGE_SIZE - 1) // FLASH_PAGE_SIZE
+
+
+def STM32_writeMEM(file_path: str) -> bool:
 
     with open(file_path, 'rb') as f:
         print(f"Flashing {file_path}\n")
         file_size = os.stat(file_path)[-4]
         file_pages = int(file_size / 256) + (1 if file_size % 256 != 0 else 0)
+        data = bytearray(256)
+        blank = bytes([255]*256)
         i = 1
         while True:
-            data = bytearray(f.read(256))
-            read_bytes = len(data)
-            if read_bytes == 0:
+            read_bytes = f.readinto(data)
+            if not read_bytes:
                 break
-            data.extend(bytearray([255]*(256-read_bytes)))  # 0xFF padding
+            if read_bytes < 256:
+                data[read_bytes:] = blank[read_bytes:]  # 0xFF padding
+
+            if data == blank:
+                # Erased flash already reads 0xFF: nothing to write
+                sys.stdout.write('\r')
+                sys.stdout.write(f"{int((i/file_pages)*100)}%")
+                i = i + 1
+                _incrementAddress(writeAddress)
+                continue
 
             if _STM32_writeMode() != STM32_ACK:
                 print("COULD NOT ENTER WRITE MODE")
-                return
+                return False
 
             if _STM32_sendAddress(writeAddress) != STM32_ACK:
                 print("STM32 ERROR ON ADDRESS SENT")
-                return
+                return False
 
             if _STM32_flashPage(data) != STM32_ACK:
                 print(f"STM32 ERROR FLASHING PAGE: {writeAddress}")
-                return
+                return False
 
             sys.stdout.write('\r')
             sys.stdout.write(f"{int((i/file_pages)*100)}%")
             i = i + 1
             _incrementAddress(writeAddress)
 
+    return True
+
+
+def _flashAddress(offset: int) -> bytearray:
+    """
+    The 4-byte address of offset bytes into flash
+    :param offset: bytes from the start of flash
+    :return: address bytearray, MSB first
+    """
+    return bytearray((int.from_bytes(STM32_ADDRESS, 'big') + offset).to_bytes(4, 'big'))
+
+
+def STM32_readBlock(address: bytearray) -> bytearray:
+    """
+    Reads the 256 bytes at address. Blocking
+    :param address: 4-byte address, MSB first
+    :return: 256 bytearray, empty on any error
+    """
+    if _STM32_readMode() != STM32_ACK:
+        return bytearray(0)
+    if _STM32_sendAddress(address) != STM32_ACK:
+        return bytearray(0)
+    return _STM32_readPage()
+
+
+def _imagePage(f, page: int, data: bytearray):
+    """
+    Fills data with erase page `page` of the open image, 0xFF padded
+    :param f: image file, opened 'rb'
+    :param page: erase page number
+    :param data: FLASH_PAGE_SIZE bytearray to fill
+    :return:
+    """
+    f.seek(page * FLASH_PAGE_SIZE)
+    read_bytes = f.readinto(data) or 0
+    for i in range(read_bytes, FLASH_PAGE_SIZE):
+        data[i] = 0xFF
+
+
+def _hash(data) -> str:
+    return sha256(data).digest()[:8].hex()
+
 
-def _STM32_standardEraseMEM(pages: int, page_list: bytearray = None):
+def _pageHashes(file_path: str) -> list:
+    """
+    Hashes of every erase page of the image: (first 256 bytes, whole page)
+    :param file_path: path of the FW bin
+    :return: list of hex string pairs, one per erase page
+    """
+    hashes = []
+    data = bytearray(FLASH_PAGE_SIZE)
+    view = memoryview(data)
+    with open(file_path, 'rb') as f:
+        for page in range(STM32_imagePages(file_path)):
+            _imagePage(f, page, data)
+            hashes.append((_hash(view[:256]), _hash(data)))
+    return hashes
+
+
+def STM32_writeManifest(file_path: str, manifest_path: str = STM32_MANIFEST):
+    """
+    Records the image as what is now on the STM32
+    :param file_path: path of the FW bin just flashed
+    :param manifest_path: where to record it
+    :return:
+    """
+    try:
+        with open(manifest_path, 'w') as f:
+            for first, whole in _pageHashes(file_path):
+                f.write(f"{first} {whole}\n")
+    except OSError:
+        print("COULD NOT RECORD FLASHED PAGES")
+
+
+def STM32_forgetManifest(manifest_path: str = STM32_MANIFEST):
+    """
+    Drops the record, before the flash is changed under it
+    :param manifest_path: the record
+    :return:
+    """
+    try:
+        os.remove(manifest_path)
+    except OSError:
+        pass
+
+
+def _readManifest(manifest_path: str) -> list:
+    try:
+        with open(manifest_path) as f:
+            return [tuple(line.split()) for line in f if line.strip()]
+    except OSError:
+        return None
+
+
+def _manifestHolds(recorded: list, pages: int) -> bool:
+    """
+    Spot check of the record against the flash: the first 256 bytes of
+    every erase page the image covers. Anything flashed by another route
+    since shows up here, the vector table at the front of it first
+    :param recorded: the record, as from _readManifest
+    :param pages: erase pages to check
+    :return: True if every block read back matches the record
+    """
+    for page in range(min(pages, len(recorded))):
+        flash = STM32_readBlock(_flashAddress(page * FLASH_PAGE_SIZE))
+        if len(flash) != 256 or _hash(flash) != recorded[page][0]:
+            return False
+    return True
+
+
+def STM32_changedPages(file_path: str, manifest_path: str = None) -> list:
+    """
+    The erase pages of the image that differ from what is on the STM32.
+    With a record of the last update that passes a spot check, that is the
+    pages whose hashes changed. Without one, every page the image covers
+    is read back and compared; a page stops being read at its first 256
+    bytes that differ, since all of it is erased anyway
+    :param file_path: path of the FW bin
+    :param manifest_path: record written by STM32_writeManifest, or None
+    :return: list of erase page numbers that differ from the image
+    """
+    if manifest_path is not None:
+        recorded = _readManifest(manifest_path)
+        if recorded is not None:
+            image = _pageHashes(file_path)
+            if _manifestHolds(recorded, len(image)):
+                return [page for page in range(len(image))
+                        if page >= len(recorded) or recorded[page][1] != image[page][1]]
+            print("FLASH DIFFERS FROM THE RECORD, READING IT ALL")
+
+    changed = []
+    data = bytearray(FLASH_PAGE_SIZE)
+    view = memoryview(data)
+    pages = STM32_imagePages(file_path)
+    with open(file_path, 'rb') as f:
+        for page in range(pages):
+            _imagePage(f, page, data)
+            for block in range(0, FLASH_PAGE_SIZE, 256):
+                flash = STM32_readBlock(_flashAddress(page * FLASH_PAGE_SIZE + block))
+                if flash != view[block:block + 256]:
+                    changed.append(page)
+                    break
+            sys.stdout.write('\r')
+            sys.stdout.write(f"{int(((page + 1)/pages)*100)}%")
+    return changed
+
+
+def STM32_writePages(file_path: str, page_list: list) -> bool:
+    """
+    Erases, writes and verifies only the listed erase pages of the image
+    :param file_path: path of the FW bin
+    :param page_list: erase page numbers, as from STM32_changedPages
+    :return: True if every page written reads back as the image
+    """
+    if not page_list:
+        return True
+    if STM32_eraseMEM(len(page_list), page_list) != STM32_ACK:
+        return False
+
+    data = bytearray(FLASH_PAGE_SIZE)
+    view = memoryview(data)
+    blank = bytes([255]*256)
+    with open(file_path, 'rb') as f:
+        for n, page in enumerate(page_list):
+            _imagePage(f, page, data)
+            for block in range(0, FLASH_PAGE_SIZE, 256):
+                chunk = view[block:block + 256]
+                if chunk == blank:
+                    continue
+                address = _flashAddress(page * FLASH_PAGE_SIZE + block)
+                if _STM32_writeMode() != STM32_ACK \
+                        or _STM32_sendAddress(address) != STM32_ACK \
+                        or _STM32_flashPage(chunk) != STM32_ACK:
+                    print(f"STM32 ERROR FLASHING PAGE: {page}")
+                    return False
+            # Verify pass: the whole erase page, blank blocks included
+            for block in range(0, FLASH_PAGE_SIZE, 256):
+                flash = STM32_readBlock(_flashAddress(page * FLASH_PAGE_SIZE + block))
+                if flash != view[block:block + 256]:
+                    print(f"STM32 VERIFY FAILED ON PAGE: {page}")
+                    return False
+            sys.stdout.write('\r')
+            sys.stdout.write(f"{int(((n + 1)/len(page_list))*100)}%")
+    return True
+
+
+def _STM32_standardEraseMEM(pages: int, page_list: bytearray = None) -> bytes:
     """
     Standard Erase (0x43) flash mem pages according to AN3155
     :param pages: number of pages to be erased
-    :param page_list: page codes to be erased
-    :return:
+    :param page_list: page codes to be erased, pages 0 to pages-1 if None
+    :return: returns ACK or NACK
     """
 
     if _STM32_eraseMode() == STM32_NACK:
         print("COULD NOT ENTER ERASE MODE")
-        return
+        return STM32_NACK
 
     if pages == 0xFF:
         # Mass erase
-        uart.write(b'\xFF')
-        uart.write(b'\x00')
+        uart.write(b'\xFF\x00')
     else:
-        print("Not yet implemented erase")
+        if page_list is None:
+            page_list = range(pages)
+        frame = bytearray([pages - 1])
+        frame.extend(bytes(page_list))
+        frame.append(_checksum(frame))
+        uart.write(frame)
 
-    if _STM32_waitForAnswer() != STM32_ACK:
+    res = _STM32_waitForAnswer()
+    if res != STM32_ACK:
         print("ERASE OPERATION ABORTED")
+    return res
 
 
-def _STM32_extendedEraseMEM(pages: int, page_list: bytearray = None):
+def _STM32_extendedEraseMEM(pages: int, page_list: bytearray = None) -> bytes:
     """
     Extended Erase (0x44) flash mem pages according to AN3155
     :param pages: number of pages to be erased
-    :param page_list: page codes to be erased
-    :return:
+    :param page_list: page codes to be erased, pages 0 to pages-1 if None
+    :return: returns ACK or NACK
     """
 
     if _STM32_eraseMode() == STM32_NACK:
         print("COULD NOT ENTER ERASE MODE")
-        return
+        return STM32_NACK
 
     if pages == 0xFFFF:
         # Mass erase
-        uart.write(b'\xFF')
-        uart.write(b'\xFF')
-        uart.write(b'\x00')
+        uart.write(b'\xFF\xFF\x00')
     elif pages == 0xFFFE:
         # Bank1 erase
-        uart.write(b'\xFF')
-        uart.write(b'\xFE')
-        uart.write(b'\x01')
+        uart.write(b'\xFF\xFE\x01')
     elif pages == 0xFFFD:
         # Bank2 erase
-        uart.write(b'\xFF')
-        uart.write(b'\xFD')
-        uart.write(b'\x02')
+        uart.write(b'\xFF\xFD\x02')
     else:
-        print("Not yet implemented erase")
+        # N-1 then each page code, two bytes MSB first, then the checksum
+        if page_list is None:
+            page_list = range(pages)
+        frame = bytearray(2 * pages + 2)
+        frame[0] = (pages - 1) >> 8
+        frame[1] = (pages - 1) & 0xFF
+        i = 2
+        for page in page_list:
+            frame[i] = page >> 8
+            frame[i + 1] = page & 0xFF
+            i = i + 2
+        frame.append(_checksum(frame))
+        uart.write(frame)
 
-    if _STM32_waitForAnswer() != STM32_ACK:
+    res = _STM32_waitForAnswer()
+    if res != STM32_ACK:
         print("ERASE OPERATION ABORTED")
+    return res
 
 
 def STM32_eraseMEM(pages: int, page_list: bytearray = None):
     """
     Erases flash mem pages according to AN3155
-    :param pages: number of pages to be erased
-    :param page_list: page codes to be erased
-    :return:
+    :param pages: number of pages to be erased, or a mass/bank erase code
+    :param page_list: page codes to be erased, pages 0 to pages-1 if None
+    :return: returns ACK or NACK
     """
 
     if STM32_ERASE == b'\x43':
-        _STM32_standardEraseMEM(pages, page_list)
+        return _STM32_standardEraseMEM(pages, page_list)
     elif STM32_ERASE == b'\x44':
-        _STM32_extendedEraseMEM(pages, page_list)
+        return _STM32_extendedEraseMEM(pages, page_list)
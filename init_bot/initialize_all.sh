@@ -1,7 +1,9 @@
 #!/bin/bash
+# v4 - Passes -m (ship /lib precompiled) on to each robot. Compiled once:
+#      every robot after the first finds the build up to date.
 # v3 - Added support for passing the --clean-workspace flag to individual robots.
 # Developed with the assistance of Google Gemini
-# --- Version: V03 ---
+# --- Version: V04 ---
 # ==============================================================================
 # Initialize All Robots Script
 # This script finds all connected Alvik robots and runs the
@@ -11,6 +13,7 @@ set -e # Exit immediately if a command exits with a non-zero status.
 # --- SCRIPT LOGIC ---
 SOURCE_DIR=""
 CLEAN_WORKSPACE_FLAG=""
+MPY_FLAG=""
 # --- Argument Parsing ---
 while [[ $# -gt 0 ]]; do
 key="$1"
@@ -23,13 +26,17 @@ shift 2
 CLEAN_WORKSPACE_FLAG="-c"
 shift
 ;;
+-m|--mpy)
+MPY_FLAG="-m"
+shift
+;;
 *)
 echo "Unknown option: $1"
 exit 1
 ;;
 esac
 done
-echo "Running initialize_all.sh - v3"
+echo "Running initialize_all.sh - v4"
 # --- Validate Arguments ---
 if [ -z "$SOURCE_DIR" ]; then
 echo "❌ ERROR: Source directory not specified. Use -d <path>."
@@ -54,8 +61,8 @@ for port in $PORT_LIST; do
 echo "------------------------------------------"
 echo "🚀 Initializing robot on port: $port"
 echo "=========================================="
-# Pass the directory, the specific port, and the optional clean flag
-./initialize_robot.sh -d "$SOURCE_DIR" -p "$port" $CLEAN_WORKSPACE_FLAG
+# Pass the directory, the specific port, and the optional flags
+./initialize_robot.sh -d "$SOURCE_DIR" -p "$port" $CLEAN_WORKSPACE_FLAG $MPY_FLAG
 echo "=========================================="
 echo "✅ Finished initializing robot on port: $port"
 echo ""
@@ -1,4 +1,19 @@
 #!/bin/bash
+# v34 - /stm32_flash.pages is left alone. update_firmware records there
+#       what it last flashed on the motor board, and every sync deleted
+#       it as extraneous, so the next differential update read the whole
+#       flash back. See REFERENCE.md for why it is allowed.
+# v33 - -m compiles the lib being synced, SOURCE_DIR/lib, into a build of
+#       its own. v32 always compiled nhs_lib, so -d factory_alivk -m
+#       replaced the factory library on the robot with nhs_lib.
+# v32 - -m ships /lib precompiled. build_mpy.py compiles nhs_lib to .mpy
+#       with mpy-cross (only what changed since the last build), and that
+#       tree goes up as /lib in place of the source. The robot no longer
+#       compiles the library on every boot. Without -m, any .mpy left on
+#       the robot from an earlier -m sync is removed as extraneous.
+# v31 - Web pages ship gzipped. build_pages.py refreshes every
+#       nhs_lib/*.html.gz before the copy, so the robot never serves a
+#       page older than its source.
 # v30 - Never ship the laptop's droppings. __pycache__, .DS_Store and
 #       stray .pyc files are stripped from the staging copy before upload,
 #       and deleted from the robot if they are already there. The delete
@@ -21,6 +36,7 @@ set -e
 PORT=""
 SOURCE_DIR=""
 CLEAN_WORKSPACE=false
+COMPILED=false
 ROBOTIGNORE_FILENAME=".robotignore"
 SAFETY_FILE_NAME="STORE_FILES_HERE_FOR_SAFETY.md"
 
@@ -32,16 +48,28 @@ while [[ $# -gt 0 ]]; do
         -p|--port) PORT="$2"; shift 2 ;;
         # -c wipes the student's own files: /workspace and main.py.
         -c|--clean-workspace) CLEAN_WORKSPACE=true; shift ;;
+        # -m ships /lib as .mpy, compiled on this machine by build_mpy.py.
+        -m|--mpy) COMPILED=true; shift ;;
         *) echo "Unknown option: $1"; exit 1 ;;
     esac
 done
 
-echo "Running initialize_robot.sh - v29 (main.py is the student's)"
+echo "Running initialize_robot.sh - v33 (-m compiles the synced lib)"
 
 # --- VALIDATION ---
 if [ -z "$SOURCE_DIR" ]; then echo "❌ ERROR: Source directory not specified. Use -d <path>."; exit 1; fi
 if [ ! -d "$SOURCE_DIR" ]; then echo "❌ ERROR: Source '$SOURCE_DIR' is not a valid directory."; exit 1; fi
 
+# --- PRECOMPILE /lib ---
+# Before touching the robot, so a missing or failing mpy-cross stops the
+# sync here rather than halfway through it.
+if [ "$COMPILED" = true ]; then
+    if [ ! -d "${SOURCE_DIR}/lib" ]; then echo "❌ ERROR: -m, but '$SOURCE_DIR' has no lib to compile."; exit 1; fi
+    echo "⚙️  Compiling lib to .mpy..."
+    MPY_DIR=$(python3 "$(dirname "$0")/build_mpy.py" --where "${SOURCE_DIR}/lib")
+    python3 "$(dirname "$0")/build_mpy.py" "${SOURCE_DIR}/lib"
+fi
+
 # --- AUTO-DETECT PORT ---
 if [ -z "$PORT" ]; then
     echo "🔎 Auto-detecting Alvik..."
@@ -94,7 +122,8 @@ fi
 
 # --- BUILD WHITELIST ---
 # --- BUILD WHITELIST ---
-WHITELIST=("/workspace") 
+# /stm32_flash.pages: update_firmware's record of the motor board's flash
+WHITELIST=("/workspace" "/stm32_flash.pages")
 if [ -f "${SOURCE_DIR}/${ROBOTIGNORE_FILENAME}" ]; then
     echo "Found .robotignore. Building whitelist..."
     while IFS= read -r line; do
@@ -181,7 +210,13 @@ while IFS= read -r line; do
     if [ "$SKIP" = true ]; then continue; fi
 
     # 3. LOCAL EXISTENCE CHECK
+    # With -m, /lib on the robot mirrors the compiled tree, not the source:
+    # a lib/*.py there is stale source that would be imported ahead of
+    # its .mpy.
     LOCAL_PATH="${SOURCE_DIR}/${RPATH}"
+    if [ "$COMPILED" = true ] && [[ "$RPATH" == lib || "$RPATH" == lib/* ]]; then
+        LOCAL_PATH="${MPY_DIR}/${RPATH#lib}"
+    fi
     
     EXISTS_LOCALLY=false
     if [ "$TYPE" == "D" ]; then
@@ -205,6 +240,9 @@ echo "✅ Cleanup complete."
 echo "------------------------------------------"
 echo "📂 Uploading local files..."
 
+# Gzip the web pages first, so the copy below carries fresh ones.
+python3 "$(dirname "$0")/build_pages.py"
+
 # Create a temporary staging directory
 STAGING_DIR=$(mktemp -d)
 
@@ -222,6 +260,13 @@ if [ "$JUNK" -gt 0 ]; then
     echo "   - Skipping $JUNK cache or junk item(s)"
 fi
 
+# With -m, the compiled tree goes up as /lib instead of the source.
+if [ "$COMPILED" = true ]; then
+    rm -rf "${STAGING_DIR}/lib"
+    cp -r "${MPY_DIR}" "${STAGING_DIR}/lib"
+    echo "   - Shipping /lib precompiled"
+fi
+
 # Remove ignored items from the staging directory before upload
 for ignore in "${WHITELIST[@]}"; do
     # Skip /workspace as it's a remote-only system folder
@@ -1,9 +1,29 @@
 # Library: Alvik Web Controller
 # Features: Graphical UI (File Based), Bitmasking, Analog Triggers, WebSockets
 #
-# Version: V11.2
+# Version: V14.4
 # FIX: Buffer drain loop. Drains all stale WebSocket packets to eliminate queue latency.
 # FIX: Added performance instrumentation (packets dropped counter).
+# PERF: One preallocated receive buffer, filled with readinto() and parsed in
+#       place. Only the newest gamepad frame is unmasked and decoded; older
+#       ones are skipped over by their length alone. No select() per frame.
+# NEW: Optional 32-byte packet: the 28-byte state plus the phone's clock, so
+#      the robot can report latency. stats() counts packets, drops and lag.
+#      coalesce=False decodes every packet in order, the V11 behaviour.
+# NEW: V13 compact protocol. The robot says HELLO on connect; pages that
+#      hear it send 6-21 byte frames (int16 axes, a change mask, heartbeats
+#      while idle) and ask for an echo of their clock to pace themselves.
+#      28- and 32-byte packets are still accepted.
+# PERF: V14 serves the page through page_server: pre-gzipped, one bytes
+#       object, read and sent a chunk per update() so a phone loading it
+#       never stalls the loop. The page asks for the SSID at /ssid.
+# NEW: V14.1 keeps the raw button_mask alongside the buttons dict, and
+#      stats() reports the packet rate. V14.2 takes the port to listen on,
+#      for tests/controller_bench.py.
+# FIX: V14.3 skips a frame too big for the receive buffer, reading its
+#      payload away as it arrives, instead of dropping the phone.
+# NEW: V14.4 takes the page to serve, so WebGamepad can put its own page
+#      on this socket.
 
 import network
 import socket
@@ -12,6 +32,51 @@ import time
 import binascii
 import hashlib
 import struct
+from page_server import PageServer, load_page, request_path, response, NOT_FOUND
+
+# Every button the controller reports, in the order of the bits in the packet.
+BUTTON_NAMES = ('cross', 'circle', 'square', 'triangle', 'L1', 'R1', 'L2', 'R2',
+                'share', 'options', 'L3', 'R3', 'up', 'down', 'left', 'right', 'ps')
+
+# The gamepad packet: six floats and the button mask. controller.html V12.1
+# and later append the phone's clock in ms, masked to 30 bits so it wraps
+# where ticks_ms() does; older pages send the 28 bytes alone.
+GAMEPAD_FORMAT = '<ffffffI'
+GAMEPAD_LEN = 28
+STAMPED_LEN = 32
+
+# The compact frame, controller.html V13 and later, once the robot has sent
+# HELLO. One header byte -- the protocol version in the top nibble, the kind
+# of frame in the bottom -- then the change mask, the phone's clock as in the
+# 32-byte packet, and only the fields the mask names: each axis as an int16
+# (value * 32767), the buttons as 3 bytes.
+#   FULL       every field; what the deltas after it are relative to
+#   DELTA      the fields that changed since the frame before
+#   HEARTBEAT  no fields: still here, and the clock
+# 6 to 21 bytes long, so never mistaken for a 28- or 32-byte packet.
+PROTOCOL_VERSION = 2
+KIND_FULL = 0
+KIND_DELTA = 1
+KIND_HEARTBEAT = 2
+COMPACT_HEAD_LEN = 6
+COMPACT_MAX_LEN = 21
+AXIS_NAMES = ('left_x', 'left_y', 'right_x', 'right_y', 'L2', 'R2')
+AXIS_SCALE = 32767
+BUTTONS_BIT = 0x40
+ECHO_BIT = 0x80             # in the change mask: send my clock back
+
+# Robot to phone, unmasked binary frames. HELLO carries the protocol version
+# and goes out with the handshake; ECHO carries a compact frame's clock back
+# so the page can measure the round trip.
+HELLO = bytes((0x82, 1, PROTOCOL_VERSION))
+ECHO_HEAD = bytes((0x82, 4))
+
+# Room for about fifteen gamepad frames (34 bytes each on the wire). A phone
+# sends one per screen refresh, so this is several loops' worth.
+RX_BUFFER_SIZE = 512
+
+# errno for "nothing to read right now" on a non-blocking socket.
+EAGAIN = 11
 
 class Controller:
     # --- SINGLETON IMPLEMENTATION ---
@@ -23,7 +88,8 @@ class Controller:
             cls._instance._initialized = False 
         return cls._instance
 
-    def __init__(self, ssid="Alvik-Link", password="password", verbose=False, bot=None):
+    def __init__(self, ssid="Alvik-Link", password="password", verbose=False, bot=None,
+                 coalesce=True, port=80, page="controller.html"):
         if self._initialized:
             return
             
@@ -31,25 +97,8 @@ class Controller:
         self.password = password
         self.verbose = verbose
         self.bot = bot
-        
-        # --- STATE VARIABLES ---
-        self.left_x = 0.0
-        self.left_y = 0.0
-        self.right_x = 0.0
-        self.right_y = 0.0
-        self.L2 = 0.0
-        self.R2 = 0.0
-        
-        self.last_packet_time = time.ticks_ms()
-        self.connected = False
-        
-        self.buttons = {
-            'cross': False, 'circle': False, 'square': False, 'triangle': False,
-            'L1': False, 'R1': False, 'L2': False, 'R2': False,
-            'share': False, 'options': False, 'L3': False, 'R3': False,
-            'up': False, 'down': False, 'left': False, 'right': False,
-            'ps': False
-        }
+        self.coalesce = coalesce
+        self._init_state()
         
         # --- WIFI SETUP (AP MODE) ---
         self.ap = network.WLAN(network.AP_IF)
@@ -68,7 +117,7 @@ class Controller:
         # --- SOCKET SETUP ---
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.server_socket.bind(('', 80))
+        self.server_socket.bind(('', port))
         self.server_socket.listen(1)
         self.server_socket.setblocking(False)
 
@@ -76,26 +125,90 @@ class Controller:
 
         self._initialized = True
 
-        # --- HTML PAGE (SMART FILE LOAD) ---
-        self.html = ""
+        self._load_pages(page)
+
+    def _load_pages(self, page="controller.html"):
+        """Read the page, gzipped by init_bot/build_pages.py, into the one
+        response every phone is sent. The page sits next to this file in
+        /lib, or failing that in the current directory."""
         try:
-            base_path = __file__.rsplit('/', 1)[0] 
-            file_path = f"{base_path}/controller.html"
+            base_path = __file__.rsplit('/', 1)[0]
+            file_path = f"{base_path}/{page}"
         except:
-            file_path = "controller.html"
+            file_path = page
+
+        self._page = load_page(file_path) or load_page(page)
+        if self._page is None:
+            if self.bot and hasattr(self.bot, "log_info"): self.bot.log_info("Error: HTML missing!")
+            self._page = response(f"<h1>Error: {page} missing. Check /lib folder!</h1>",
+                                  "text/html")
+        self._ssid_reply = response(self.ssid)
+
+    def _init_state(self):
+        """Everything update() reads and writes, none of it hardware. Kept
+        apart from __init__ so the host tests can build a Controller with no
+        Wi-Fi and still run the real decoder."""
+        # --- STATE VARIABLES ---
+        self.left_x = 0.0
+        self.left_y = 0.0
+        self.right_x = 0.0
+        self.right_y = 0.0
+        self.L2 = 0.0
+        self.R2 = 0.0
 
-        try:
-            with open(file_path, 'r') as f:
-                self.html = f.read()
-                self.html = self.html.replace('{{ssid}}', self.ssid)
-        except OSError:
-            try:
-                with open('controller.html', 'r') as f:
-                    self.html = f.read()
-                    self.html = self.html.replace('{{ssid}}', self.ssid)
-            except OSError:
-                if self.bot and hasattr(self.bot, "log_info"): self.bot.log_info("Error: HTML missing!")
-                self.html = "<h1>Error: controller.html missing. Check /lib folder!</h1>"
+        self.last_packet_time = time.ticks_ms()
+        self.connected = False
+        self.ws_client = None
+
+        self.buttons = {name: False for name in BUTTON_NAMES}
+        self.button_mask = 0        # the same, one bit each, BUTTON_NAMES order
+
+        # --- RECEIVE BUFFERS (allocated once, reused every update) ---
+        self._rx = bytearray(RX_BUFFER_SIZE)
+        self._rx_view = memoryview(self._rx)
+        self._rx_len = 0
+        self._skip = 0              # bytes still to come of a frame too big to keep
+        self._state = bytearray(STAMPED_LEN)
+        self._readinto = None
+        self._deltas = []           # compact frames after the newest full one
+        self._synced = False        # holding the state deltas are relative to
+        self._echo = bytearray(ECHO_HEAD + bytes(4))
+        self._echo_due = False
+        self.pages = PageServer()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.packets = 0            # gamepad packets received
+        self.dropped = 0            # of those, skipped for a newer one
+        self.latency_ms = None      # the newest applied packet's
+        self._stats_since = time.ticks_ms()
+        self._latency_max = 0
+        self._latency_total = 0
+        self._latency_count = 0
+        # Phone and robot clocks are unrelated, so latency is measured from
+        # the fastest packet so far: its offset between the two clocks is
+        # as close to zero delay as this link gets.
+        self._min_offset = None
+
+    def stats(self):
+        """Packet counts, rate and latency since the last reset_stats().
+
+        Latency is time from the phone stamping a packet to the robot
+        applying it, minus the same for the fastest packet seen. It is the
+        delay the robot adds on top of the best the link has done, not the
+        absolute one-way time, which needs synchronised clocks. None until
+        a stamped packet arrives.
+        """
+        count = self._latency_count
+        elapsed = time.ticks_diff(time.ticks_ms(), self._stats_since)
+        return {
+            'packets': self.packets,
+            'dropped': self.dropped,
+            'rate_hz': self.packets * 1000 / elapsed if elapsed > 0 else 0.0,
+            'latency_ms': self.latency_ms,
+            'latency_avg_ms': self._latency_total / count if count else None,
+            'latency_max_ms': self._latency_max if count else None,
+        }
 
     def _reset_state(self):
         self.left_x, self.left_y = 0.0, 0.0
@@ -103,6 +216,8 @@ class Controller:
         self.L2, self.R2 = 0.0, 0.0
         for key in self.buttons:
             self.buttons[key] = False
+        self.button_mask = 0
+        self._synced = False
 
     def is_connected(self):
         elapsed = time.ticks_diff(time.ticks_ms(), self.last_packet_time)
@@ -116,40 +231,26 @@ class Controller:
             except:
                 pass
             self.ws_client = None
+        self._rx_len = 0
+        self._skip = 0
         if self.connected:
             self.connected = False
             self._reset_state()
             if self.bot and hasattr(self.bot, "log_info"): self.bot.log_info("WS Closed/Dropped")
 
-    def _read_exact(self, sock, n):
-        data = bytearray()
-        timeout_start = time.ticks_ms()
-        while len(data) < n:
-            if time.ticks_diff(time.ticks_ms(), timeout_start) > 200:
-                raise OSError("WS Read Timeout")
-            try:
-                r, _, _ = select.select([sock], [], [], 0.01)
-                if r:
-                    chunk = sock.recv(n - len(data))
-                    if not chunk:
-                        raise OSError("WS Socket Closed")
-                    data.extend(chunk)
-            except OSError as e:
-                if e.args[0] != 11:
-                    raise e
-        return bytes(data)
-
-    def _handle_http_req(self, req, cl):
-        req_line = req.decode().split('\r\n')[0]
+    def _handle_http_req(self, cl, req):
+        """Answer one complete request. Returns the response for the page
+        server to stream, or None once the socket has become the
+        WebSocket."""
+        path = request_path(req)
 
-        if req_line.startswith('GET / HTTP'):
-            cl.send('HTTP/1.1 200 OK\r\nContent-Type: text/html\r\nConnection: close\r\n\r\n')
-            cl.send(self.html)
-            cl.close()
+        if path == b'/':
             if self.bot and hasattr(self.bot, "log_info"): self.bot.log_info("Served UI")
-            return
-            
-        if req_line.startswith('GET /ws '):
+            return self._page
+        if path == b'/ssid':
+            return self._ssid_reply
+
+        if path == b'/ws':
             headers = req.decode().split('\r\n')
             key = None
             for h in headers:
@@ -167,116 +268,288 @@ class Controller:
                     "Connection: Upgrade\r\n"
                     f"Sec-WebSocket-Accept: {accept_key}\r\n\r\n"
                 )
-                cl.send(resp.encode())
-                cl.setblocking(False)
+                # Small enough for an empty send buffer, so the
+                # non-blocking socket takes it whole.
+                cl.send(resp.encode() + HELLO)
                 
                 if self.ws_client:
                     self._close_ws()
 
                 self.ws_client = cl
+                self._rx_len = 0
+                self._skip = 0
+                self._synced = False
+                # MicroPython sockets have readinto(); CPython's (the host
+                # tests) call it recv_into().
+                self._readinto = getattr(cl, 'readinto', None) or cl.recv_into
                 self.last_packet_time = time.ticks_ms()
                 self.connected = True
                 if self.bot and hasattr(self.bot, "log_info"): self.bot.log_info("WS Connected!")
-            else:
-                cl.close()
+                return None
+            return NOT_FOUND
+
+        return NOT_FOUND
+
+    def _fill_rx(self):
+        """Read whatever the socket has waiting into the receive buffer.
+        Returns True if it stopped because the buffer is full."""
+        while self._rx_len < RX_BUFFER_SIZE:
+            try:
+                n = self._readinto(self._rx_view[self._rx_len:])
+            except OSError as e:
+                if e.args and e.args[0] == EAGAIN:
+                    return False
+                raise
+            if n is None:               # MicroPython: nothing waiting
+                return False
+            if n == 0:
+                raise OSError("WS Socket Closed")
+            self._rx_len += n
+        return True
+
+    def _scan_frames(self):
+        """Walk every complete frame in the buffer without decoding any of
+        them. Returns (offset of the newest full-state payload or -1,
+        gamepad frames seen, close requested, bytes consumed), and leaves
+        the compact frames that came after that full state in _deltas, to
+        be applied in order on top of it. A partial frame at the end is
+        left for the next read; one too big to ever fit is read away."""
+        buf = self._rx
+        end = self._rx_len
+        pos = min(self._skip, end)
+        self._skip -= pos
+        newest = -1
+        frames = 0
+        deltas = self._deltas
+        del deltas[:]
+        while end - pos >= 2:
+            opcode = buf[pos] & 0x0f
+            masked = buf[pos + 1] & 0x80
+            length = buf[pos + 1] & 0x7f
+            head = pos + 2
+            if length == 126:
+                if end - head < 2:
+                    break
+                length = (buf[head] << 8) | buf[head + 1]
+                head += 2
+            elif length == 127:
+                if end - head < 8:
+                    break
+                length = struct.unpack_from('>Q', buf, head)[0]
+                head += 8
+            if masked:
+                head += 4
+            if head + length > end:
+                if head + length - pos > RX_BUFFER_SIZE:
+                    # Nothing the page sends is this big. Consume what is
+                    # here and discard the rest as it comes in.
+                    self._skip = head + length - end
+                    pos = end
+                break
+            if opcode == 8:
+                return newest, frames, True, pos
+            if opcode == 2 and masked:
+                if length == GAMEPAD_LEN or length == STAMPED_LEN:
+                    full = True
+                elif COMPACT_HEAD_LEN <= length <= COMPACT_MAX_LEN and \
+                        (buf[head] ^ buf[head - 4]) >> 4 == PROTOCOL_VERSION:
+                    full = (buf[head] ^ buf[head - 4]) & 0x0f == KIND_FULL
+                else:
+                    pos = head + length
+                    continue
+                frames += 1
+                if not self.coalesce:
+                    self._apply_state(head, length)
+                elif full:
+                    newest = head
+                    del deltas[:]
+                else:
+                    deltas.append(head)
+            pos = head + length
+        return newest, frames, False, pos
+
+    def _apply_state(self, offset, length):
+        """Unmask and decode one gamepad payload at offset."""
+        if length == GAMEPAD_LEN or length == STAMPED_LEN:
+            self._apply_packet(offset, length)
+        else:
+            self._apply_compact(offset, length)
+
+    def _apply_packet(self, offset, length):
+        """A 28- or 32-byte packet. The mask is the four bytes in front of
+        it; XORing it as a 32-bit word against each 32-bit word of the
+        payload is the byte-wise unmask, done seven times instead of
+        twenty-eight."""
+        m = struct.unpack_from('<I', self._rx, offset - 4)[0]
+        w = struct.unpack_from('<7I', self._rx, offset)
+        struct.pack_into('<7I', self._state, 0,
+                         w[0] ^ m, w[1] ^ m, w[2] ^ m, w[3] ^ m,
+                         w[4] ^ m, w[5] ^ m, w[6] ^ m)
+        lx, ly, rx, ry, l2, r2, btn_mask = struct.unpack_from(GAMEPAD_FORMAT, self._state)
+
+        self.left_x = lx
+        self.left_y = ly
+        self.right_x = rx
+        self.right_y = ry
+        self.L2 = l2
+        self.R2 = r2
+        self._set_buttons(btn_mask)
+        self._synced = True
+
+        sent = None
+        if length == STAMPED_LEN:
+            sent = struct.unpack_from('<I', self._rx, offset + GAMEPAD_LEN)[0] ^ m
+        self._mark_alive(sent)
+
+    def _apply_compact(self, offset, length):
+        """A compact frame: unmask it, then set only the fields its change
+        mask names. A delta that arrives without the full state it builds
+        on -- right after connecting, or after a timeout reset -- keeps the
+        link alive but is not applied; the page sends a full frame at least
+        once a second."""
+        rx = self._rx
+        st = self._state
+        for i in range(length):
+            st[i] = rx[offset + i] ^ rx[offset - 4 + (i & 3)]
+        changed = st[1]
+        needed = COMPACT_HEAD_LEN
+        if changed & BUTTONS_BIT:
+            needed += 3
+        bit = 1
+        while bit < BUTTONS_BIT:
+            if changed & bit:
+                needed += 2
+            bit <<= 1
+        if needed > length:
             return
-            
-        cl.close()
+
+        if st[0] & 0x0f == KIND_FULL:
+            self._synced = True
+        if self._synced:
+            pos = COMPACT_HEAD_LEN
+            bit = 1
+            for name in AXIS_NAMES:
+                if changed & bit:
+                    setattr(self, name, struct.unpack_from('<h', st, pos)[0] / AXIS_SCALE)
+                    pos += 2
+                bit <<= 1
+            if changed & BUTTONS_BIT:
+                self._set_buttons(st[pos] | (st[pos + 1] << 8) | (st[pos + 2] << 16))
+
+        if changed & ECHO_BIT:
+            self._echo[2:6] = st[2:6]
+            self._echo_due = True
+        self._mark_alive(struct.unpack_from('<I', st, 2)[0])
+
+    def _set_buttons(self, btn_mask):
+        self.button_mask = btn_mask
+        bit = 1
+        for name in BUTTON_NAMES:
+            self.buttons[name] = bool(btn_mask & bit)
+            bit <<= 1
+
+    def _mark_alive(self, sent):
+        """A packet was applied; sent is the phone's clock on it, if any."""
+        now = time.ticks_ms()
+        self.last_packet_time = now
+        self.connected = True
+        if sent is not None:
+            self._record_latency(time.ticks_diff(now, sent))
+
+    def _record_latency(self, offset):
+        if self._min_offset is None or offset < self._min_offset:
+            self._min_offset = offset
+        latency = offset - self._min_offset
+        self.latency_ms = latency
+        self._latency_total += latency
+        self._latency_count += 1
+        if latency > self._latency_max:
+            self._latency_max = latency
+
+    def _frame_len(self, offset):
+        """Payload length of the frame whose payload starts at offset. Only
+        ever asked of a gamepad frame, which always has a 7-bit length."""
+        return self._rx[offset - 5] & 0x7f
+
+    def _keep_partial(self, consumed):
+        """Move the unparsed tail of the buffer to the front."""
+        remaining = self._rx_len - consumed
+        if consumed and remaining:
+            self._rx[0:remaining] = self._rx[consumed:self._rx_len]
+        self._rx_len = remaining
 
     def update(self):
         if not self.is_connected():
             self._reset_state()
 
+        self._poll_ws()
+        self._accept()
+
+    def _poll_ws(self):
+        """Take in everything the phone has sent and apply the newest state."""
         if self.ws_client:
             packets_processed = 0
-            # Buffer Drain Loop: Read until socket is empty
-            while True:
-                r, _, _ = select.select([self.ws_client], [], [], 0)
-                if not r:
-                    break # No more data in buffer
-
-                try:
-                    header = self._read_exact(self.ws_client, 2)
-
-                    is_final = header[0] & 0x80
-                    opcode = header[0] & 0x0f
-
-                    if opcode == 8:
+            packets_applied = 0
+            # Buffer Drain Loop: read until the socket is empty. Usually one
+            # pass; more only if a backlog overfills the buffer.
+            try:
+                while True:
+                    full = self._fill_rx()
+                    newest, frames, closing, consumed = self._scan_frames()
+                    if self.coalesce:
+                        if newest >= 0:
+                            self._apply_state(newest, self._frame_len(newest))
+                            packets_applied += 1
+                        for offset in self._deltas:
+                            self._apply_state(offset, self._frame_len(offset))
+                        packets_applied += len(self._deltas)
+                    else:
+                        packets_applied += frames
+                    packets_processed += frames
+                    if closing:
                         if self.bot and hasattr(self.bot, "log_info"): self.bot.log_info("WS Graceful Close")
                         self._close_ws()
                         return
-
-                    is_masked = header[1] & 0x80
-                    payload_len = header[1] & 0x7f
-
-                    if payload_len == 126:
-                        ext_len = self._read_exact(self.ws_client, 2)
-                        payload_len = struct.unpack(">H", ext_len)[0]
-                    elif payload_len == 127:
-                        ext_len = self._read_exact(self.ws_client, 8)
-                        payload_len = struct.unpack(">Q", ext_len)[0]
-
-                    if is_masked:
-                        mask = self._read_exact(self.ws_client, 4)
-
-                    if payload_len > 0:
-                        payload = self._read_exact(self.ws_client, payload_len)
-                    else:
-                        payload = b''
-                    if opcode == 2 and is_masked and payload_len == 28:
-                        unmasked = bytearray(payload_len)
-                        for i in range(payload_len):
-                            unmasked[i] = payload[i] ^ mask[i % 4]
-
-                        lx, ly, rx, ry, l2, r2, btn_mask = struct.unpack('<ffffffI', unmasked)
-
-                        self.left_x = lx
-                        self.left_y = ly
-                        self.right_x = rx
-                        self.right_y = ry
-                        self.L2 = l2
-                        self.R2 = r2
-
-                        btn_names = ['cross', 'circle', 'square', 'triangle', 'L1', 'R1', 'L2', 'R2',
-                                     'share', 'options', 'L3', 'R3', 'up', 'down', 'left', 'right', 'ps']
-
-                        for i, name in enumerate(btn_names):
-                            self.buttons[name] = bool((btn_mask >> i) & 1)
-
-                        self.last_packet_time = time.ticks_ms()
-                        self.connected = True
-                        packets_processed += 1
-                except OSError as e:
-                    # Check if the error is just EAGAIN / EWOULDBLOCK (Buffer is empty)
-                    if e.args and e.args[0] == 11: 
-                        break  # Cleanly exit the loop; the buffer is drained!
-                    else:
-                        # A genuine connection drop or socket error occurred
-                        if self.bot and hasattr(self.bot, "log_info"): 
-                            self.bot.log_info(f"WS Err: {e}")
-                        self._close_ws()
+                    self._keep_partial(consumed)
+                    if not full:
                         break
+                if self._echo_due:
+                    self._send_echo()
+            except OSError as e:
+                # A genuine connection drop or socket error occurred
+                if self.bot and hasattr(self.bot, "log_info"):
+                    self.bot.log_info(f"WS Err: {e}")
+                self._close_ws()
 
+            self.packets += packets_processed
             # Instrumentation: Log if we had to drop stale packets
-            if packets_processed > 1:
-                # We processed more than 1 packet this cycle.
-                # Only the last one matters. The others were stale.
-                dropped = packets_processed - 1
+            dropped = packets_processed - packets_applied
+            if dropped > 0:
+                # More than one packet arrived since the last update. Only
+                # the newest full state, and any deltas after it, were
+                # decoded; the others were stale.
+                self.dropped += dropped
                 if self.bot and hasattr(self.bot, "log_info"): self.bot.log_info(f"Lag Drop: {dropped} pkts")
 
-        # Accept new connections
+    def _send_echo(self):
+        """Hand the newest clock the page asked about back to it. Skipped,
+        not queued, if the socket cannot take it right now: the page only
+        wants a recent sample."""
+        self._echo_due = False
+        try:
+            self.ws_client.send(self._echo)
+        except OSError as e:
+            if not (e.args and e.args[0] == EAGAIN):
+                raise
+
+    def _accept(self):
+        """Take in new connections and move every page load along a step.
+        Nothing here waits on a phone."""
         r, _, _ = select.select([self.server_socket], [], [], 0)
         if r:
             try:
                 cl, _ = self.server_socket.accept()
-                cl.settimeout(0.5)
-                try:
-                    req = cl.recv(1024)
-                    if req:
-                        self._handle_http_req(req, cl)
-                    else:
-                        cl.close()
-                except OSError:
-                    cl.close()
+                self.pages.accept(cl)
             except OSError:
                 pass
+        self.pages.poll(self._handle_http_req)
@@ -1,4 +1,6 @@
-# nhs_robotics V03
+# nhs_robotics V04
+# Changes from V03:
+#   1. Exports PoseEstimator (wheels and IMU fused, SuperBot.get_pose()).
 # Changes from V02:
 #   1. Exports Controller (consistent with all other peripheral classes).
 #   2. Exports LineFollower (PID line following, V03).
@@ -10,6 +12,7 @@ from .vision import RobotVision, ApproachVector
 from .navigation import RobotNavigation
 from .ui import RobotUI
 from .line_follower import LineFollower
+from .pose import PoseEstimator
 from controller import Controller
 
-print("Loading nhs_robotics.py V03")
+print("Loading nhs_robotics.py V04")
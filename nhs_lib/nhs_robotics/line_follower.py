@@ -5,47 +5,189 @@
 # sb.line_lost / sb.reset_line() proxy to this class. Can also be used
 # standalone: lf = LineFollower(alvik); left_rpm, right_rpm = lf.follow(base_speed).
 # Call follow() every loop tick (~10-20 ms). It reads the sensors itself.
+# follow(base_speed, recover=True) turns back for the line when it is lost
+# rather than raising line_lost at once.
+#
+# Readings are scaled per sensor to 0.0 (floor) .. 1.0 (tape) before the
+# position is worked out. White reads about 50 but the tape anywhere from
+# 300 to 650 depending on the sensor (REFERENCE.md), so raw sums rode to
+# one side, and a step of a few counts on the floor kicked KD. calibrate()
+# sweeps the robot across the tape to measure each sensor's floor and tape;
+# until it has run, DEFAULT_LOW/DEFAULT_HIGH stand in. What it measures is
+# kept for as long as this object lives and never written to the robot:
+# no per-robot constants on the filesystem (REFERENCE.md).
 
 import time
 
 
 class LineFollower:
     # Tuning constants. KP is the workhorse; KD damps wiggle; KI stays 0
-    # unless the robot consistently rides one side of the line.
-    KP = 45.0
+    # unless the robot consistently rides one side of the line. The error
+    # is in sensor spacings, see _position().
+    KP = 60.0
     KI = 0.0
-    KD = 8.0
-    LINE_MIN_SUM = 150   # below this total reflectance, the line is "lost"
+    KD = 24.0
+    LINE_MIN = 0.2       # below this total of the scaled readings, the line is "lost"
+    EDGE_LEVEL = 0.05    # centre below this is off the tape
+    D_SMOOTHING = 0.15   # share of each new derivative let through
+
+    # KP and KD are right at 40 rpm. Slower, the same correction is a
+    # lurch; faster, too little too late. (rpm, share of KP and KD),
+    # interpolated between and held beyond the ends.
+    GAIN_SCHEDULE = ((20, 0.7), (40, 1.0), (70, 1.4))
+
+    # Bends. The error, and where its trend will have taken it LOOK_AHEAD_S
+    # from now, say how hard the tape is curving; speed comes down by
+    # CORNER_SLOWDOWN per sensor spacing of that, never below
+    # CORNER_MIN_SHARE of base_speed. Down at once, back up a share of the
+    # way each tick.
+    LOOK_AHEAD_S = 0.2
+    CORNER_SLOWDOWN = 0.3
+    CORNER_MIN_SHARE = 0.4
+    CORNER_RECOVERY = 0.1
+
+    MAX_RPM = 70.0       # no wheel turns faster: robot_definitions.MOTOR_MAX_RPM
+
+    # Losing the line, when follow() is asked to recover. It went off the
+    # side the error last pointed to, so turn that way: the outside wheel at RECOVERY_OUTER of base_speed,
+    # the inside one at RECOVERY_INNER. -1.0 spins on the spot, which found
+    # a hairpin quickest in the testbench; raise it towards 0 to arc
+    # instead. Give up after RECOVERY_TIMEOUT_MS -- about half a turn at
+    # 25 rpm -- and set line_lost.
+    RECOVERY_OUTER = 1.0
+    RECOVERY_INNER = -1.0
+    RECOVERY_TIMEOUT_MS = 3000
+
+    # Scaling until calibrate() has run: white paper, and the weakest tape
+    DEFAULT_LOW = 50
+    DEFAULT_HIGH = 300
+
+    CALIBRATE_RPM = 15
+    # Left-wheel degrees either side of where the sweep starts. About 30
+    # deg of spin, past the outer sensors at 17 deg off the tape.
+    CALIBRATE_WHEEL_DEG = 80
+    CALIBRATE_TIMEOUT_MS = 5000
+    CALIBRATE_MIN_SPAN = 100  # tape must read at least this over the floor
 
     def __init__(self, alvik):
         self.alvik = alvik
         self._integral = 0.0
         self._last_error = 0.0
+        self._derivative = 0.0
         self._last_time = time.ticks_ms()
         self.line_lost = False
+        self.speed = None    # forward rpm of the last step, after slowing for bends
+        self.recovering = False   # off the line and turning back to find it
+        self.recovery_ms = None   # how long the last time off the line lasted
+        self.recoveries = 0       # times it has found the line again
+        self._lost_since = None
+        self._side = 0            # sign of the last error that was not 0
+        self.calibrated = False
+        self._set_range((self.DEFAULT_LOW,) * 3, (self.DEFAULT_HIGH,) * 3)
 
     def reset(self):
         """Clear PID state. Call after leaving the line on purpose."""
         self._integral = 0.0
         self._last_error = 0.0
+        self._derivative = 0.0
         self._last_time = time.ticks_ms()
         self.line_lost = False
+        self.speed = None
+        self.recovering = False
+        self._lost_since = None
+        self._side = 0
+
+    # ---------- calibration ----------
+
+    def _set_range(self, lows, highs):
+        self.lows = tuple(lows)
+        self.highs = tuple(highs)
+        self._scales = tuple(1.0 / (high - low) for low, high in zip(lows, highs))
+
+    def calibrate(self):
+        """Spin left and right across the tape and record what each sensor
+        reads on the floor and on the tape. Start with the centre sensor
+        over the tape. Returns True if every sensor saw both; otherwise
+        the scaling it had is kept."""
+        lows = [None] * 3
+        highs = [None] * 3
+        origin = self.alvik.get_wheels_position()[0]
+        for turn in (-self.CALIBRATE_WHEEL_DEG, self.CALIBRATE_WHEEL_DEG, 0):
+            self._sweep_to(origin + turn, lows, highs)
+        self.alvik.brake()
+        for low, high in zip(lows, highs):
+            if low is None or high - low < self.CALIBRATE_MIN_SPAN:
+                return False
+        self._set_range(lows, highs)
+        self.calibrated = True
+        self.reset()
+        return True
+
+    def _sweep_to(self, target, lows, highs):
+        """Spin until the left wheel reads target degrees, folding every
+        reading on the way into lows and highs."""
+        left = self.alvik.get_wheels_position()[0]
+        way = 1 if target > left else -1
+        self.alvik.set_wheels_speed(way * self.CALIBRATE_RPM, -way * self.CALIBRATE_RPM)
+        start = time.ticks_ms()
+        while (target - left) * way > 0:
+            if time.ticks_diff(time.ticks_ms(), start) > self.CALIBRATE_TIMEOUT_MS:
+                break
+            readings = self.alvik.get_line_sensors()
+            for i in range(3):
+                value = readings[i]
+                if value is None:
+                    continue
+                if lows[i] is None or value < lows[i]:
+                    lows[i] = value
+                if highs[i] is None or value > highs[i]:
+                    highs[i] = value
+            time.sleep_ms(5)
+            left = self.alvik.get_wheels_position()[0]
+
+    # ---------- following ----------
+
+    def _levels(self):
+        """The three readings scaled to 0.0 (floor) .. 1.0 (tape), or None."""
+        readings = self.alvik.get_line_sensors()
+        levels = []
+        for value, low, scale in zip(readings, self.lows, self._scales):
+            if value is None:
+                return None
+            level = (value - low) * scale
+            levels.append(0.0 if level < 0.0 else 1.0 if level > 1.0 else level)
+        return levels
 
     def _position(self):
-        """Weighted line position: -1.0 (far left) .. +1.0 (far right).
-        Returns None when no line is under the sensors."""
-        l, c, r = self.alvik.get_line_sensors()
-        if l is None or c is None or r is None:
+        """Line position in sensor spacings: 0.0 under the centre sensor,
+        +/-1.0 under the right/left one, out to +/-2.0 as it slides off
+        past them. Returns None when no line is under the sensors."""
+        levels = self._levels()
+        if levels is None:
             return None
+        l, c, r = levels
         total = l + c + r
-        if total < self.LINE_MIN_SUM:
+        if total < self.LINE_MIN:
             return None
-        return (r - l) / total
+        if c >= self.EDGE_LEVEL:
+            # Between two sensors: interpolated by how much each sees
+            return (r - l) / total
+        # The centre is off the tape. The line is past whichever outer
+        # sensor sees it, by however far that one has dropped from full.
+        if r > l:
+            return 2.0 - r
+        if l > r:
+            return l - 2.0
+        return 2.0 - r if self._last_error >= 0 else l - 2.0
 
-    def follow(self, base_speed):
+    def follow(self, base_speed, recover=False):
         """One PID step. Returns (left_rpm, right_rpm).
         If the line is lost, returns (base_speed, base_speed) and sets
-        self.line_lost = True so caller code can react."""
+        self.line_lost = True at once so caller code can react. With
+        recover=True it turns back towards the line (self.recovering)
+        instead, for up to RECOVERY_TIMEOUT_MS, and sets line_lost only if
+        it cannot -- that long has passed, or it has no idea which side to
+        look."""
         pos = self._position()
         now = time.ticks_ms()
         dt = time.ticks_diff(now, self._last_time) / 1000.0
@@ -54,8 +196,16 @@ class LineFollower:
             dt = 0.001
 
         if pos is None:
-            self.line_lost = True
-            return (base_speed, base_speed)
+            return self._recover(base_speed, now, recover)
+        if self._lost_since is not None:
+            # Back on it. The error jumped while it was away; that is not
+            # a trend for KD to kick at.
+            self.recovery_ms = time.ticks_diff(now, self._lost_since)
+            self.recoveries += 1
+            self._lost_since = None
+            self._last_error = pos
+            self._derivative = 0.0
+        self.recovering = False
         self.line_lost = False
 
         error = pos
@@ -65,18 +215,75 @@ class LineFollower:
             self._integral = 1.0
         elif self._integral < -1.0:
             self._integral = -1.0
-        derivative = (error - self._last_error) / dt
+        # Smoothed: one tick's step in a reading is not a trend
+        self._derivative += self.D_SMOOTHING * (
+            (error - self._last_error) / dt - self._derivative)
+        derivative = self._derivative
         self._last_error = error
+        if error:
+            self._side = 1 if error > 0 else -1
 
-        correction = (self.KP * error
+        speed = self._corner_speed(base_speed, abs(error + self.LOOK_AHEAD_S * derivative))
+        share = self._gain_share(abs(speed))
+        correction = (self.KP * share * error
                       + self.KI * self._integral
-                      + self.KD * derivative)
+                      + self.KD * share * derivative)
+
+        left = speed + correction
+        right = speed - correction
 
-        left = base_speed + correction
-        right = base_speed - correction
+        # Past MAX_RPM the outside wheel is simply not that fast and the
+        # turn goes with it. Take the excess off both, so the turn is kept.
+        top = max(left, right)
+        bottom = min(left, right)
+        if top > self.MAX_RPM:
+            left -= top - self.MAX_RPM
+            right -= top - self.MAX_RPM
+        elif bottom < -self.MAX_RPM:
+            left -= bottom + self.MAX_RPM
+            right -= bottom + self.MAX_RPM
 
         # Clamp so one wheel never reverses hard at low base speeds
-        limit = abs(base_speed) * 2.0
+        limit = abs(speed) * 2.0
         left = max(-limit, min(limit, left))
         right = max(-limit, min(limit, right))
         return (left, right)
+
+    def _recover(self, base_speed, now, recover):
+        """follow() with no line under the sensors."""
+        if self._lost_since is None:
+            self._lost_since = now
+        away = time.ticks_diff(now, self._lost_since)
+        self.recovering = recover and self._side != 0 \
+            and away < self.RECOVERY_TIMEOUT_MS
+        self.line_lost = not self.recovering
+        if not self.recovering:
+            return (base_speed, base_speed)
+        outer = abs(base_speed) * self.RECOVERY_OUTER
+        inner = abs(base_speed) * self.RECOVERY_INNER
+        if self._side > 0:
+            return (outer, inner)   # went off to the right
+        return (inner, outer)
+
+    def _corner_speed(self, base_speed, bend):
+        """base_speed, slowed for a bend of this many sensor spacings."""
+        target = base_speed / (1.0 + self.CORNER_SLOWDOWN * bend)
+        floor = base_speed * self.CORNER_MIN_SHARE
+        if abs(target) < abs(floor):
+            target = floor
+        if self.speed is None or abs(target) < abs(self.speed) \
+                or (target > 0) != (self.speed > 0):
+            self.speed = target
+        else:
+            self.speed += self.CORNER_RECOVERY * (target - self.speed)
+        return self.speed
+
+    def _gain_share(self, rpm):
+        """GAIN_SCHEDULE at this speed."""
+        schedule = self.GAIN_SCHEDULE
+        if rpm <= schedule[0][0]:
+            return schedule[0][1]
+        for (low, low_share), (high, high_share) in zip(schedule, schedule[1:]):
+            if rpm <= high:
+                return low_share + (high_share - low_share) * (rpm - low) / (high - low)
+        return schedule[-1][1]
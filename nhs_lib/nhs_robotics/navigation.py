@@ -1,12 +1,48 @@
+import math
 import time
 
 class RobotNavigation:
     DEGREES_PER_CM = 33.88
 
+    # --- drive_distance: a trapezoid with encoder feedback ---
+    # drive() delivers about 93% of the speed it is asked for, and brake()
+    # rolls on: REFERENCE.md measured 6 mm from 4.6 cm/s, so about 0.13 s
+    # worth of the speed at the moment of braking. The old drive_distance
+    # braked when the encoders crossed the target and rolled that far past.
+    # Now the speed ramps up, cruises, and comes down to a creep along the
+    # distance left. The command goes through drive_gain, learned from the
+    # encoders as the robot moves, so the drive() shortfall is fed forward
+    # rather than chased, and the brake goes on early by the distance the
+    # robot is predicted to roll -- coast_s, learned from each brake. A
+    # blocking call returns once the stop it is rolling to is within
+    # ARRIVED_CM, not when the roll is over; coast_s is learned from the
+    # brake when the next move starts.
+    ACCEL_CM_S2 = 50.0          # up the ramp, and down it
+    CREEP_CM_S = 3.0            # the slowest it plans to go before braking
+    SPEED_KP = 0.5              # speed error -> extra command
+    GAIN_RATE = 0.2             # how fast drive_gain follows each reading
+    TRIM_LIMIT = 0.3            # drive_gain stays within 30% of 1
+    COAST_S = 0.13              # cm rolled after brake(), per cm/s
+    ARRIVED_CM = 0.5            # a stop predicted this close is there
+    SETTLE_TIMEOUT_MS = 800     # longest a roll lasts, and the longest wait
+
+    # --- turn_to_heading: the same, on the gyro ---
+    # brake() rolls 6.4 deg from 36 deg/s (REFERENCE.md), about 0.18 s
+    # worth of the turn rate. The turn ramps up and comes down to a creep,
+    # the gyro says how fast it is really turning, and the brake goes on
+    # early by the predicted roll -- turn_coast_s, learned from each brake.
+    TURN_ACCEL_DEG_S2 = 180.0
+    TURN_MAX_DEG_S = 90.0
+    TURN_CREEP_DEG_S = 12.0
+    TURN_KP = 0.5               # rate error -> extra command
+    TURN_COAST_S = 0.18         # deg rolled after brake(), per deg/s
+    TURN_SETTLED_DEG_S = 3.0    # slower than this is stopped
+
     MODE_IDLE = 0
     MODE_DISTANCE = 1
     MODE_APRIL_TAG = 2
     MODE_DRIVE_TO_LINE = 3
+    MODE_TURN = 4
 
     def __init__(self, alvik, ui):
         self.alvik = alvik
@@ -19,6 +55,40 @@ class RobotNavigation:
         self._drive_start_time = 0
         self._drive_timeout_ms = 0
         self._is_moving_distance = False
+        self._dd_distance_cm = 0.0
+        self._dd_max_speed = 0.0
+        self._dd_start_avg = 0.0
+        self._dd_last_cm = 0.0
+        self._dd_last_ms = 0
+        self._dd_speed = 0.0
+        self._dd_command = 0.0
+        self._dd_brake_cm = None
+        self._dd_brake_speed = 0.0
+        self._dd_brake_ms = 0
+        # (brake cm, speed, start, direction, ms) of the last brake, until
+        # the next move learns coast_s from it
+        self._coast_pending = None
+        self._coast_learned = False     # from a roll seen to its end
+
+        # What a brake() really rolls, per cm/s, learned from every blocking
+        # drive_distance. Starts at the measured figure.
+        self.coast_s = self.COAST_S
+        # Command per cm/s delivered, learned while driving. drive() falls
+        # about 7% short, so this settles near 1.08 on a real Alvik.
+        self.drive_gain = 1.0
+        # The same for turning, and how long the last turn_to_heading took
+        self.turn_coast_s = self.TURN_COAST_S
+        self.last_turn_ms = 0
+
+        # The motion queue: (mode, args) still to run, the one running,
+        # and the speed the last one handed over at without braking
+        self._queue = []
+        self._queue_active = None
+        self._queue_settling = False
+        self._queue_rolling = 0.0
+        self._queue_last = self.MODE_IDLE
+        self._dd_exit_speed = 0.0
+        self._dd_entry_speed = 0.0
 
         self._vs_target_id = 1
         self._vs_stop_distance = 0
@@ -36,9 +106,28 @@ class RobotNavigation:
         if distance_cm == 0:
             return
 
+        self._start_drive(distance_cm, speed_cm_s, timeout)
+
+        if blocking:
+            while not self.move_complete():
+                time.sleep(0.01)
+            self._settle()
+
+    def _start_drive(self, distance_cm, speed_cm_s, timeout,
+                     exit_speed=0.0, start_avg=None, entry_speed=0.0):
+        """Set up a drive_distance and take its first step.
+
+        The motion queue uses the rest: exit_speed above 0 ends the drive
+        at that speed, with no brake, for the next segment to carry on
+        from; entry_speed is the speed it is already rolling at; start_avg
+        is where the drive before planned to end, so a chain of them does
+        not drift by what each overran at the handover.
+        """
+        self._learn_coast()
         self._current_mode = self.MODE_DISTANCE
-        enc_values = self.alvik.get_wheels_position()
-        start_avg = (enc_values[0] + enc_values[1]) / 2.0
+        if start_avg is None:
+            enc_values = self.alvik.get_wheels_position()
+            start_avg = (enc_values[0] + enc_values[1]) / 2.0
 
         delta_deg = distance_cm * self.DEGREES_PER_CM
 
@@ -49,12 +138,147 @@ class RobotNavigation:
         self._drive_start_time = time.ticks_ms()
         self._drive_timeout_ms = timeout * 1000
 
-        self.alvik.drive(speed_cm_s * self._drive_direction, 0)
-
-        if blocking:
-            while not self.move_complete():
-                time.sleep(0.01)
+        self._dd_distance_cm = abs(distance_cm)
+        self._dd_max_speed = abs(speed_cm_s)
+        self._dd_start_avg = start_avg
+        self._dd_exit_speed = exit_speed
+        self._dd_entry_speed = entry_speed
+        self._dd_last_ms = self._drive_start_time
+        self._dd_speed = entry_speed
+        self._dd_command = 0.0
+        self._dd_brake_cm = None
+        self._dd_last_cm = self._travelled_cm() if entry_speed else 0.0
+
+        self._drive_step(self._drive_start_time, self._dd_last_cm)
+
+    def _travelled_cm(self):
+        """How far along the move the encoders say the robot is, in cm,
+        positive towards the target whichever way it lies."""
+        enc_values = self.alvik.get_wheels_position()
+        avg = (enc_values[0] + enc_values[1]) / 2.0
+        return (avg - self._dd_start_avg) * self._drive_direction / self.DEGREES_PER_CM
+
+    def _drive_step(self, now, travelled):
+        """One pass of the distance controller: measure, plan, command.
+        Returns True once it has braked."""
+        dt = time.ticks_diff(now, self._dd_last_ms) / 1000.0
+        if dt > 0:
+            measured = (travelled - self._dd_last_cm) / dt
+            # How much command it takes per cm/s delivered, from the last
+            # command and what it got -- but only at a steady roll, not
+            # while the robot is still getting going.
+            if self._dd_command > self.CREEP_CM_S and measured > 0.5 and self._dd_speed > 0.5:
+                ratio = max(1.0 - self.TRIM_LIMIT,
+                            min(1.0 + self.TRIM_LIMIT, self._dd_command / measured))
+                self.drive_gain += self.GAIN_RATE * (ratio - self.drive_gain)
+            self._dd_speed = (self._dd_speed + measured) / 2.0
+            self._dd_last_cm = travelled
+            self._dd_last_ms = now
+        speed = self._dd_speed
+
+        if self._dd_exit_speed > 0:
+            # Handing over to the next segment: no brake, no roll
+            if travelled >= self._dd_distance_cm:
+                return True
+        elif travelled + max(speed, 0.0) * self.coast_s >= self._dd_distance_cm:
+            # Brake once what it would roll at this speed reaches the target
             self.alvik.brake()
+            self._dd_brake_cm = travelled
+            self._dd_brake_speed = speed
+            self._dd_brake_ms = now
+            return True
+
+        # The trapezoid: up the ramp from the start, cruise, and down it to
+        # arrive at creep speed where a brake from creep would roll home.
+        # The way down is no steeper than the brake itself would stop the
+        # robot, or the brake would go on early at speed, and a brake from
+        # speed lands as far off as coast_s is wrong. Once a whole roll has
+        # been seen, coast_s can be trusted with twice that. A handover
+        # needs no brake: down to the exit speed at the end, as steep as it
+        # likes.
+        elapsed = time.ticks_diff(now, self._drive_start_time) / 1000.0
+        if self._dd_exit_speed > 0:
+            floor = self._dd_exit_speed
+            to_floor = self._dd_distance_cm - travelled
+            decel = self.ACCEL_CM_S2
+        else:
+            floor = self.CREEP_CM_S
+            to_floor = self._dd_distance_cm - self.CREEP_CM_S * self.coast_s - travelled
+            trust = 2 if self._coast_learned else 1
+            decel = min(self.ACCEL_CM_S2, trust * self.CREEP_CM_S / self.coast_s)
+        wanted = min(self._dd_max_speed,
+                     max(self.CREEP_CM_S, self._dd_entry_speed) + self.ACCEL_CM_S2 * elapsed,
+                     math.sqrt(floor ** 2 + 2.0 * decel * max(to_floor, 0.0)))
+
+        # Feed-forward through the learned gain, and the encoders correct
+        # what is left once the wheels are turning. Before that the robot
+        # is still getting going and no command would hurry it.
+        command = wanted * self.drive_gain
+        if speed > 0.5:
+            command += self.SPEED_KP * (wanted - speed)
+        command = max(0.0, min(command, self._dd_max_speed * (1.0 + self.TRIM_LIMIT)))
+
+        self._dd_command = command
+        self.alvik.drive(command * self._drive_direction, 0)
+        return False
+
+    def _settle(self):
+        """Wait until the roll after the brake is as good as home."""
+        self._settle_start()
+        while not self._settle_step(time.ticks_ms()):
+            time.sleep(0.05)
+
+    def _settle_start(self):
+        self._st_start_ms = time.ticks_ms()
+        self._st_last_ms = self._st_start_ms
+        self._st_last_cm = self._travelled_cm()
+
+    def _settle_step(self, now):
+        """One look at the roll, every 50 ms. Returns True once it is no
+        faster than creep and will stop within ARRIVED_CM of the target,
+        once the wheels have stopped, or once SETTLE_TIMEOUT_MS has
+        passed."""
+        if self._dd_brake_cm is None:
+            return True
+        if time.ticks_diff(now, self._st_start_ms) < self.SETTLE_TIMEOUT_MS:
+            dt = time.ticks_diff(now, self._st_last_ms)
+            if dt < 50:
+                return False
+            now_cm = self._travelled_cm()
+            speed = (now_cm - self._st_last_cm) * 1000.0 / dt
+            self._st_last_ms = now
+            self._st_last_cm = now_cm
+            landing = now_cm + max(speed, 0.0) * self.coast_s
+            arrived = speed <= self.CREEP_CM_S and \
+                abs(landing - self._dd_distance_cm) <= self.ARRIVED_CM
+            if abs(speed) * dt >= 50.0 and not arrived:
+                return False
+        self._coast_pending = (self._dd_brake_cm, self._dd_brake_speed,
+                               self._dd_start_avg, self._drive_direction,
+                               self._dd_brake_ms)
+        self._dd_brake_cm = None
+        return True
+
+    def _learn_coast(self):
+        """Learn how far a brake() really rolls from the last one, as the
+        next move starts. Within SETTLE_TIMEOUT_MS of the brake the roll
+        may not be over, so what it has rolled so far can only say coast_s
+        is longer, never shorter."""
+        pending = self._coast_pending
+        self._coast_pending = None
+        if pending is None:
+            return
+        brake_cm, brake_speed, start_avg, direction, brake_ms = pending
+        if brake_speed <= 2.0:
+            return
+        enc_values = self.alvik.get_wheels_position()
+        stopped_cm = ((enc_values[0] + enc_values[1]) / 2.0 - start_avg) \
+            * direction / self.DEGREES_PER_CM
+        rolled = max(0.02, min(0.6, (stopped_cm - brake_cm) / brake_speed))
+        over = time.ticks_diff(time.ticks_ms(), brake_ms) >= self.SETTLE_TIMEOUT_MS
+        if over or rolled > self.coast_s:
+            self.coast_s += 0.75 * (rolled - self.coast_s)
+        self._coast_learned = self._coast_learned or over
 
     def approach_tag(self, vision, target_id=1, stop_distance=8.0, speed=5, blocking=True):
         self.ui.log_info(f"Approaching ID {target_id}...")
@@ -68,13 +292,18 @@ class RobotNavigation:
         
         # Attach vision temporarily for the move_complete loop
         self._active_vision = vision
+        self._dd_brake_cm = None
 
         self.alvik.drive(speed, 0)
 
         if blocking:
             while not self.move_complete():
                 time.sleep(0.05)
-            self.alvik.brake()
+            if self._dd_brake_cm is not None:
+                # Finished blind, by encoder, and that braked already
+                self._settle()
+            else:
+                self.alvik.brake()
             self._active_vision = None
             return True
         return True
@@ -100,23 +329,13 @@ class RobotNavigation:
             time_diff = time.ticks_diff(time.ticks_ms(), self._drive_start_time)
             if time_diff > self._drive_timeout_ms:
                 self.alvik.brake()
+                self._dd_exit_speed = 0.0
                 self._is_moving_distance = False
                 self._current_mode = self.MODE_IDLE
                 self.ui.log_info("Warn: Drive Timeout")
                 return True
 
-            enc_values = self.alvik.get_wheels_position()
-            current_avg = (enc_values[0] + enc_values[1]) / 2.0
-
-            finished = False
-            if self._drive_direction > 0:
-                if current_avg >= self._target_encoder_value:
-                    finished = True
-            else:
-                if current_avg <= self._target_encoder_value:
-                    finished = True
-
-            if finished:
+            if self._drive_step(time.ticks_ms(), self._travelled_cm()):
                 self._is_moving_distance = False
                 self._current_mode = self.MODE_IDLE
                 return True
@@ -142,9 +361,9 @@ class RobotNavigation:
                         self.ui.log_info("Tag lost (Close). Blind finish.")
                         remaining = self._vs_last_dist - self._vs_stop_distance
                         if remaining > 0:
-                            self.drive_distance(
-                                remaining, speed_cm_s=self._vs_speed, blocking=True
-                            )
+                            # The rest by encoder, from here on in
+                            self._start_drive(remaining, self._vs_speed, 10)
+                            return False
                         self._current_mode = self.MODE_IDLE
                         return True
                     else:
@@ -177,6 +396,12 @@ class RobotNavigation:
 
             return False
 
+        elif self._current_mode == self.MODE_TURN:
+            if self._turn_step(time.ticks_ms()):
+                self._current_mode = self.MODE_IDLE
+                return True
+            return False
+
         elif self._current_mode == self.MODE_DRIVE_TO_LINE:
             l, c, r = self.alvik.get_line_sensors()
             threshold = self._lf_threshold
@@ -189,39 +414,249 @@ class RobotNavigation:
             return True
 
     def turn_to_heading(self, target_angle, get_yaw_func, tolerance=2.0, timeout=5):
-        self.ui.log_info(f"Turn to {target_angle:.1f}")
-        start_time = time.ticks_ms()
+        """Turn on the spot to target_angle (degrees, the yaw's 0-360) and
+        stop there. Done when the heading is within tolerance AND the robot
+        has stopped turning. Returns how long it took, in ms."""
+        self._start_turn(target_angle, get_yaw_func, tolerance, timeout)
+        while not self.move_complete():
+            time.sleep(0.01)
+        return self.last_turn_ms
 
-        while True:
-            if time.ticks_diff(time.ticks_ms(), start_time) > timeout * 1000:
+    def _start_turn(self, target_angle, get_yaw_func, tolerance, timeout):
+        self._learn_coast()
+        self.ui.log_info(f"Turn to {target_angle:.1f}")
+        self._current_mode = self.MODE_TURN
+        now = time.ticks_ms()
+        self._th_target = target_angle
+        self._th_get_yaw = get_yaw_func
+        self._th_tolerance = tolerance
+        self._th_timeout_ms = timeout * 1000
+        self._th_start = now
+        self._th_leg_start = now
+        self._th_last_yaw = get_yaw_func()
+        self._th_last_ms = now
+        self._th_braked = None          # (error, rate) when the brake went on
+        self._th_braking = False        # brake() called and no drive() since
+        self._th_creep = None           # the slowest this leg plans to go
+
+    def _turn_step(self, now):
+        """One pass of the turn controller: measure, plan, command.
+        Returns True once the turn is over, with last_turn_ms set."""
+        if time.ticks_diff(now, self._th_start) > self._th_timeout_ms:
+            self.alvik.brake()
+            self.ui.log_info("Turn Timeout")
+            return self._turn_done(now)
+
+        current_yaw = self._th_get_yaw()
+        error = self._heading_error(self._th_target, current_yaw)
+        rate = self._turn_rate(current_yaw, self._th_last_yaw,
+                               time.ticks_diff(now, self._th_last_ms))
+        self._th_last_yaw, self._th_last_ms = current_yaw, now
+        stopped = abs(rate) <= self.TURN_SETTLED_DEG_S
+
+        if self._th_braked is not None:
+            # Rolling to a stop. Once stopped, learn how far it rolled.
+            if not stopped:
+                return False
+            brake_error, brake_rate = self._th_braked
+            if abs(brake_rate) > 2 * self.TURN_SETTLED_DEG_S:
+                rolled = (brake_error - error) / brake_rate
+                rolled = max(0.02, min(0.6, rolled))
+                self.turn_coast_s += 0.75 * (rolled - self.turn_coast_s)
+            self._th_braked = None
+            self._th_leg_start = now
+            self._th_creep = None
+
+        if abs(error) <= self._th_tolerance and stopped:
+            # A second brake() while still rolling would start the roll
+            # over, so only brake if nothing has yet
+            if not self._th_braking:
                 self.alvik.brake()
-                self.ui.log_info("Turn Timeout")
-                break
+            return self._turn_done(now)
+
+        direction = 1 if error > 0 else -1
+        toward = rate * direction
+
+        # Brake once what it would roll at this rate reaches the heading
+        if toward > 0 and abs(error) <= toward * self.turn_coast_s:
+            self.alvik.brake()
+            self._th_braked = (error, rate)
+            self._th_braking = True
+            return False
+
+        # Up the ramp, and down it to a creep where a brake from creep
+        # rolls onto the heading; no steeper than a brake would stop it.
+        # A correction smaller than a creep's roll creeps slower still.
+        if self._th_creep is None:
+            self._th_creep = min(self.TURN_CREEP_DEG_S,
+                                 max(abs(error) / self.turn_coast_s,
+                                     2 * self.TURN_SETTLED_DEG_S))
+        creep = self._th_creep
+        elapsed = time.ticks_diff(now, self._th_leg_start) / 1000.0
+        decel = min(self.TURN_ACCEL_DEG_S2, creep / self.turn_coast_s)
+        to_creep = abs(error) - creep * self.turn_coast_s
+        wanted = min(self.TURN_MAX_DEG_S,
+                     creep + self.TURN_ACCEL_DEG_S2 * elapsed,
+                     math.sqrt(creep ** 2 + 2.0 * decel * max(to_creep, 0.0)))
+
+        command = wanted
+        if toward > 1.0:
+            command += self.TURN_KP * (wanted - toward)
+        command = max(0.0, min(command, self.TURN_MAX_DEG_S * (1.0 + self.TRIM_LIMIT)))
+
+        self.alvik.drive(0, command * direction)
+        self._th_braking = False
+        return False
+
+    def _turn_done(self, now):
+        self.last_turn_ms = time.ticks_diff(now, self._th_start)
+        return True
 
-            current_yaw = get_yaw_func()
-            error = target_angle - current_yaw
+    @staticmethod
+    def _heading_error(target_angle, current_yaw):
+        """target - current, the short way round: -180..180."""
+        error = target_angle - current_yaw
+        if error > 180:
+            error -= 360
+        if error < -180:
+            error += 360
+        return error
+
+    def _turn_rate(self, current_yaw, last_yaw, dt_ms):
+        """How fast the robot is turning, deg/s, positive to the left. The
+        gyro if it has reported, else the yaw's own change."""
+        try:
+            rate = self.alvik.get_gyros()[2]
+        except Exception:
+            rate = None
+        if rate is not None:
+            return rate
+        if dt_ms <= 0:
+            return 0.0
+        return self._heading_error(current_yaw, last_yaw) * 1000.0 / dt_ms
+
+    # --- the motion queue ---
+    # Blocking moves hold the main loop, so nothing else -- the UI, the
+    # Controller, a sensor -- gets a look in until they finish, and every
+    # move ends in a full stop. Queued moves run from update(), called once
+    # per loop tick: it takes one step of whatever is running and returns
+    # at once. Where one move leads straight into the next, the robot does
+    # not stop in between: a drive into another drive the same way hands
+    # over at the slower of the two speeds, a forward drive runs into a
+    # drive_to_line or approach_tag at its speed, and a drive_to_line rolls
+    # on into a forward drive. Anything else brakes, and waits out the
+    # roll, before the next move starts.
+
+    def queue_drive(self, distance_cm, speed_cm_s=20, timeout=10):
+        if distance_cm != 0:
+            self._queue.append((self.MODE_DISTANCE, (distance_cm, speed_cm_s, timeout)))
+
+    def queue_turn(self, target_angle, get_yaw_func, tolerance=2.0, timeout=5):
+        self._queue.append((self.MODE_TURN, (target_angle, get_yaw_func, tolerance, timeout)))
+
+    def queue_drive_to_line(self, speed=15, threshold=500):
+        self._queue.append((self.MODE_DRIVE_TO_LINE, (speed, threshold)))
+
+    def queue_approach_tag(self, vision, target_id=1, stop_distance=8.0, speed=5):
+        self._queue.append((self.MODE_APRIL_TAG, (vision, target_id, stop_distance, speed)))
+
+    def clear_queue(self):
+        """Drop everything queued, and stop the robot if a queued move was
+        running."""
+        self._queue = []
+        if self._queue_active is not None or self._queue_rolling:
+            self.alvik.brake()
+        self._queue_active = None
+        self._queue_settling = False
+        self._queue_rolling = 0.0
+        self._is_moving_distance = False
+        self._active_vision = None
+        self._current_mode = self.MODE_IDLE
+
+    def queue_empty(self):
+        return self._queue_active is None and not self._queue and not self._queue_settling
 
-            if error > 180:
-                error -= 360
-            if error < -180:
-                error += 360
+    def update(self):
+        """Advance the motion queue by one step. Never waits. Returns True
+        once everything queued has finished."""
+        if self._queue_settling:
+            if not self._settle_step(time.ticks_ms()):
+                return False
+            self._queue_settling = False
+
+        if self._queue_active is not None:
+            if not self.move_complete():
+                return False
+            self._queue_end(self._queue_active)
+            self._queue_active = None
+            if self._dd_brake_cm is not None:
+                # It braked: wait out the roll before the next one starts
+                self._settle_start()
+                self._queue_settling = True
+                return False
 
-            if abs(error) <= tolerance:
+        if not self._queue:
+            if self._queue_rolling:
                 self.alvik.brake()
-                break
-
-            rotation_speed = error * 2.0
-            MAX_SPEED = 50
-            MIN_SPEED = 15
-
-            if rotation_speed > MAX_SPEED:
-                rotation_speed = MAX_SPEED
-            if rotation_speed < -MAX_SPEED:
-                rotation_speed = -MAX_SPEED
-            if 0 < rotation_speed < MIN_SPEED:
-                rotation_speed = MIN_SPEED
-            if -MIN_SPEED < rotation_speed < 0:
-                rotation_speed = -MIN_SPEED
-
-            self.alvik.drive(0, rotation_speed)
-            time.sleep(0.01)
+                self._queue_rolling = 0.0
+            return True
+
+        self._queue_start(self._queue.pop(0))
+        return False
+
+    def _queue_start(self, segment):
+        mode, args = segment
+        following = self._queue[0] if self._queue else None
+        entry = self._queue_rolling
+        self._queue_rolling = 0.0
+        self._queue_active = mode
+
+        if mode == self.MODE_DISTANCE:
+            distance_cm, speed_cm_s, timeout = args
+            start_avg = None
+            if entry and self._queue_last == self.MODE_DISTANCE:
+                # Carry on from where the last drive planned to end, so
+                # what each overruns at the handover does not add up
+                start_avg = self._target_encoder_value
+            self._start_drive(distance_cm, speed_cm_s, timeout,
+                              exit_speed=self._exit_into(distance_cm, speed_cm_s, following),
+                              start_avg=start_avg, entry_speed=entry)
+        elif mode == self.MODE_TURN:
+            self._start_turn(*args)
+        elif mode == self.MODE_DRIVE_TO_LINE:
+            self.drive_to_line(*args, blocking=False)
+        elif mode == self.MODE_APRIL_TAG:
+            vision, target_id, stop_distance, speed = args
+            self.approach_tag(vision, target_id, stop_distance, speed, blocking=False)
+
+    def _exit_into(self, distance_cm, speed_cm_s, following):
+        """The speed a drive can hand over to the next segment at without
+        braking, or 0 if it has to stop first."""
+        if following is None:
+            return 0.0
+        mode, args = following
+        if mode == self.MODE_DISTANCE:
+            if (args[0] > 0) == (distance_cm > 0):
+                return float(min(abs(speed_cm_s), abs(args[1])))
+        elif mode == self.MODE_DRIVE_TO_LINE or mode == self.MODE_APRIL_TAG:
+            speed = args[0] if mode == self.MODE_DRIVE_TO_LINE else args[3]
+            if distance_cm > 0 and speed > 0:
+                return float(min(abs(speed_cm_s), speed))
+        return 0.0
+
+    def _queue_end(self, mode):
+        """A queued segment has finished: roll on into the next, or stop."""
+        self._queue_last = mode
+        following = self._queue[0] if self._queue else None
+        if mode == self.MODE_DISTANCE:
+            self._queue_rolling = self._dd_exit_speed
+        elif mode == self.MODE_DRIVE_TO_LINE:
+            if (following is not None and following[0] == self.MODE_DISTANCE
+                    and following[1][0] > 0 and self._lf_speed > 0):
+                self._queue_rolling = float(self._lf_speed)
+            else:
+                self.alvik.brake()
+        elif mode == self.MODE_APRIL_TAG:
+            if self._dd_brake_cm is None:
+                self.alvik.brake()
+            self._active_vision = None
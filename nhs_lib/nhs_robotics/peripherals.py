@@ -12,13 +12,26 @@ from qwiic_i2c.micropython_i2c import MicroPythonI2C
 class Button:
     """
     Detects a single 'rising edge' press event.
+
+    With presses_func -- a count of presses kept as the robot's touch
+    packets arrive, like alvik.get_touch_presses -- it reads that count
+    instead of comparing the level between calls, so a tap that starts and
+    ends between two is_pressed() calls still counts.
     """
-    def __init__(self, getter_func):
+    def __init__(self, getter_func, presses_func=None):
         self.get_value = getter_func
         self.previous_state = False
+        self.get_presses = presses_func
+        self._seen = presses_func() if presses_func else 0
 
     def is_pressed(self):
         """Returns True only on the moment the button is first touched."""
+        if self.get_presses:
+            # Any number of presses since the last call is one press now
+            count = self.get_presses()
+            pressed = count != self._seen
+            self._seen = count
+            return pressed
         current_state = self.get_value()
         pressed = False
         if current_state and not self.previous_state:
@@ -28,14 +41,25 @@ class Button:
 
 
 
+def on_bus(devices, address):
+    """
+    Whether it is worth talking to address at all. devices is the set of
+    addresses that answered one scan of the bus, or None if there was no
+    scan -- and then anything may be there.
+    """
+    return devices is None or address in devices
+
+
 class OLED:
     """
     Wrapper for the SSD1306 OLED Display.
     """
+    ADDRESS = 0x3c
+
     def __init__(self, i2c_driver=None):
         scl_pin = 12
         sda_pin = 11
-        i2c_address = 0x3c
+        i2c_address = self.ADDRESS
         oled_width = 128
         oled_height = 32
         self.display = None
@@ -75,6 +99,8 @@ class OLED:
 
 
 class Buzzer:
+    ADDRESS = 0x34      # the Qwiic Buzzer's factory address
+
     def __init__(self, scl_pin=12, sda_pin=11, i2c_driver=None):
         self.frequency = 2730
         self.duration = 100
@@ -303,4 +329,4 @@ class NanoLED:
         """
         self.off()
 
-print("Loaded peripherals.py V01")
+print("Loaded peripherals.py V02")
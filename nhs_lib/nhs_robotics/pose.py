@@ -0,0 +1,92 @@
+# pose.py
+# nhs_robotics V04 addition: one pose estimate for everything on the robot.
+#
+# Reached through SuperBot: x, y, theta = sb.get_pose(), or sb.pose.x etc.
+# after sb.pose.update(). Can also be used standalone:
+# pose = PoseEstimator(alvik); pose.update(); print(pose.theta).
+# Call update() every loop tick. It reads the encoders and the IMU itself.
+#
+# Why not alvik.get_pose()? Its theta is wheel odometry and over-reports
+# rotation by 8-13% (REFERENCE.md). get_orientation()'s yaw is the IMU,
+# which does not drift, but it is 0-360 and wraps. Here the wheels say how
+# far the robot moved and which way it is turning from one update to the
+# next, and the unwrapped yaw pulls the heading back to the truth at a
+# steady rate, however fast the loop runs -- a complementary filter. theta keeps counting past 360
+# and below 0, so a turn of two whole circles reads 720.
+
+import math
+import time
+
+
+class PoseEstimator:
+    DEGREES_PER_CM = 33.88      # wheel degrees per cm rolled, as RobotNavigation
+    WHEEL_TRACK_CM = 8.8        # measured, REFERENCE.md
+
+    # How fast theta is pulled onto the IMU heading: the gap shrinks by a
+    # factor of e every YAW_TAU_S, however often update() is called. The
+    # wheels carry the heading between updates; the IMU owns it over a
+    # second. 0.1 s is a share of 0.2 an update at 50 Hz.
+    YAW_TAU_S = 0.1
+
+    def __init__(self, alvik):
+        self.alvik = alvik
+        self.x = 0.0
+        self.y = 0.0
+        self.theta = 0.0
+        self.stamp_ms = time.ticks_ms()
+        self._wheels = None         # (left, right) degrees at the last update
+        self._yaw = None            # raw yaw at the last update
+        self._yaw_offset = None     # unwrapped yaw + this = theta
+
+    def reset(self, x=0.0, y=0.0, theta=0.0):
+        """Say where the robot is now. The IMU is re-anchored to theta."""
+        self.x = float(x)
+        self.y = float(y)
+        self.theta = float(theta)
+        self._wheels = None
+        self._yaw = None
+        self._yaw_offset = None
+        self.update()
+
+    def update(self):
+        """Fold in what the encoders and the IMU report now. Returns
+        (x, y, theta)."""
+        wheels = self.alvik.get_wheels_position()
+        try:
+            yaw = self.alvik.get_orientation()[2]
+        except Exception:
+            yaw = None
+        now = time.ticks_ms()
+        dt = time.ticks_diff(now, self.stamp_ms) / 1000.0
+        self.stamp_ms = now
+
+        if wheels is not None and wheels[0] is not None and wheels[1] is not None:
+            if self._wheels is not None:
+                left = (wheels[0] - self._wheels[0]) / self.DEGREES_PER_CM
+                right = (wheels[1] - self._wheels[1]) / self.DEGREES_PER_CM
+                turn = math.degrees((right - left) / self.WHEEL_TRACK_CM)
+                # Move along the heading halfway through the turn
+                heading = math.radians(self.theta + turn / 2.0)
+                forward = (left + right) / 2.0
+                self.x += forward * math.cos(heading)
+                self.y += forward * math.sin(heading)
+                self.theta += turn
+            self._wheels = (wheels[0], wheels[1])
+
+        if yaw is not None:
+            if self._yaw is None:
+                self._yaw_offset = self.theta - yaw
+            else:
+                # Unwrap: the step from the last yaw, taken the short way
+                step = (yaw - self._yaw + 180.0) % 360.0 - 180.0
+                self._yaw_offset += step - (yaw - self._yaw)
+                imu = yaw + self._yaw_offset
+                share = 1.0 - math.exp(-max(dt, 0.0) / self.YAW_TAU_S)
+                self.theta += share * (imu - self.theta)
+            self._yaw = yaw
+
+        return self.x, self.y, self.theta
+
+    def pose(self):
+        """(x, y, theta) as of the last update(), without reading anything."""
+        return self.x, self.y, self.theta
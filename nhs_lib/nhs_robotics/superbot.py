@@ -7,6 +7,7 @@ from .ui import RobotUI
 from .vision import RobotVision
 from .navigation import RobotNavigation
 from .line_follower import LineFollower
+from .pose import PoseEstimator
 
 # What get_closest_distance() reports when no sensor gives a usable
 # reading. Deliberately larger than any real measurement, so code that
@@ -20,19 +21,32 @@ class SuperBot:
     # RobotGamepad.held() and RobotGamepad.pressed().
     TOUCH_NAMES = ('up', 'down', 'left', 'right', 'ok', 'cancel')
 
-    def __init__(self, alvik):
+    def __init__(self, alvik, profile=False):
         self.alvik = alvik
 
+        # With profile=True, each stage of building the robot prints how
+        # long it took -- here, and for the parts built later, the first
+        # time they are used. Kept either way in boot_ms, (stage, ms).
+        self.profile = profile
+        self.boot_ms = []
+        boot = start = time.ticks_ms()
+
         # --- NANO LED SETUP ---
         self.nano_led = NanoLED()
 
         # --- BUTTON INITIALIZATION ---
-        self.btn_up = Button(self.alvik.get_touch_up)
-        self.btn_down = Button(self.alvik.get_touch_down)
-        self.btn_left = Button(self.alvik.get_touch_left)
-        self.btn_right = Button(self.alvik.get_touch_right)
-        self.btn_ok = Button(self.alvik.get_touch_ok)
-        self.btn_cancel = Button(self.alvik.get_touch_cancel)
+        # Edges come from the presses the Alvik library counts as each
+        # touch packet arrives, where it has them; otherwise from polling.
+        # Only the factory library (init_bot/factory_alivk) counts them so
+        # far. The course's own, libs_on_github/arduino-alvik-mpy, has no
+        # get_touch_presses, so on course robots a tap between two polls
+        # is still missed.
+        self.btn_up = self._touch_button('up')
+        self.btn_down = self._touch_button('down')
+        self.btn_left = self._touch_button('left')
+        self.btn_right = self._touch_button('right')
+        self.btn_ok = self._touch_button('ok')
+        self.btn_cancel = self._touch_button('cancel')
 
         # Same six, reachable by name so students write sb.pressed('ok').
         self._touch = {
@@ -51,29 +65,117 @@ class SuperBot:
             'ok': self.alvik.get_touch_ok,
             'cancel': self.alvik.get_touch_cancel,
         }
+        self._stage('buttons', start)
+
+        # --- SUBMODULES, BUILT WHEN FIRST USED ---
+        # The I2C bus, ui (OLED splash and buzzer), nav, vision and line
+        # are properties below. RobotVision alone tries the HuskyLens
+        # three times half a second apart, and almost no robot in the
+        # class has one: building it here cost every boot 1.5 s before
+        # the first motor command.
+        self._bus = None
+        self._ui = None
+        self._nav = None
+        self._vision = None
+        self._line = None
+
+        start = time.ticks_ms()
+        self.pose = PoseEstimator(self.alvik)
+        self._stage('pose', start)
+
+        self._stage('init', boot)
+        print("SuperBot Init Complete.")
 
-        # 1. Setup Shared I2C Bus (Raw MicroPython object)
-        try:
-            self.shared_i2c = I2C(1, scl=Pin(12), sda=Pin(11), freq=400000)
-        except Exception as e:
-            self.shared_i2c = None
-            print(f"I2C Init Error: {e}")
-
-        # 2. Setup Qwiic Driver
-        self.qwiic_driver = None
-        if self.shared_i2c:
+    def _stage(self, name, start):
+        ms = time.ticks_diff(time.ticks_ms(), start)
+        self.boot_ms.append((name, ms))
+        if self.profile:
+            print("SuperBot %s: %d ms" % (name, ms))
+
+    def _connect_bus(self):
+        """(shared_i2c, qwiic_driver, i2c_devices), set up the first time
+        any is asked for. Each is None if it failed."""
+        if self._bus is None:
+            start = time.ticks_ms()
+            # 1. Setup Shared I2C Bus (Raw MicroPython object)
             try:
-                self.qwiic_driver = MicroPythonI2C(esp32_i2c=self.shared_i2c)
+                shared_i2c = I2C(1, scl=Pin(12), sda=Pin(11), freq=400000)
             except Exception as e:
-                print(f"Qwiic Driver Init Error: {e}")
+                shared_i2c = None
+                print(f"I2C Init Error: {e}")
+
+            # 2. Setup Qwiic Driver
+            qwiic_driver = None
+            if shared_i2c:
+                try:
+                    qwiic_driver = MicroPythonI2C(esp32_i2c=shared_i2c)
+                except Exception as e:
+                    print(f"Qwiic Driver Init Error: {e}")
+
+            # 3. One scan of the bus, a few ms. The screen, buzzer and
+            # HuskyLens are only set up if their address answered, instead
+            # of each being probed -- and the HuskyLens retried -- for
+            # nothing. Scanned afresh every boot and never saved: what is
+            # plugged in changes from one lesson to the next.
+            devices = None
+            if shared_i2c:
+                try:
+                    devices = set(shared_i2c.scan())
+                except Exception as e:
+                    print(f"I2C Scan Error: {e}")
+            self._bus = (shared_i2c, qwiic_driver, devices)
+            self._stage('i2c', start)
+        return self._bus
 
-        # --- INITIALIZE SUBMODULES ---
-        self.ui = RobotUI(self.shared_i2c, self.qwiic_driver)
-        self.nav = RobotNavigation(self.alvik, self.ui)
-        self.vision = RobotVision(self.qwiic_driver, self.ui, self.nav)
-        self.line = LineFollower(self.alvik)
+    @property
+    def shared_i2c(self):
+        return self._connect_bus()[0]
 
-        print("SuperBot Init Complete.")
+    @property
+    def qwiic_driver(self):
+        return self._connect_bus()[1]
+
+    @property
+    def i2c_devices(self):
+        """Addresses that answered the scan of the bus, or None if it
+        could not be scanned."""
+        return self._connect_bus()[2]
+
+    @property
+    def ui(self):
+        if self._ui is None:
+            shared_i2c, qwiic_driver, devices = self._connect_bus()
+            start = time.ticks_ms()
+            self._ui = RobotUI(shared_i2c, qwiic_driver, devices)
+            self._stage('ui', start)
+        return self._ui
+
+    @property
+    def nav(self):
+        if self._nav is None:
+            ui = self.ui
+            start = time.ticks_ms()
+            self._nav = RobotNavigation(self.alvik, ui)
+            self._stage('nav', start)
+        return self._nav
+
+    @property
+    def vision(self):
+        if self._vision is None:
+            shared_i2c, qwiic_driver, devices = self._connect_bus()
+            ui, nav = self.ui, self.nav
+            start = time.ticks_ms()
+            self._vision = RobotVision(qwiic_driver, ui, nav, devices)
+            self._stage('vision', start)
+        return self._vision
+
+    @property
+    def line(self):
+        if self._line is None:
+            start = time.ticks_ms()
+            self._line = LineFollower(self.alvik)
+            self._stage('line', start)
+        return self._line
 
     @staticmethod
     def closest_valid(readings):
@@ -104,19 +206,42 @@ class SuperBot:
         except Exception:
             return 0.0
 
+    def get_pose(self):
+        """Where the robot is: (x, y, theta) in cm and degrees, from the
+        wheels and the IMU together. theta does not wrap at 360.
+
+        Call it every loop; each call folds in the latest readings.
+        """
+        return self.pose.update()
+
+    def reset_pose(self, x=0.0, y=0.0, theta=0.0):
+        """Tell the robot where it is now."""
+        self.pose.reset(x, y, theta)
+
     def turn_to_heading(self, target_angle, tolerance=2.0, timeout=5):
-        self.nav.turn_to_heading(target_angle, self.get_yaw, tolerance, timeout)
+        """Turn to face target_angle on the compass. Returns how long the
+        turn took, in ms."""
+        return self.nav.turn_to_heading(target_angle, self.get_yaw, tolerance, timeout)
 
-    def follow_line(self, base_speed):
-        return self.line.follow(base_speed)
+    def follow_line(self, base_speed, recover=False):
+        return self.line.follow(base_speed, recover)
 
     @property
     def line_lost(self):
         return self.line.line_lost
 
+    @property
+    def line_recovering(self):
+        return self.line.recovering
+
     def reset_line(self):
         self.line.reset()
 
+    def _touch_button(self, name):
+        presses = getattr(self.alvik, 'get_touch_presses', None)
+        return Button(getattr(self.alvik, 'get_touch_' + name),
+                      (lambda: presses(name)) if presses else None)
+
     def _check(self, name):
         if name not in self._touch:
             raise ValueError(
@@ -161,4 +286,4 @@ class SuperBot:
         """
         self.ui.update_display(line1, line2, line3)
 
-print("Loaded superbot.py V03")
+print("Loaded superbot.py V05")
@@ -1,12 +1,16 @@
-from .peripherals import OLED, Buzzer
+from .peripherals import OLED, Buzzer, on_bus
 
 class RobotUI:
-    def __init__(self, i2c_driver, qwiic_driver):
+    def __init__(self, i2c_driver, qwiic_driver, devices=None):
         self.screen = None
         self.buzzer = None
-        
+
+        # devices: addresses that answered a scan of the bus (None = not
+        # scanned). Whatever did not answer stays None here and is never
+        # asked again.
+
         # Setup OLED
-        if i2c_driver:
+        if i2c_driver and on_bus(devices, OLED.ADDRESS):
             try:
                 self.screen = OLED(i2c_driver=i2c_driver)
                 self.screen.show_lines("SuperBot", "Online", "V60")
@@ -14,7 +18,7 @@ class RobotUI:
                 print(f"OLED Init Error: {e}")
                 
         # Setup Buzzer
-        if qwiic_driver:
+        if qwiic_driver and on_bus(devices, Buzzer.ADDRESS):
             try:
                 self.buzzer = Buzzer(i2c_driver=qwiic_driver)
                 if self.buzzer._buzzer and self.buzzer._buzzer.is_connected():
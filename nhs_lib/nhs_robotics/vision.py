@@ -2,6 +2,8 @@ import time
 import math
 from qwiic_huskylens import QwiicHuskylens
 
+from .peripherals import on_bus
+
 class ApproachVector:
     def __init__(self, angle, distance):
         self.angle = angle
@@ -9,13 +11,19 @@ class ApproachVector:
 
 class RobotVision:
     K_CONSTANT = 1624.0
+    HUSKYLENS_ADDRESS = 0x32    # as qwiic_huskylens
 
-    def __init__(self, qwiic_driver, ui, nav):
+    def __init__(self, qwiic_driver, ui, nav, devices=None):
         self.husky = None
         self.ui = ui
         self.nav = nav
-        
-        if qwiic_driver:
+
+        # devices: addresses that answered a scan of the bus (None = not
+        # scanned). Nothing at the HuskyLens's address means no HuskyLens,
+        # so the retries below -- a second and a half -- are skipped.
+        if qwiic_driver and not on_bus(devices, self.HUSKYLENS_ADDRESS):
+            self.ui.log_info("No HuskyLens")
+        elif qwiic_driver:
             attempts = 0
             success = False
             while attempts < 3 and not success:
@@ -0,0 +1,150 @@
+# Library: Page Server
+# Features: Non-blocking HTTP for the robot's web pages, pre-gzipped bodies
+#
+# Version: V01
+# Controller and WebGamepad both serve a page from inside the robot's main
+# loop. Reading the request and sending the page used to happen in one go,
+# blocking, so a phone loading the page held up the motors for as long as
+# the phone took -- up to the half-second socket timeout. Here every socket
+# is non-blocking: each poll() reads whatever requests have arrived and
+# sends at most one chunk to each phone still loading.
+#
+# Pages are gzipped on the laptop (init_bot/build_pages.py) and kept as one
+# bytes object, headers included, so serving one is slicing it.
+
+import time
+
+# Bytes sent to one phone per poll. One Wi-Fi frame's worth, about.
+CHUNK_SIZE = 1024
+
+# A request that has not finished arriving by then is dropped.
+REQUEST_MAX = 1024
+REQUEST_TIMEOUT_MS = 2000
+
+# errno for "would block" on a non-blocking socket.
+EAGAIN = 11
+
+NOT_FOUND = b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+
+
+def response(body, content_type="text/plain", encoding=None):
+    """A whole HTTP response, headers and body, as one bytes object."""
+    if isinstance(body, str):
+        body = body.encode()
+    head = "HTTP/1.1 200 OK\r\nContent-Type: %s\r\nContent-Length: %d\r\n" % (
+        content_type, len(body))
+    if encoding:
+        head += "Content-Encoding: %s\r\n" % encoding
+    head += "Cache-Control: no-cache\r\nConnection: close\r\n\r\n"
+    return head.encode() + body
+
+
+def load_page(path, content_type="text/html"):
+    """The response for the page at path: path + '.gz' if it was built,
+    served with Content-Encoding: gzip, or the plain file if not. None if
+    neither is there."""
+    try:
+        with open(path + ".gz", "rb") as f:
+            return response(f.read(), content_type, "gzip")
+    except OSError:
+        pass
+    try:
+        with open(path, "rb") as f:
+            return response(f.read(), content_type)
+    except OSError:
+        return None
+
+
+def request_path(request):
+    """The path of a GET request, as bytes, or None for anything else."""
+    if not request.startswith(b"GET "):
+        return None
+    end = request.find(b" ", 4)
+    if end < 0:
+        return None
+    return request[4:end]
+
+
+class PageServer:
+    """The HTTP connections a web page server has open, none of them ever
+    waited on. accept() hands one over; poll() does what can be done now."""
+
+    def __init__(self):
+        self._reading = []      # [socket, bytearray so far, accepted at]
+        self._writing = []      # [socket, memoryview of the response, sent]
+
+    def accept(self, cl):
+        cl.setblocking(False)
+        self._reading.append([cl, bytearray(), time.ticks_ms()])
+
+    def send(self, cl, data):
+        """Start streaming data to cl, then close it."""
+        self._writing.append([cl, memoryview(data), 0])
+
+    def busy(self):
+        return bool(self._reading or self._writing)
+
+    def poll(self, handle):
+        """Read requests and send one chunk to each phone loading a page.
+
+        A complete request goes to handle(cl, request), which returns the
+        response to stream back, or None if it has dealt with cl itself.
+        """
+        if self._reading:
+            self._poll_requests(handle)
+        if self._writing:
+            self._poll_responses()
+
+    def _poll_requests(self, handle):
+        now = time.ticks_ms()
+        for entry in self._reading[:]:
+            cl, request, since = entry
+            try:
+                data = cl.recv(REQUEST_MAX - len(request))
+            except OSError as e:
+                if e.args and e.args[0] == EAGAIN:
+                    data = None
+                else:
+                    data = b""
+            if data:
+                request.extend(data)
+            if data == b"" or time.ticks_diff(now, since) > REQUEST_TIMEOUT_MS:
+                self._reading.remove(entry)
+                self._close(cl)
+                continue
+            if b"\r\n\r\n" in request or len(request) >= REQUEST_MAX:
+                self._reading.remove(entry)
+                reply = handle(cl, bytes(request))
+                if reply is not None:
+                    self.send(cl, reply)
+
+    def _poll_responses(self):
+        for entry in self._writing[:]:
+            cl, data, sent = entry
+            try:
+                n = cl.send(data[sent:sent + CHUNK_SIZE])
+            except OSError as e:
+                if e.args and e.args[0] == EAGAIN:
+                    continue
+                n = None
+            if n is None:
+                self._writing.remove(entry)
+                self._close(cl)
+                continue
+            sent += n
+            entry[2] = sent
+            if sent >= len(data):
+                self._writing.remove(entry)
+                self._close(cl)
+
+    def close_all(self):
+        for cl, _, _ in self._reading + self._writing:
+            self._close(cl)
+        self._reading = []
+        self._writing = []
+
+    def _close(self, cl):
+        try:
+            cl.close()
+        except OSError:
+            pass
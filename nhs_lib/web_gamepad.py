@@ -1,12 +1,35 @@
+# Library: Web Gamepad
+# Features: get_axis()/is_pressed() over Controller's WebSocket, or plain HTTP
+#
+# Version: V04
+# PERF: The page is pre-gzipped (init_bot/build_pages.py) and streamed by
+#       page_server a chunk per update(), and requests are read without
+#       blocking and parsed as bytes, not searched for in str(request).
+# NEW: V03 rides on Controller's persistent WebSocket by default: no TCP
+#      accept, parse and close per state, so the rate is the phone's, not
+#      lwIP's. transport="http" keeps the V02 one-GET-per-state link, and
+#      stats() reports packet rate, latency and update() time for both, so
+#      they can be compared.
+# FIX: V04 serves web_gamepad.html over the WebSocket too, not Controller's
+#      page. The page opens /ws where the robot has it and sends
+#      Controller's 32-byte packet; where it has not, it falls back to GETs.
+
 import network
 import socket
 import time
-from arduino_alvik import ArduinoAlvik
+from page_server import PageServer, load_page, request_path, response, NOT_FOUND
+
+DATA_OK = b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+
+TRANSPORTS = ("ws", "http")
 
 class WebGamepad:
-    def __init__(self, ssid="Alvik-RC", password="password123"):
+    def __init__(self, ssid="Alvik-RC", password="password123", transport="ws"):
+        if transport not in TRANSPORTS:
+            raise ValueError(f"transport must be one of {TRANSPORTS}")
         self.ssid = ssid
         self.password = password
+        self.transport = transport
         self.ip_address = "0.0.0.0"
         
         # --- Controller State ---
@@ -33,10 +56,31 @@ class WebGamepad:
         self.BTN_LEFT = 14
         self.BTN_RIGHT = 15
 
+        self.reset_stats()
+
         # --- Setup Networking ---
+        if transport == "ws":
+            # Controller brings up the AP, serves web_gamepad.html and owns
+            # the socket; this class just reads the state out of it.
+            from controller import Controller
+            self._link = Controller(ssid, password, page="web_gamepad.html")
+            self.ip_address = self._link.ap.ifconfig()[0]
+            return
+        self._link = None
+        self.pages = PageServer()
+        self._load_page()
         self._setup_wifi()
         self._setup_server()
 
+    def _load_page(self):
+        try:
+            base_path = __file__.rsplit('/', 1)[0]
+            file_path = f"{base_path}/web_gamepad.html"
+        except:
+            file_path = "web_gamepad.html"
+        self._page = load_page(file_path) or response(
+            "<h1>Error: web_gamepad.html missing. Check /lib folder!</h1>", "text/html")
+
     def _setup_wifi(self):
         # Only set up WiFi if we aren't already connected
         self.ap = network.WLAN(network.AP_IF)
@@ -66,53 +110,133 @@ class WebGamepad:
         """
         Call this in your main loop! 
         It checks for new data from the phone/computer.
+        Never waits on the phone: a page load is sent a chunk per call.
         """
-        try:
-            conn, addr = self.socket.accept()
-            request = conn.recv(1024)
-            req_str = str(request)
-
-            # 1. Serve the Interface
-            if "GET / " in req_str or "GET /index" in req_str:
-                self._send_html(conn)
-            
-            # 2. Process Data Packet
-            # Format: GET /data?ax=0,0,0,0&btn=12
-            elif "GET /data" in req_str:
-                self._parse_data(req_str)
-                conn.send('HTTP/1.1 200 OK\n\n')
-            
-            conn.close()
-        except OSError:
-            pass # No new connection
-        except Exception as e:
-            print(f"Net Error: {e}")
-
-    def _parse_data(self, req_str):
+        start = time.ticks_us()
+        if self._link:
+            self._read_link()
+        else:
+            try:
+                conn, addr = self.socket.accept()
+                self.pages.accept(conn)
+            except OSError:
+                pass # No new connection
+            try:
+                self.pages.poll(self._handle_request)
+            except Exception as e:
+                print(f"Net Error: {e}")
+        took = time.ticks_diff(time.ticks_us(), start)
+        self._updates += 1
+        self._update_total_us += took
+        if took > self._update_max_us:
+            self._update_max_us = took
+
+    def _read_link(self):
+        """Copy the Controller's newest state into the V02 attributes. Its
+        page sends Y up as positive; this API always had up as negative."""
+        link = self._link
+        link.update()
+        axes = self.axes
+        axes[0] = round(link.left_x * 100)
+        axes[1] = -round(link.left_y * 100)
+        axes[2] = round(link.right_x * 100)
+        axes[3] = -round(link.right_y * 100)
+        self.buttons = link.button_mask
+
+    def reset_stats(self):
+        self.packets = 0
+        self._stats_since = time.ticks_ms()
+        self._updates = 0
+        self._update_total_us = 0
+        self._update_max_us = 0
+        # The HTTP link's latency, measured as Controller measures its own
+        self.latency_ms = None
+        self._latency_total = 0
+        self._latency_count = 0
+        self._latency_max = 0
+        self._min_offset = None
+        if getattr(self, "_link", None):
+            self._link.reset_stats()
+
+    def stats(self):
+        """How this transport is doing since the last reset_stats():
+        states received and their rate, latency as Controller.stats()
+        defines it, and how long update() takes."""
+        if self._link:
+            link = self._link.stats()
+            packets = link['packets']
+            latency = (link['latency_ms'], link['latency_avg_ms'], link['latency_max_ms'])
+        else:
+            count = self._latency_count
+            packets = self.packets
+            latency = (self.latency_ms,
+                       self._latency_total / count if count else None,
+                       self._latency_max if count else None)
+        elapsed = time.ticks_diff(time.ticks_ms(), self._stats_since)
+        updates = self._updates
+        return {
+            'transport': self.transport,
+            'packets': packets,
+            'rate_hz': packets * 1000 / elapsed if elapsed > 0 else 0.0,
+            'latency_ms': latency[0],
+            'latency_avg_ms': latency[1],
+            'latency_max_ms': latency[2],
+            'update_us_avg': self._update_total_us / updates if updates else None,
+            'update_us_max': self._update_max_us if updates else None,
+        }
+
+    def _handle_request(self, conn, request):
+        path = request_path(request)
+        if path is None:
+            return NOT_FOUND
+
+        # 1. Serve the Interface
+        if path == b"/" or path.startswith(b"/index"):
+            return self._page
+
+        # 2. Process Data Packet
+        # Format: GET /data?ax=0,0,0,0&btn=12
+        if path.startswith(b"/data"):
+            self._parse_data(path)
+            self.packets += 1
+            return DATA_OK
+
+        return NOT_FOUND
+
+    def _parse_data(self, path):
         try:
             # Extract "ax=0,0,0,0&btn=12"
-            if '?' in req_str and ' ' in req_str:
-                parts = req_str.split(' ')[1].split('?')[1]
-                pairs = parts.split('&')
-                
-                for p in pairs:
-                    key, val = p.split('=')
-                    
-                    if key == 'ax':
-                        # val is "0,0,0,0"
-                        ax_vals = val.split(',')
-                        for i in range(4):
-                            self.axes[i] = int(ax_vals[i])
-                            
-                    if key == 'btn':
-                        self.buttons = int(val)
-                    
+            query = path.find(b"?")
+            if query < 0:
+                return
+            for p in path[query + 1:].decode().split("&"):
+                key, val = p.split("=")
+
+                if key == "ax":
+                    # val is "0,0,0,0"
+                    ax_vals = val.split(",")
+                    for i in range(4):
+                        self.axes[i] = int(ax_vals[i])
+
+                if key == "btn":
+                    self.buttons = int(val)
+
+                if key == "t":
+                    # The page's clock, 30-bit ms like ticks_ms()
+                    self._record_latency(time.ticks_diff(time.ticks_ms(), int(val)))
+
         except Exception:
             pass
 
-    def _send_html(self, conn):
-        conn.send('HTTP/1.1 200 OK\nContent-Type: text/html\nConnection: close\n\n')
-        conn.sendall(self.HTML_CODE)
+    def _record_latency(self, offset):
+        if self._min_offset is None or offset < self._min_offset:
+            self._min_offset = offset
+        latency = offset - self._min_offset
+        self.latency_ms = latency
+        self._latency_total += latency
+        self._latency_count += 1
+        if latency > self._latency_max:
+            self._latency_max = latency
 
     # --- Student Methods ---
 
@@ -126,68 +250,3 @@ class WebGamepad:
         """Returns True if the button is held down"""
         mask = 1 << button_index
         return (self.buttons & mask) > 0
-
-    # The secret sauce: Full Gamepad JS Interface
-    HTML_CODE = """
-<!DOCTYPE html>
-<html>
-<head>
-<meta name="viewport" content="width=device-width, initial-scale=1, user-scalable=no">
-<style>
-body { background: #111; color: #eee; font-family: sans-serif; text-align: center; touch-action: none; }
-.box { border: 1px solid #444; padding: 20px; margin: 10px; border-radius: 10px;}
-h1 { color: #0f0; }
-</style>
-</head>
-<body>
-<h1>Alvik Connected</h1>
-<div class="box">
-    Status: <span id="stat">Waiting...</span><br>
-    <small>Press any button to wake controller</small>
-</div>
-<div class="box" id="debug">No Data</div>
-
-<script>
-let lastQuery = "";
-
-function loop() {
-    const gps = navigator.getGamepads();
-    const gp = gps[0];
-    
-    if(gp) {
-        document.getElementById("stat").innerText = gp.id;
-        
-        // 1. Read Axes (Standard Layout)
-        // 0: Left X, 1: Left Y, 2: Right X, 3: Right Y
-        let ax = [];
-        for(let i=0; i<4; i++) {
-            // Scale -1.0 -> 1.0 to -100 -> 100
-            let val = Math.round(gp.axes[i] * 100);
-            if(Math.abs(val) < 10) val = 0; // Deadzone
-            ax.push(val);
-        }
-        
-        // 2. Read Buttons (Bitmask)
-        let btnMask = 0;
-        for(let i=0; i<16; i++) {
-            if(gp.buttons[i] && gp.buttons[i].pressed) {
-                btnMask |= (1 << i);
-            }
-        }
-        
-        // 3. Send if changed
-        let query = "ax=" + ax.join(",") + "&btn=" + btnMask;
-        
-        if(query !== lastQuery) {
-            document.getElementById("debug").innerText = query;
-            fetch("/data?" + query).catch(e=>{});
-            lastQuery = query;
-        }
-    }
-    requestAnimationFrame(loop);
-}
-loop();
-</script>
-</body>
-</html>
-"""
\ No newline at end of file
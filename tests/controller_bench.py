@@ -0,0 +1,333 @@
+# tests/controller_bench.py -- Controller under load, on a laptop. V01
+#
+#     python3 tests/controller_bench.py [--clients N] [--rate HZ] [--jitter MS]
+#                                       [--seconds S] [--loop HZ] [--format F]
+#
+# The teleop path -- phone, Wi-Fi, WebSocket, Controller.update() -- could
+# only be measured by driving a robot. This runs the real nhs_lib/controller.py
+# in CPython against real localhost sockets: network, machine and ubinascii
+# are stubbed, time gets MicroPython's ticks, and everything else is the code
+# the robot runs. Synthetic phones do the HTTP upgrade and send gamepad frames
+# at a set rate with jitter, while a stand-in robot loop calls update() at its
+# own rate, and the report says what the robot would see:
+#
+#   states/s     packets decoded and applied, per second
+#   cpu/frame    CPU time in the update()s that got frames, per frame
+#   queue depth  frames waiting at each update(), mean and worst
+#   worst        the longest single update(), the stall the motors feel
+#
+# Controller drives from one phone at a time; a newer WebSocket replaces the
+# older one. With --clients above 1 every phone keeps reconnecting the way
+# controller.html does, 2 s after it was dropped, and the report counts the
+# takeovers. That is a classroom with several phones on one robot's AP.
+#
+# CPython is not an ESP32: absolute times are far smaller here. What carries
+# over is the shape -- queue depth, drops, the stall against the frame rate --
+# and a change that makes any of them worse. test_controller_under_load in
+# regression_host.py runs a short bench and fails on that.
+
+import importlib.util
+import os
+import random
+import socket
+import struct
+import sys
+import threading
+import time
+import types
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+NHS_LIB = os.path.join(os.path.dirname(HERE), "nhs_lib")
+
+RECONNECT_S = 2.0           # controller.html's retry after onclose
+
+
+# --- the robot side ----------------------------------------------------------
+
+class Ticks:
+    """MicroPython's time module, as much of it as nhs_lib uses. Ticks wrap
+    at 2**30 the way the ESP32's do."""
+
+    PERIOD = 1 << 30
+
+    def ticks_ms(self):
+        return int(time.monotonic() * 1000) % self.PERIOD
+
+    def ticks_us(self):
+        return int(time.monotonic() * 1000000) % self.PERIOD
+
+    def ticks_diff(self, later, earlier):
+        half = self.PERIOD // 2
+        return (later - earlier + half) % self.PERIOD - half
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def sleep_ms(self, ms):
+        time.sleep(ms / 1000.0)
+
+
+class _Wlan:
+    """An access point that is always up, at the loopback address."""
+
+    def __init__(self, interface):
+        self._active = False
+
+    def active(self, *state):
+        if state:
+            self._active = state[0]
+        return self._active
+
+    def config(self, **settings):
+        pass
+
+    def ifconfig(self):
+        return ("127.0.0.1", "255.255.255.0", "127.0.0.1", "127.0.0.1")
+
+
+def _stub_modules():
+    network = types.ModuleType("network")
+    network.AP_IF = 1
+    network.STA_IF = 0
+    network.WLAN = _Wlan
+    machine = types.ModuleType("machine")
+    import binascii
+    ubinascii = types.ModuleType("ubinascii")
+    ubinascii.__dict__.update(binascii.__dict__)
+    for module in (network, machine, ubinascii):
+        sys.modules.setdefault(module.__name__, module)
+    if NHS_LIB not in sys.path:
+        sys.path.insert(0, NHS_LIB)
+    return network
+
+
+def load_controller():
+    """nhs_lib/controller.py, loaded by path with ticks for its time, and
+    this file's access point even if another harness stubbed network first."""
+    network = _stub_modules()
+    spec = importlib.util.spec_from_file_location(
+        "_bench_controller", os.path.join(NHS_LIB, "controller.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.network = network
+    module.time = Ticks()
+    sys.modules["page_server"].time = module.time
+    return module
+
+
+def _free_port():
+    probe = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    probe.bind(("127.0.0.1", 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    return port
+
+
+# --- the phone side ----------------------------------------------------------
+
+def _masked(payload, opcode=2):
+    """One client-to-server WebSocket frame, masked as a browser masks it."""
+    mask = os.urandom(4)
+    frame = bytearray((0x80 | opcode, 0x80 | len(payload)))
+    frame += mask
+    frame += bytes(b ^ mask[i & 3] for i, b in enumerate(payload))
+    return bytes(frame)
+
+
+def _clock():
+    return int(time.monotonic() * 1000) & 0x3FFFFFFF
+
+
+class Phone(threading.Thread):
+    """One synthetic phone: upgrades to a WebSocket, then sends a moving
+    left stick at rate_hz, each gap drawn from +-jitter_ms. format is
+    'compact' (V13 frames, a full one a second, deltas between), 'stamped'
+    (32 bytes) or 'plain' (28 bytes)."""
+
+    def __init__(self, port, rate_hz, jitter_ms, format, stop, seed):
+        super().__init__(daemon=True)
+        self.port = port
+        self.rate_hz = rate_hz
+        self.jitter_ms = jitter_ms
+        self.format = format
+        self.stop = stop
+        self.random = random.Random(seed)
+        self.sent = 0
+        self.connects = 0
+        self.dropped_by_robot = 0
+        self.echoes = 0
+
+    def run(self):
+        while not self.stop.is_set():
+            try:
+                self._session()
+            except OSError:
+                self.dropped_by_robot += 1
+            self.stop.wait(RECONNECT_S)
+
+    def _connect(self):
+        sock = socket.create_connection(("127.0.0.1", self.port), timeout=2)
+        sock.sendall(b"GET /ws HTTP/1.1\r\nHost: 127.0.0.1\r\nUpgrade: websocket\r\n"
+                     b"Connection: Upgrade\r\n"
+                     b"Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n"
+                     b"Sec-WebSocket-Version: 13\r\n\r\n")
+        reply = b""
+        while b"\r\n\r\n" not in reply:
+            chunk = sock.recv(256)
+            if not chunk:
+                raise OSError("closed during the handshake")
+            reply += chunk
+        if not reply.startswith(b"HTTP/1.1 101"):
+            raise OSError("no upgrade: %r" % reply[:40])
+        sock.setblocking(False)
+        self.connects += 1
+        return sock
+
+    def _session(self):
+        sock = self._connect()
+        period = 1.0 / self.rate_hz
+        next_send = time.monotonic()
+        last_full = 0.0
+        step = 0
+        try:
+            while not self.stop.is_set():
+                now = time.monotonic()
+                if now >= next_send:
+                    step += 1
+                    full = now - last_full >= 1.0
+                    if full:
+                        last_full = now
+                    sock.sendall(_masked(self._packet(step, full)))
+                    self.sent += 1
+                    gap = period + self.random.uniform(-self.jitter_ms, self.jitter_ms) / 1000.0
+                    next_send += max(0.0, gap)
+                self._drain(sock)
+                time.sleep(min(0.002, max(0.0, next_send - time.monotonic())))
+        finally:
+            sock.close()
+
+    def _packet(self, step, full):
+        x = ((step % 200) - 100) / 100.0
+        if self.format == "plain":
+            return struct.pack("<ffffffI", x, 0, 0, 0, 0, 0, 0)
+        if self.format == "stamped":
+            return struct.pack("<ffffffII", x, 0, 0, 0, 0, 0, 0, _clock())
+        stick = struct.pack("<h", int(round(x * 32767)))
+        echo = 0x80 if step % 10 == 0 else 0
+        if full:
+            return (struct.pack("<BBI", 0x20, 0x7F | echo, _clock()) + stick
+                    + bytes(10) + bytes(3))
+        return struct.pack("<BBI", 0x21, 0x01 | echo, _clock()) + stick
+
+    def _drain(self, sock):
+        """Read what the robot sent back: HELLO and echoes, or the close."""
+        try:
+            data = sock.recv(4096)
+        except BlockingIOError:
+            return
+        if not data:
+            raise OSError("closed by the robot")
+        self.echoes += data.count(b"\x82\x04")
+
+
+# --- the run -----------------------------------------------------------------
+
+def run(clients=1, rate_hz=60, jitter_ms=5, seconds=2.0, loop_hz=100,
+        format="compact", seed=1):
+    """Drive a real Controller for `seconds` and return what it saw."""
+    module = load_controller()
+    module.Controller._instance = None
+    port = _free_port()
+    controller = module.Controller(ssid="Alvik-Bench", port=port)
+
+    stop = threading.Event()
+    phones = [Phone(port, rate_hz, jitter_ms, format, stop, seed + i)
+              for i in range(clients)]
+    for phone in phones:
+        phone.start()
+
+    loop_period = 1.0 / loop_hz
+    durations = []
+    depths = []
+    cpu = 0.0
+    start = time.monotonic()
+    try:
+        while time.monotonic() - start < seconds:
+            before_packets = controller.packets
+            wall = time.perf_counter()
+            thread_cpu = time.thread_time()
+            controller.update()
+            used = time.thread_time() - thread_cpu
+            durations.append(time.perf_counter() - wall)
+            if controller.packets > before_packets:
+                cpu += used
+            if controller.ws_client:
+                depths.append(controller.packets - before_packets)
+            # The rest of the robot's loop: motors, sensors, sleep
+            time.sleep(max(0.0, loop_period - (time.perf_counter() - wall)))
+    finally:
+        stop.set()
+        for phone in phones:
+            phone.join(timeout=RECONNECT_S + 1)
+        controller._close_ws()
+        controller.pages.close_all()
+        controller.server_socket.close()
+        module.Controller._instance = None
+
+    elapsed = time.monotonic() - start
+    stats = controller.stats()
+    applied = stats["packets"] - stats["dropped"]
+    return {
+        "clients": clients,
+        "format": format,
+        "sent": sum(phone.sent for phone in phones),
+        "received": stats["packets"],
+        "dropped": stats["dropped"],
+        "states_per_s": applied / elapsed,
+        "cpu_us_per_frame": cpu * 1e6 / stats["packets"] if stats["packets"] else None,
+        "queue_mean": sum(depths) / len(depths) if depths else 0.0,
+        "queue_max": max(depths) if depths else 0,
+        "update_worst_ms": max(durations) * 1000 if durations else 0.0,
+        "update_mean_ms": sum(durations) * 1000 / len(durations) if durations else 0.0,
+        "updates": len(durations),
+        "latency_max_ms": stats["latency_max_ms"],
+        "connects": sum(phone.connects for phone in phones),
+        "echoes": sum(phone.echoes for phone in phones),
+    }
+
+
+def report(result):
+    cpu = result["cpu_us_per_frame"]
+    lines = [
+        "%d phone(s), %s frames: sent %d, robot received %d, dropped %d as stale" % (
+            result["clients"], result["format"], result["sent"], result["received"],
+            result["dropped"]),
+        "  states/s     %.1f" % result["states_per_s"],
+        "  cpu/frame    %s" % ("%.1f us" % cpu if cpu is not None else "-"),
+        "  queue depth  %.2f mean, %d worst (frames per update)" % (
+            result["queue_mean"], result["queue_max"]),
+        "  update()     %.3f ms mean, %.3f ms worst over %d calls" % (
+            result["update_mean_ms"], result["update_worst_ms"], result["updates"]),
+        "  connects     %d, echoes %d, latency max %s ms" % (
+            result["connects"], result["echoes"], result["latency_max_ms"]),
+    ]
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Load-test Controller on this laptop.")
+    parser.add_argument("--clients", type=int, default=1)
+    parser.add_argument("--rate", type=float, default=60, help="frames/s per phone")
+    parser.add_argument("--jitter", type=float, default=5, help="+- ms on each gap")
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--loop", type=float, default=100, help="robot loop, Hz")
+    parser.add_argument("--format", choices=("compact", "stamped", "plain"),
+                        default="compact")
+    args = parser.parse_args(argv)
+    print(report(run(args.clients, args.rate, args.jitter, args.seconds, args.loop,
+                     args.format)))
+
+
+if __name__ == "__main__":
+    main()
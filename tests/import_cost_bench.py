@@ -0,0 +1,242 @@
+# tests/import_cost_bench.py -- what importing nhs_robotics costs. V01
+#
+#     python3 tests/import_cost_bench.py [module ...]      on a laptop
+#     mpremote run tests/import_cost_bench.py              on a robot
+#
+# Every student program starts with `from nhs_robotics import SuperBot`,
+# and that pulls in vision, navigation, the UI, the peripherals and line
+# following whether the program uses them or not; gamepad.py pulls in
+# controller. Nothing said what each of those costs. This imports the
+# module (nhs_robotics if none is named) with builtins.__import__ wrapped,
+# and reports every module that import pulled in, nested under whatever
+# imported it:
+#
+#   ms, bytes            the import, and everything imported beneath it
+#   self ms, self bytes  the module's own share, without those
+#
+# and then the costliest on their own -- the first places to look when
+# deciding what SuperBot should import only when it is used.
+#
+# On the robot, time is ticks_us() and bytes are gc.mem_alloc(), with the
+# collector held off so a collection halfway through does not show up as
+# an import that freed memory. Run it straight after a reset: a module
+# already imported costs nothing. Bytes there are everything allocated,
+# garbage included; "kept" at the end is what was still live after a
+# collection.
+#
+# On a laptop, bytes come from tracemalloc and the MicroPython-only
+# modules (machine, network and friends), and any library that is not
+# checked out, are stubbed and marked as such. CPython is not an ESP32 --
+# it compiles faster and its objects are bigger -- so what carries over is
+# the ranking, not the numbers. `from . import x` may not be seen on its
+# own, in which case x is counted in whatever imported it.
+
+import gc
+import sys
+import time
+
+try:
+    import builtins
+except ImportError:                                  # pragma: no cover
+    import ubuiltins as builtins
+
+ON_ROBOT = sys.implementation.name == "micropython"
+
+# Only the robot has these; the laptop gets stand-ins.
+MICROPYTHON_ONLY = ("machine", "network", "micropython", "framebuf",
+                    "ubinascii", "esp32", "neopixel", "bluetooth")
+
+TOP = 5     # how many of the costliest on their own to list
+
+if ON_ROBOT:
+    def _clock_us():
+        return time.ticks_us()
+
+    def _since_us(start):
+        return time.ticks_diff(time.ticks_us(), start)
+
+    def _heap():
+        return gc.mem_alloc()
+else:
+    import tracemalloc
+
+    def _clock_us():
+        return time.perf_counter_ns() // 1000
+
+    def _since_us(start):
+        return _clock_us() - start
+
+    def _heap():
+        return tracemalloc.get_traced_memory()[0]
+
+
+# --- laptop stand-ins --------------------------------------------------------
+
+STUBBED = []
+
+
+def _install_stubs():
+    """Stand-ins for whatever cannot be found: the MicroPython-only
+    modules, and libraries from submodules that are not checked out.
+    Appended to the finders, so anything real is always found first."""
+    import importlib.abc
+    import importlib.machinery
+    import os
+    import types
+
+    class _Stub(types.ModuleType):
+        def __getattr__(self, name):
+            if name.startswith("__"):
+                raise AttributeError(name)
+            return type(name, (), {"__init__": lambda self, *a, **k: None})
+
+    class _StubLoader(importlib.abc.Loader):
+        def create_module(self, spec):
+            module = _Stub(spec.name)
+            module.__path__ = []        # so dotted names under it stub too
+            return module
+
+        def exec_module(self, module):
+            STUBBED.append(module.__name__)
+
+    class _StubFinder(importlib.abc.MetaPathFinder):
+        def find_spec(self, name, path=None, target=None):
+            return importlib.machinery.ModuleSpec(name, _StubLoader())
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    nhs_lib = os.path.join(os.path.dirname(here), "nhs_lib")
+    if nhs_lib not in sys.path:
+        sys.path.insert(0, nhs_lib)
+    for name in MICROPYTHON_ONLY:
+        if name not in sys.modules:
+            sys.modules[name] = _StubLoader().create_module(
+                importlib.machinery.ModuleSpec(name, None))
+            STUBBED.append(name)
+    if not any(type(f).__name__ == "_StubFinder" for f in sys.meta_path):
+        sys.meta_path.append(_StubFinder())
+
+
+# --- the profile -------------------------------------------------------------
+
+def _name(name, fromlist, level, module):
+    """The full name of what an import statement imported. MicroPython
+    does not hand __import__ the importer's globals, so a relative name is
+    read back off the module it returned: the module itself for
+    `from .x import y`, the package for `from . import x`."""
+    if not level:
+        return name
+    if name:
+        return module.__name__
+    return "%s.%s" % (module.__name__, ",".join(fromlist))
+
+
+def profile(module="nhs_robotics"):
+    """Import module, timing everything it pulls in. Returns rows of
+    (name, depth, us, bytes, self_us, self_bytes) in the order the imports
+    finished, each module after the ones it imported."""
+    rows = []
+    # One frame per import in progress: the time and bytes of the imports
+    # it has finished beneath it so far.
+    stack = [[0, 0]]
+    real = builtins.__import__
+
+    def timed(name, globals=None, locals=None, fromlist=(), level=0):
+        known = len(sys.modules)
+        stack.append([0, 0])
+        heap = _heap()
+        start = _clock_us()
+        module = None
+        try:
+            module = real(name, globals, locals, fromlist, level)
+            return module
+        finally:
+            us = _since_us(start)
+            grew = _heap() - heap
+            below_us, below_bytes = stack.pop()
+            # Already imported, nothing to count: the importer keeps the
+            # lookup in its own share.
+            if len(sys.modules) > known:
+                rows.append((_name(name, fromlist or (), level, module),
+                             len(stack) - 1, us, grew,
+                             us - below_us, grew - below_bytes))
+                stack[-1][0] += us
+                stack[-1][1] += grew
+
+    if not ON_ROBOT:
+        _install_stubs()
+        tracemalloc.start()
+    gc.collect()
+    gc.disable()
+    builtins.__import__ = timed
+    try:
+        __import__(module)
+    finally:
+        builtins.__import__ = real
+        gc.enable()
+        if not ON_ROBOT:
+            tracemalloc.stop()
+    return rows
+
+
+def kept():
+    """Bytes still live after a collection, for the summary line."""
+    gc.collect()
+    if ON_ROBOT:
+        return gc.mem_alloc()
+    return None
+
+
+def _tree(rows):
+    """Rows in reading order: each module above the ones it imported."""
+    ordered = []
+    pending = []
+    for row in rows:
+        # A row finishes after its children, which sit deeper just before it
+        children = []
+        while pending and pending[-1][1] > row[1]:
+            children.insert(0, pending.pop())
+        pending.append((row[0], row[1], row, children))
+
+    def walk(items):
+        for name, depth, row, children in items:
+            ordered.append(row)
+            walk(children)
+    walk(pending)
+    return ordered
+
+
+def report(module, rows, live=None):
+    total_us = sum(row[2] for row in rows if row[1] == 0)
+    total_bytes = sum(row[3] for row in rows if row[1] == 0)
+    lines = ["import %s: %.1f ms, %d bytes, %d modules%s" % (
+        module, total_us / 1000.0, total_bytes, len(rows),
+        "" if live is None else ", %d bytes kept" % live)]
+    lines.append("  %-38s %8s %8s %9s %9s" % (
+        "module", "ms", "self ms", "bytes", "self"))
+    for name, depth, us, grew, self_us, self_bytes in _tree(rows):
+        label = "  " * depth + name + (" (stub)" if name in STUBBED else "")
+        lines.append("  %-38s %8.1f %8.1f %9d %9d" % (
+            label, us / 1000.0, self_us / 1000.0, grew, self_bytes))
+    costly = sorted((row for row in rows if row[0] not in STUBBED),
+                    key=lambda row: -row[4])[:TOP]
+    lines.append("Costliest on their own:")
+    for name, depth, us, grew, self_us, self_bytes in costly:
+        lines.append("  %-38s %8.1f ms %9d bytes" % (
+            name, self_us / 1000.0, self_bytes))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    if argv is None:
+        argv = getattr(sys, "argv", [])[1:]
+    modules = argv or ["nhs_robotics"]
+    for module in modules:
+        if module in sys.modules:
+            print("%s is already imported: reset the robot first" % module)
+            continue
+        rows = profile(module)
+        print(report(module, rows, kept()))
+
+
+if __name__ == "__main__":
+    main()
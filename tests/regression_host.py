@@ -1,4 +1,4 @@
-"""Tests for nhs_lib that need no hardware. V04
+"""Tests for nhs_lib that need no hardware. V22
 
 Same (status, message) contract as the other regression_*.py modules, so
 RegressionRunner reports them the same way:
@@ -13,6 +13,7 @@ Off the robot, the MicroPython-only modules do not exist, so they are stubbed
 below. On the robot the real ones are already imported and nothing is faked.
 """
 
+import math
 import sys
 
 
@@ -34,7 +35,7 @@ def _stub_micropython_modules():
         def __getattr__(self, name):
             return type(name, (), {"__init__": lambda self, *a, **k: None})
 
-    for name in ("machine", "ubinascii", "ssd1306", "qwiic_buzzer",
+    for name in ("machine", "network", "ubinascii", "ssd1306", "qwiic_buzzer",
                  "qwiic_huskylens", "qwiic_i2c", "qwiic_i2c.micropython_i2c",
                  "controller"):
         sys.modules.setdefault(name, _Stub(name))
@@ -68,12 +69,24 @@ class FakeAlvik:
             ("up", "down", "left", "right", "ok", "cancel"), False)
 
     def __getattr__(self, name):
-        if name.startswith("get_touch_"):
-            pad = name[len("get_touch_"):]
+        pad = name[len("get_touch_"):]
+        if name.startswith("get_touch_") and pad in self.touch:
             return lambda: self.touch[pad]
         raise AttributeError(name)
 
 
+class _RecordingUI:
+    def __init__(self):
+        self.infos = []
+        self.errors = []
+
+    def log_info(self, *args, sep=' '):
+        self.infos.append(sep.join(str(a) for a in args))
+
+    def log_error(self, *args, sep=' '):
+        self.errors.append(sep.join(str(a) for a in args))
+
+
 class FakeController:
     def __init__(self):
         self.left_x = self.left_y = self.right_x = self.right_y = 0.0
@@ -115,6 +128,55 @@ def _bare_gamepad():
     return gp
 
 
+def test_superbot_builds_the_camera_only_when_asked():
+    """SuperBot() used to build RobotVision, which tries the HuskyLens
+    three times half a second apart: 1.5 s of every boot on a robot
+    without one, which is nearly every robot. Now the I2C bus, ui, nav,
+    vision and line are built the first time something asks for them,
+    once, and boot_ms says what each took.
+
+    The NanoLED, RobotUI and RobotVision classes are patched out, so this
+    draws nothing and asks no camera on the robot, and needs no pins and
+    does not sleep on a laptop.
+    """
+    from nhs_robotics import superbot
+    if not hasattr(superbot.time, "ticks_ms"):
+        superbot.time = _Ticks()
+    built = []
+
+    class _Part:
+        def __init__(self, *args):
+            built.append(type(self).__name__)
+
+    class _Vision(_Part):
+        pass
+
+    class _UI(_Part):
+        pass
+
+    real = (superbot.NanoLED, superbot.RobotUI, superbot.RobotVision)
+    superbot.NanoLED, superbot.RobotUI, superbot.RobotVision = _Part, _UI, _Vision
+    try:
+        sb = SuperBot(FakeAlvik())
+        stages = [name for name, ms in sb.boot_ms]
+        early = [name for name in ("i2c", "ui", "nav", "vision", "line")
+                 if name in stages]
+        if early or "_Vision" in built or "_UI" in built:
+            return 0, "SuperBot() built %s before anything asked" % early
+        if sb.vision is not sb.vision or built.count("_Vision") != 1:
+            return 0, "RobotVision built %d times for two asks" % built.count("_Vision")
+        if sb.line is not sb.line:
+            return 0, "a new LineFollower for every ask"
+        stages = [name for name, ms in sb.boot_ms]
+        for name in ("i2c", "ui", "nav", "vision", "line"):
+            if stages.count(name) != 1:
+                return 0, "%s built %d times, boot_ms %s" % (
+                    name, stages.count(name), stages)
+    finally:
+        superbot.NanoLED, superbot.RobotUI, superbot.RobotVision = real
+    return 1, ""
+
+
 def test_missing_huskylens_is_not_an_error():
     """A robot with no HuskyLens is the normal case in this class.
 
@@ -135,17 +197,6 @@ def test_missing_huskylens_is_not_an_error():
         def begin(self):
             return False
 
-    class _RecordingUI:
-        def __init__(self):
-            self.infos = []
-            self.errors = []
-
-        def log_info(self, *args, sep=' '):
-            self.infos.append(sep.join(str(a) for a in args))
-
-        def log_error(self, *args, sep=' '):
-            self.errors.append(sep.join(str(a) for a in args))
-
     real = vision.QwiicHuskylens
     ui = _RecordingUI()
     try:
@@ -163,6 +214,75 @@ def test_missing_huskylens_is_not_an_error():
     return 1, ""
 
 
+def test_nothing_at_an_address_is_never_asked():
+    """SuperBot scans the bus once and hands round what answered. The
+    screen, buzzer and HuskyLens are only set up if their address did:
+    no HuskyLens on the bus must cost no tries and no half-second sleeps,
+    where it used to cost three of each on every boot. With the HuskyLens
+    in the scan it is still tried as before.
+
+    The drivers are patched, so this touches no I2C.
+    """
+    from nhs_robotics import vision, ui as ui_module
+
+    tries = []
+    sleeps = []
+    built = []
+
+    class _NeverFinds:
+        def __init__(self, **kwargs):
+            tries.append(kwargs)
+
+        def begin(self):
+            return False
+
+    class _NoSleep:
+        @staticmethod
+        def sleep(seconds):
+            sleeps.append(seconds)
+
+    class _Part:
+        ADDRESS = 0
+
+        def __init__(self, **kwargs):
+            built.append(type(self).__name__)
+
+        def show_lines(self, *lines):
+            pass
+
+    class _OLED(_Part):
+        ADDRESS = 0x3c
+
+    class _Buzzer(_Part):
+        ADDRESS = 0x34
+
+    real = (vision.QwiicHuskylens, vision.time, ui_module.OLED, ui_module.Buzzer)
+    try:
+        vision.QwiicHuskylens, vision.time = _NeverFinds, _NoSleep
+        ui_module.OLED, ui_module.Buzzer = _OLED, _Buzzer
+        log = _RecordingUI()
+        eyes = vision.RobotVision(qwiic_driver=object(), ui=log, nav=None,
+                                  devices=set())
+        if tries or sleeps or eyes.husky is not None:
+            return 0, "no HuskyLens on the bus, still tried %d times" % len(tries)
+        if not any("HuskyLens" in line for line in log.infos):
+            return 0, "said nothing at all about the missing HuskyLens"
+        vision.RobotVision(qwiic_driver=object(), ui=log, nav=None,
+                           devices={vision.RobotVision.HUSKYLENS_ADDRESS})
+        if len(tries) != 3:
+            return 0, "HuskyLens on the bus, tried %d times" % len(tries)
+
+        face = ui_module.RobotUI(object(), object(), devices=set())
+        if built or face.screen is not None or face.buzzer is not None:
+            return 0, "empty bus, still set up %s" % built
+        ui_module.RobotUI(object(), object(), devices={0x3c})
+        if built != ["_OLED"]:
+            return 0, "screen alone on the bus, set up %s" % built
+    finally:
+        vision.QwiicHuskylens, vision.time, ui_module.OLED, ui_module.Buzzer = real
+    return 1, ""
+
+
 # --- tests -----------------------------------------------------------------
 
 def test_light_both_leds():
@@ -243,6 +363,26 @@ def test_touch_held_and_pressed():
     return 1, ""
 
 
+def test_touch_tap_between_polls_counts():
+    """A tap that starts and ends between two pressed() calls is one
+    press, when the Alvik library counts presses as its touch packets
+    arrive. Polling the level alone never sees it."""
+    alvik = FakeAlvik()
+    counts = {"cancel": 0}
+    alvik.get_touch_presses = lambda pad: counts[pad]
+    polled = Button(alvik.get_touch_cancel)
+    streamed = Button(alvik.get_touch_cancel, lambda: alvik.get_touch_presses("cancel"))
+
+    counts["cancel"] += 1           # down and up again, between two polls
+    edges = [(polled.is_pressed(), streamed.is_pressed()) for _ in range(2)]
+    if edges != [(False, True), (False, False)]:
+        return 0, "a tap between polls gave (polled, streamed) %s" % edges
+    counts["cancel"] += 3           # three taps between polls are one press
+    if [streamed.is_pressed() for _ in range(2)] != [True, False]:
+        return 0, "three taps between polls did not read as one press"
+    return 1, ""
+
+
 def test_unknown_button_name_raises():
     """A typo fails loudly instead of quietly reporting False."""
     gp = _bare_gamepad()
@@ -282,4 +422,1186 @@ def test_closest_valid():
     return 1, ""
 
 
-print("Loaded regression_host.py V04")
+# --- PoseEstimator ---------------------------------------------------------
+
+class FakeOdometry:
+    """An Alvik seen only through its encoders and IMU. The robot turns
+    and drives for real; the wheels over-report rotation the way the
+    firmware's odometry does, and the yaw wraps at 360."""
+
+    def __init__(self, yaw_start, wheel_turn_scale):
+        self.theta = 0.0
+        self.yaw_start = yaw_start
+        self.wheel_turn_scale = wheel_turn_scale
+        self.left = self.right = 0.0
+
+    def turn(self, degrees):
+        swing = math.radians(degrees * self.wheel_turn_scale) * 8.8 / 2.0
+        self.left -= swing * 33.88
+        self.right += swing * 33.88
+        self.theta += degrees
+
+    def forward(self, cm):
+        self.left += cm * 33.88
+        self.right += cm * 33.88
+
+    def get_wheels_position(self):
+        return (self.left, self.right)
+
+    def get_orientation(self):
+        return (0.0, 0.0, (self.yaw_start + self.theta) % 360.0)
+
+
+def _real_pose_module():
+    import nhs_robotics.pose as pose
+    if not hasattr(pose.time, "ticks_ms"):
+        pose.time = _Ticks()
+    return pose
+
+
+def _stepped_pose(every_ms):
+    """A PoseEstimator on FakeOdometry(350, 1.10) whose update() moves the
+    clock on every_ms first, the module it came from, and that clock: ticks
+    that only move when the test moves them."""
+    module = _real_pose_module()
+
+    class _SteppedTicks(_Ticks):
+        now_ms = 0
+
+        def ticks_ms(self):
+            return self.now_ms % self.PERIOD
+
+    clock = _SteppedTicks()
+
+    class _Stepped(module.PoseEstimator):
+        def update(self):
+            clock.now_ms += every_ms
+            return module.PoseEstimator.update(self)
+
+    return _Stepped(FakeOdometry(350.0, 1.10)), module, clock
+
+
+def test_pose_estimator_unwraps_and_trusts_the_imu():
+    """A turn through 500 degrees that starts at yaw 350, so the IMU wraps
+    almost at once, on wheels that over-report the turn by 10%. theta has
+    to keep counting past 360 and end up on the IMU, not the wheels; a
+    drive afterwards has to go the way theta says. How fast theta is
+    pulled onto the IMU is a matter of time, not of how often update() is
+    called: 0.1 s after the wheels over-report a turn, a loop at 100 Hz
+    and one at 20 Hz have closed the same share of the gap."""
+    module = _real_pose_module()
+    saved = module.time
+    try:
+        pose, module, clock = _stepped_pose(20)
+        module.time = clock
+        alvik = pose.alvik
+        pose.update()
+        for _ in range(100):
+            alvik.turn(5.0)
+            pose.update()
+        for _ in range(10):
+            pose.update()
+        if abs(pose.theta - 500.0) > 0.5:
+            return 0, "theta %.1f after turning 500 (wheels alone say 550)" % pose.theta
+
+        for _ in range(20):
+            alvik.forward(1.0)
+            pose.update()
+        heading = math.radians(500.0)
+        x, y, theta = pose.pose()
+        if abs(x - 20.0 * math.cos(heading)) > 0.3 or abs(y - 20.0 * math.sin(heading)) > 0.3:
+            return 0, "drove 20 cm at 500 deg, ended at %.1f,%.1f" % (x, y)
+
+        pose.reset(0.0, 0.0, 90.0)
+        alvik.turn(-30.0)
+        for _ in range(10):
+            pose.update()
+        if abs(pose.theta - 60.0) > 0.5:
+            return 0, "after reset to 90 and turning -30, theta %.1f" % pose.theta
+
+        gaps = []
+        for every_ms in (10, 50):
+            pose, module, clock = _stepped_pose(every_ms)
+            module.time = clock
+            pose.reset()
+            # A turn the IMU sees all at once and the wheels 10% too far
+            pose.alvik.turn(100.0)
+            for _ in range(100 // every_ms):
+                pose.update()
+            gaps.append(pose.theta - 100.0)
+        if abs(gaps[0] - gaps[1]) > 0.5:
+            return 0, "0.1 s on, %.1f deg off at 100 Hz, %.1f at 20 Hz" % tuple(gaps)
+        left = math.exp(-0.1 / module.PoseEstimator.YAW_TAU_S)
+        if abs(gaps[0] - 10.0 * left) > 0.5:
+            return 0, "0.1 s on, %.1f deg off, not %.1f" % (gaps[0], 10.0 * left)
+    finally:
+        module.time = saved
+    return 1, ""
+
+
+class _LineSensors:
+    """Three line sensors over a strip of tape 2 cm wide, off-centre by
+    offset_cm, each reading its own level solidly on it."""
+
+    SPACING_CM = 1.5
+    SPOT_CM = 0.4
+
+    def __init__(self, highs, low=50):
+        self.highs = highs
+        self.low = low
+        self.offset_cm = 0.0
+
+    def get_line_sensors(self):
+        readings = []
+        for i, high in enumerate(self.highs):
+            gap = abs(self.offset_cm - (i - 1) * self.SPACING_CM)
+            dark = (1.0 + self.SPOT_CM - gap) / (2.0 * self.SPOT_CM)
+            dark = max(0.0, min(1.0, dark))
+            readings.append(int(self.low + (high - self.low) * dark))
+        return tuple(readings)
+
+
+def test_line_follower_tracks_past_the_centre_sensor():
+    """Tape reading 650, 400 and 300 on the three sensors, calibrated to
+    it. As the tape slides from under the centre out past the right
+    sensor, the position has to keep climbing -- it must not stall at the
+    right sensor or lose the line while one sensor still sees it -- and
+    the tape dead centre has to read as centre."""
+    import nhs_robotics.line_follower as line_follower
+    if not hasattr(line_follower.time, "ticks_ms"):
+        line_follower.time = _Ticks()
+    sensors = _LineSensors((650, 400, 300))
+    lf = line_follower.LineFollower(sensors)
+    lf._set_range((50, 50, 50), (650, 400, 300))
+
+    centre = lf._position()
+    if centre is None or abs(centre) > 0.02:
+        return 0, "tape dead centre reads %r" % centre
+    last = centre
+    for step in range(1, 27):
+        sensors.offset_cm = step * 0.1
+        pos = lf._position()
+        if pos is None:
+            return 0, "lost at %.1f cm with the right sensor on the tape" % sensors.offset_cm
+        if pos < last - 0.01:
+            return 0, "went back from %.2f to %.2f at %.1f cm" % (last, pos, sensors.offset_cm)
+        last = pos
+        lf._last_error = pos
+    if last <= 1.5:
+        return 0, "only %.2f with the tape past the right sensor" % last
+    sensors.offset_cm = 4.0
+    if lf._position() is not None:
+        return 0, "no tape under any sensor, still not lost"
+    return 1, ""
+
+
+def test_line_follower_turns_back_the_way_the_line_went():
+    """The tape slides out past the right sensor and is gone. Asked to
+    recover, follow() has to spin right to look for it rather than drive
+    straight on, say how long it was away once it is back, and give up with
+    line_lost once RECOVERY_TIMEOUT_MS has gone by. Fresh from reset() it
+    has no side to look on, and gives up at once. Not asked, line_lost goes
+    up the moment the line goes: the course's safety brake."""
+    import nhs_robotics.line_follower as line_follower
+    if not hasattr(line_follower.time, "ticks_ms"):
+        line_follower.time = _Ticks()
+    sensors = _LineSensors((400, 400, 400))
+    lf = line_follower.LineFollower(sensors)
+    lf._set_range((50, 50, 50), (400, 400, 400))
+
+    for step in range(27):
+        sensors.offset_cm = step * 0.1
+        lf.follow(40, recover=True)
+    sensors.offset_cm = 4.0
+    left, right = lf.follow(40, recover=True)
+    if lf.line_lost or not lf.recovering:
+        return 0, "gave up the moment the line went"
+    if not left > 0 > right:
+        return 0, "line went right, turned (%.0f, %.0f)" % (left, right)
+    sensors.offset_cm = 2.0
+    lf.follow(40, recover=True)
+    if lf.recovering or lf.recoveries != 1 or lf.recovery_ms is None:
+        return 0, "back on the line, recovering %r after %d recoveries" % (
+            lf.recovering, lf.recoveries)
+
+    lf.RECOVERY_TIMEOUT_MS = 0
+    sensors.offset_cm = 4.0
+    if lf.follow(40, recover=True) != (40, 40) or not lf.line_lost:
+        return 0, "still looking after RECOVERY_TIMEOUT_MS"
+    lf.RECOVERY_TIMEOUT_MS = line_follower.LineFollower.RECOVERY_TIMEOUT_MS
+    lf.reset()
+    if lf.follow(40, recover=True) != (40, 40) or not lf.line_lost:
+        return 0, "looked for the line with no idea which side it went"
+
+    sensors.offset_cm = 2.0
+    lf.follow(40)
+    sensors.offset_cm = 4.0
+    if lf.follow(40) != (40, 40) or not lf.line_lost or lf.recovering:
+        return 0, "not asked to recover, line_lost waited for a search"
+    return 1, ""
+
+
+# --- the factory Alvik library, no robot ------------------------------------
+
+class _FactoryPin:
+    IN = 0
+    OUT = 1
+    PULL_DOWN = 2
+
+    def __init__(self, *args, **kwargs):
+        self._value = 1
+
+    def value(self, *v):
+        if v:
+            self._value = v[0]
+        return self._value
+
+
+class _FactoryUart:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def any(self):
+        return 0
+
+    def write(self, data):
+        return len(data)
+
+
+def _real_factory_alvik(scheduled):
+    """init_bot/factory_alivk's arduino_alvik.py, loaded by path on a
+    laptop. Its MicroPython imports are answered here: no threads start,
+    the UART sends nowhere, and micropython.schedule() appends to
+    `scheduled` for the test to run."""
+    import builtins
+    import os
+    import types
+    lib = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                       "init_bot", "factory_alivk", "lib", "arduino_alvik")
+    fakes = {}
+    for name, names in (
+            ("machine", {"Pin": _FactoryPin, "UART": _FactoryUart, "I2C": _FactoryUart}),
+            ("_thread", {"start_new_thread": lambda *a: None}),
+            ("time", {"sleep_ms": lambda ms: None, "ticks_ms": lambda: 0,
+                      "ticks_diff": lambda a, b: a - b}),
+            ("micropython", {"schedule": lambda f, arg: scheduled.append((f, arg))}),
+            ("ucPack", {"ucPack": lambda *a: None})):
+        module = types.ModuleType(name)
+        module.__dict__.update(names)
+        fakes[name] = module
+
+    def load(name):
+        module = types.ModuleType("_factory_" + name)
+        module.__dict__["__builtins__"] = dict(builtins.__dict__, __import__=_import)
+        path = os.path.join(lib, name + ".py")
+        with open(path) as f:
+            exec(compile(f.read(), path, "exec"), module.__dict__)
+        return module
+
+    def _import(name, globals=None, locals=None, fromlist=(), level=0):
+        if level == 1:
+            if name not in fakes:
+                fakes[name] = load(name)
+            return fakes[name]
+        if name in fakes:
+            return fakes[name]
+        return builtins.__import__(name, globals, locals, fromlist, level)
+
+    return load("arduino_alvik")
+
+
+class _TouchPacket:
+    """ucPack as _parse_message sees it, holding one 't' packet."""
+
+    def __init__(self, touch_byte):
+        self.touch_byte = touch_byte
+
+    def payloadTop(self):
+        return ord('t')
+
+    def unpacketC1B(self):
+        return ord('t'), self.touch_byte
+
+
+def test_factory_touch_edges_from_packets():
+    """The factory library finds touch edges in _parse_message as each 't'
+    packet arrives: a tap as short as one packet counts, callbacks queue
+    and run, oldest first, when micropython.schedule gets to them, and no
+    thread polls for them."""
+    if not _on_laptop():
+        return 2, "the robot runs its own arduino_alvik"
+    scheduled = []
+    module = _real_factory_alvik(scheduled)
+    alvik = module.ArduinoAlvik()
+    if hasattr(alvik, "_start_touch_events_thread"):
+        return 0, "the touch events thread is still there"
+    ran = []
+    alvik.on_touch_ok_pressed(ran.append, ("ok",))
+    alvik.on_touch_up_pressed(ran.append, ("up",))
+
+    # ok, released, ok + up together, held, released; any (bit 0) throughout
+    for touch in (0x03, 0x01, 0x13, 0x13, 0x00):
+        alvik._packeter = _TouchPacket(touch)
+        alvik._parse_message()
+    presses = {pad: alvik.get_touch_presses(pad) for pad in ("ok", "up", "cancel", "any")}
+    if presses != {"ok": 2, "up": 1, "cancel": 0, "any": 1}:
+        return 0, "counted %s" % presses
+    if ran:
+        return 0, "callbacks ran on the UART thread: %s" % ran
+    for func, arg in scheduled:
+        func(arg)
+    if ran != ["ok", "ok", "up"]:
+        return 0, "callbacks ran %s" % ran
+    return 1, ""
+
+
+# --- the real Controller, no Wi-Fi -----------------------------------------
+
+class _Ticks:
+    """MicroPython's ticks, for the real controller.py on a laptop. They
+    wrap at 2**30 the way the ESP32's do."""
+
+    PERIOD = 1 << 30
+
+    def __init__(self):
+        import time
+        self._time = time
+
+    def ticks_ms(self):
+        return int(self._time.monotonic() * 1000) % self.PERIOD
+
+    def ticks_us(self):
+        return int(self._time.monotonic() * 1000000) % self.PERIOD
+
+    def ticks_diff(self, later, earlier):
+        half = self.PERIOD // 2
+        return (later - earlier + half) % self.PERIOD - half
+
+    def sleep(self, seconds):
+        self._time.sleep(seconds)
+
+
+_LOADED = []
+
+
+def _real_controller():
+    """The real controller module.
+
+    On the robot that is just the import. On a laptop `controller` is one
+    of the stubs above, so the file is loaded by path instead, with a ticks
+    shim standing in for its `time`.
+    """
+    import controller
+    # The stub answers every name with a made-up class, so ask for the
+    # real tuple rather than just the name.
+    if isinstance(getattr(controller, "BUTTON_NAMES", None), tuple):
+        return controller
+    if _LOADED:
+        return _LOADED[0]
+    import importlib.util
+    import os
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        "nhs_lib", "controller.py")
+    spec = importlib.util.spec_from_file_location("_real_controller", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.time = _Ticks()
+    sys.modules["page_server"].time = module.time
+    _LOADED.append(module)
+    return module
+
+
+class FakeWsSocket:
+    """A connected phone: hands over queued bytes in the chunks given, then
+    reports nothing waiting, the way a non-blocking MicroPython socket does."""
+
+    def __init__(self):
+        self.chunks = []
+        self.sent = []
+        self.closed = False
+        self.blocking = True
+
+    def readinto(self, view):
+        if not self.chunks:
+            return None
+        chunk = self.chunks.pop(0)
+        n = min(len(chunk), len(view))
+        view[0:n] = chunk[0:n]
+        if n < len(chunk):
+            self.chunks.insert(0, chunk[n:])
+        return n
+
+    def send(self, data):
+        self.sent.append(bytes(data))
+        return len(data)
+
+    def setblocking(self, flag):
+        self.blocking = flag
+
+    def close(self):
+        self.closed = True
+
+
+class _LogBot:
+    def __init__(self):
+        self.lines = []
+
+    def log_info(self, text):
+        self.lines.append(text)
+
+
+def _bare_controller(coalesce=True):
+    """A real Controller with a fake phone on the WebSocket and no AP."""
+    module = _real_controller()
+
+    class _BareController(module.Controller):
+        _instance = None        # its own singleton slot, fresh every time
+
+        def __init__(self):
+            pass
+
+    c = _BareController()
+    c.bot = _LogBot()
+    c.coalesce = coalesce
+    c._init_state()
+    sock = FakeWsSocket()
+    c.ws_client = sock
+    c._readinto = sock.readinto
+    c.connected = True
+    return c, sock
+
+
+def _ws_frame(payload, opcode=2, mask=b"\x3a\xc5\x0f\x91"):
+    """One masked client-to-server frame, as a browser sends it."""
+    import struct
+    frame = bytearray([0x80 | opcode])
+    if len(payload) < 126:
+        frame.append(0x80 | len(payload))
+    else:
+        frame.append(0x80 | 126)
+        frame.extend(struct.pack(">H", len(payload)))
+    frame.extend(mask)
+    for i in range(len(payload)):
+        frame.append(payload[i] ^ mask[i % 4])
+    return bytes(frame)
+
+
+def _gamepad_packet(lx, ly, rx, ry, l2, r2, buttons, sent_ms=None):
+    """The 28-byte state, or 32 with the phone's clock on the end."""
+    import struct
+    packet = struct.pack("<ffffffI", lx, ly, rx, ry, l2, r2, buttons)
+    if sent_ms is not None:
+        packet += struct.pack("<I", sent_ms & 0x3FFFFFFF)
+    return packet
+
+
+def _compact_frame(kind, axes=None, buttons=None, sent_ms=0, echo=False):
+    """A V13 compact frame, built the way controller.html builds one. axes
+    maps an axis index (0 = left_x .. 5 = R2) to its value."""
+    import struct
+    module = _real_controller()
+    changed = 0
+    body = b""
+    for index in sorted(axes or {}):
+        changed |= 1 << index
+        body += struct.pack("<h", int(round(axes[index] * module.AXIS_SCALE)))
+    if buttons is not None:
+        changed |= module.BUTTONS_BIT
+        body += struct.pack("<I", buttons)[0:3]
+    if echo:
+        changed |= module.ECHO_BIT
+    head = struct.pack("<BBI", (module.PROTOCOL_VERSION << 4) | kind,
+                       changed, sent_ms & 0x3FFFFFFF)
+    return head + body
+
+
+def test_controller_decodes_only_the_newest_frame():
+    """Three states queued between two polls: the controller ends up in
+    the third, and says it skipped two. update() is the same poll plus an
+    accept() on the listening socket, which has no fake here."""
+    c, sock = _bare_controller()
+    sock.chunks.append(_ws_frame(_gamepad_packet(0.1, 0.2, 0, 0, 0, 0, 0b1))
+                       + _ws_frame(b"", opcode=9)           # a ping
+                       + _ws_frame(_gamepad_packet(0.3, 0.4, 0, 0, 0, 0, 0b10))
+                       + _ws_frame(_gamepad_packet(-0.5, 1.0, 0.25, -1.0,
+                                                   0.75, 0.5, 0b10000000000000001)))
+    c._poll_ws()
+    if (c.left_x, c.left_y, c.right_x, c.right_y, c.L2, c.R2) != \
+            (-0.5, 1.0, 0.25, -1.0, 0.75, 0.5):
+        return 0, "sticks read %s" % ((c.left_x, c.left_y, c.right_x,
+                                       c.right_y, c.L2, c.R2),)
+    pressed = sorted(name for name, down in c.buttons.items() if down)
+    if pressed != ["cross", "ps"]:
+        return 0, "buttons read %s" % pressed
+    if "Lag Drop: 2 pkts" not in c.bot.lines:
+        return 0, "logged %s" % c.bot.lines
+    return 1, ""
+
+
+def test_controller_reassembles_split_frames():
+    """The socket hands frames over in pieces that ignore frame edges. After
+    every poll the state is the newest frame that has fully arrived."""
+    c, sock = _bare_controller()
+    names = _real_controller().BUTTON_NAMES
+    frames = [_ws_frame(_gamepad_packet(i / 8.0, 0, 0, 0, 0, 0, 1 << i))
+              for i in range(8)]
+    stream = b"".join(frames)
+    ends = []
+    total = 0
+    for frame in frames:
+        total += len(frame)
+        ends.append(total)
+    received = 0
+    for start in range(0, len(stream), 13):
+        sock.chunks.append(stream[start:start + 13])
+        received = min(len(stream), start + 13)
+        c._poll_ws()
+        complete = [i for i, end in enumerate(ends) if end <= received]
+        if complete:
+            newest = complete[-1]
+            if c.left_x != newest / 8.0 or not c.buttons[names[newest]]:
+                return 0, "after %d bytes read left_x %s, expected frame %d" % (
+                    received, c.left_x, newest)
+    if c._rx_len != 0:
+        return 0, "%d bytes left over after the last frame" % c._rx_len
+    return 1, ""
+
+
+def test_controller_counts_drops_and_latency():
+    """Stamped packets are applied like plain ones and measured. Latency is
+    counted from the fastest packet, so one 10 ms late and one 40 ms late
+    read 0 and 30. Old 28-byte packets still work alongside."""
+    c, sock = _bare_controller()
+    ticks = _real_controller().time
+    now = ticks.ticks_ms()
+    sock.chunks.append(_ws_frame(_gamepad_packet(0.1, 0, 0, 0, 0, 0, 0,
+                                                 sent_ms=now - 10)))
+    c._poll_ws()
+    sock.chunks.append(_ws_frame(_gamepad_packet(0.2, 0, 0, 0, 0, 0, 0))
+                       + _ws_frame(_gamepad_packet(0.3, 0, 0, 0, 0, 0, 4,
+                                                   sent_ms=now - 40)))
+    c._poll_ws()
+    stats = c.stats()
+    if abs(c.left_x - 0.3) > 1e-6 or not c.buttons["square"]:
+        return 0, "stamped packet applied as left_x %s" % c.left_x
+    if (stats["packets"], stats["dropped"]) != (3, 1):
+        return 0, "counted %s" % stats
+    if abs(stats["latency_ms"] - 30) > 5 or abs(stats["latency_max_ms"] - 30) > 5:
+        return 0, "latency %s, expected about 30 ms" % stats
+
+    # With coalescing off every packet is applied, and none is dropped.
+    c, sock = _bare_controller(coalesce=False)
+    sock.chunks.append(_ws_frame(_gamepad_packet(0.1, 0, 0, 0, 0, 0, 0))
+                       + _ws_frame(_gamepad_packet(0.2, 0, 0, 0, 0, 0, 0)))
+    c._poll_ws()
+    if c.stats()["dropped"] != 0 or abs(c.left_x - 0.2) > 1e-6:
+        return 0, "coalesce=False: %s, left_x %s" % (c.stats(), c.left_x)
+    return 1, ""
+
+
+def test_controller_close_frame_drops_the_phone():
+    c, sock = _bare_controller()
+    sock.chunks.append(_ws_frame(_gamepad_packet(0.5, 0, 0, 0, 0, 0, 1))
+                       + _ws_frame(b"\x03\xe8", opcode=8))
+    c._poll_ws()
+    if c.ws_client is not None or not sock.closed:
+        return 0, "close frame did not close the socket"
+    if c.left_x != 0.0 or c.buttons["cross"]:
+        return 0, "state was not reset when the phone left"
+    return 1, ""
+
+
+def test_controller_skips_a_frame_too_big_for_the_buffer():
+    """A frame longer than the receive buffer, arriving in pieces, is read
+    away and ignored; the phone stays connected and the gamepad frames on
+    either side of it are applied."""
+    c, sock = _bare_controller()
+    names = _real_controller().BUTTON_NAMES
+    stream = (_ws_frame(_gamepad_packet(0.25, 0, 0, 0, 0, 0, 1))
+              + _ws_frame(bytes(range(256)) * 8, opcode=1)
+              + _ws_frame(_gamepad_packet(-0.5, 0, 0, 0, 0, 0, 2)))
+    for start in range(0, len(stream), 300):
+        sock.chunks.append(stream[start:start + 300])
+        c._poll_ws()
+        if c.ws_client is None:
+            return 0, "dropped the phone after %d bytes" % (start + 300)
+        if start == 0 and c.left_x != 0.25:
+            return 0, "frame before the big one read left_x %s" % c.left_x
+    if c.left_x != -0.5 or not c.buttons[names[1]]:
+        return 0, "frame after the big one read left_x %s" % c.left_x
+    if c._rx_len or c._skip:
+        return 0, "%d bytes left over, %d still to skip" % (c._rx_len, c._skip)
+
+    # All of it in one poll, as a backlog would arrive
+    c, sock = _bare_controller()
+    sock.chunks.append(stream)
+    c._poll_ws()
+    if c.ws_client is None or c.left_x != -0.5:
+        return 0, "in one read: connected %s, left_x %s" % (
+            c.ws_client is not None, c.left_x)
+    return 1, ""
+
+
+def test_controller_applies_compact_deltas():
+    """Compact frames queued between two polls: everything before the
+    newest full state is skipped, every delta after it is applied in order.
+    A delta with no full state under it is not applied at all."""
+    c, sock = _bare_controller()
+    module = _real_controller()
+    full, delta, beat = module.KIND_FULL, module.KIND_DELTA, module.KIND_HEARTBEAT
+    everything = {0: 0.5, 1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
+    sock.chunks.append(
+        _ws_frame(_compact_frame(full, everything, buttons=0b1))
+        + _ws_frame(_compact_frame(delta, {1: 0.25}))
+        + _ws_frame(_compact_frame(full, {0: -1.0, 1: 0, 2: 0.5, 3: 0, 4: 0, 5: 0},
+                                   buttons=0))
+        + _ws_frame(_compact_frame(delta, {3: 0.75}))
+        + _ws_frame(_compact_frame(delta, buttons=0b10))
+        + _ws_frame(_compact_frame(beat)))
+    c._poll_ws()
+    got = (c.left_x, c.left_y, c.right_x, c.right_y, c.L2, c.R2)
+    for value, expected in zip(got, (-1.0, 0.0, 0.5, 0.75, 0.0, 0.0)):
+        if abs(value - expected) > 1e-4:
+            return 0, "sticks read %s" % (got,)
+    pressed = sorted(name for name, down in c.buttons.items() if down)
+    if pressed != ["circle"]:
+        return 0, "buttons read %s" % pressed
+    stats = c.stats()
+    if (stats["packets"], stats["dropped"]) != (6, 2):
+        return 0, "counted %s" % stats
+
+    # The old packet still drives a robot that has had compact frames.
+    sock.chunks.append(_ws_frame(_gamepad_packet(0.1, 0, 0, 0, 0, 0, 0)))
+    c._poll_ws()
+    if abs(c.left_x - 0.1) > 1e-6 or c.buttons["circle"]:
+        return 0, "28-byte packet after compact ones read left_x %s" % c.left_x
+
+    c, sock = _bare_controller()
+    sock.chunks.append(_ws_frame(_compact_frame(delta, {0: 1.0})))
+    c._poll_ws()
+    if c.left_x != 0.0 or not c.connected:
+        return 0, "unsynced delta: left_x %s, connected %s" % (c.left_x, c.connected)
+
+    c, sock = _bare_controller(coalesce=False)
+    sock.chunks.append(_ws_frame(_compact_frame(full, everything))
+                       + _ws_frame(_compact_frame(delta, {1: -0.5})))
+    c._poll_ws()
+    if abs(c.left_x - 0.5) > 1e-4 or abs(c.left_y + 0.5) > 1e-4 or c.dropped:
+        return 0, "coalesce=False read %s, %s" % ((c.left_x, c.left_y), c.stats())
+    return 1, ""
+
+
+def test_controller_says_hello_and_echoes():
+    """The handshake reply ends with HELLO, so a new page knows it may send
+    compact frames. A frame with the echo bit set gets its clock sent
+    back; one without gets nothing."""
+    import struct
+    c, _ = _bare_controller()
+    module = _real_controller()
+    phone = FakeWsSocket()
+    c._handle_http_req(phone, b"GET /ws HTTP/1.1\r\nHost: 192.168.4.1\r\n"
+                       b"Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n\r\n")
+    reply = b"".join(phone.sent)
+    if b"s3pPLMBiTxaQ9kYGzzhZRbK+xOo=" not in reply:
+        return 0, "bad accept key in %r" % reply
+    if not reply.endswith(module.HELLO) or c.ws_client is not phone:
+        return 0, "no HELLO after the handshake: %r" % reply
+
+    del phone.sent[:]
+    full = module.KIND_FULL
+    phone.chunks.append(_ws_frame(_compact_frame(full, {0: 0, 1: 0, 2: 0, 3: 0, 4: 0, 5: 0},
+                                                 buttons=0, sent_ms=1234)))
+    c._poll_ws()
+    if phone.sent:
+        return 0, "echoed without being asked: %r" % phone.sent
+    phone.chunks.append(_ws_frame(_compact_frame(module.KIND_HEARTBEAT, sent_ms=5678,
+                                                 echo=True)))
+    c._poll_ws()
+    if phone.sent != [b"\x82\x04" + struct.pack("<I", 5678)]:
+        return 0, "echo was %r" % phone.sent
+    return 1, ""
+
+
+# --- serving the page ----------------------------------------------------
+
+# The longest one update() may take while a phone loads the page. Before
+# page_server a phone that took 300 ms to send its request stalled update()
+# for 300 ms, and the blocking send of the page came on top of that.
+STALL_LIMIT_MS = 25
+
+
+def _on_laptop():
+    return sys.implementation.name != "micropython"
+
+
+def _served_controller():
+    """A real Controller listening on a real localhost socket, with a small
+    send buffer so the page cannot go out in one send()."""
+    import socket
+    c, _ = _bare_controller()
+    c.ws_client = None
+    c.connected = False
+    c.ssid = "Alvik-Test"
+    c._load_pages()
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+    server.bind(("127.0.0.1", 0))
+    server.listen(2)
+    server.setblocking(False)
+    c.server_socket = server
+    return c
+
+
+def _slow_phone_load(c, path, request_after_ms=300, read_every_ms=10):
+    """One phone loading path from c: it connects, dawdles before sending
+    the request, then reads 512 bytes at a time. Returns (worst update()
+    in ms, the bytes the phone got). All on this thread, so the timing is
+    update()'s alone."""
+    import socket
+    import time
+    phone = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    phone.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 2048)
+    phone.connect(c.server_socket.getsockname())
+    phone.setblocking(False)
+    got = bytearray()
+    worst = 0.0
+    asked = False
+    last_read = 0.0
+    start = time.monotonic()
+    try:
+        while time.monotonic() - start < 5:
+            before = time.perf_counter()
+            c.update()
+            worst = max(worst, time.perf_counter() - before)
+            elapsed = (time.monotonic() - start) * 1000
+            if not asked and elapsed >= request_after_ms:
+                phone.send(b"GET " + path + b" HTTP/1.1\r\nHost: 192.168.4.1\r\n"
+                           b"Accept-Encoding: gzip, deflate\r\n\r\n")
+                asked = True
+            if asked and elapsed - last_read >= read_every_ms:
+                last_read = elapsed
+                try:
+                    data = phone.recv(512)
+                except BlockingIOError:
+                    data = None
+                if data == b"":
+                    break
+                if data:
+                    got.extend(data)
+            time.sleep(0.001)
+    finally:
+        phone.close()
+    return worst * 1000, bytes(got)
+
+
+class _InlinePage:
+    """The way Controller served its page before page_server: read the
+    request inside update(), on a socket with a 0.5 s timeout, and send the
+    page there and then. Kept here so the stall it caused is measured,
+    not remembered."""
+
+    def __init__(self, server_socket, html):
+        self.server_socket = server_socket
+        self.html = html
+
+    def update(self):
+        import select
+        r, _, _ = select.select([self.server_socket], [], [], 0)
+        if not r:
+            return
+        try:
+            cl, _ = self.server_socket.accept()
+        except OSError:
+            return
+        cl.settimeout(0.5)
+        try:
+            if cl.recv(1024):
+                cl.send(b"HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n"
+                        b"Connection: close\r\n\r\n")
+                cl.send(self.html)
+        except OSError:
+            pass
+        cl.close()
+
+
+def test_controller_streams_the_gzipped_page():
+    """A slow phone gets the whole page, gzipped, and no update() while it
+    loads takes longer than STALL_LIMIT_MS. The same phone against the old
+    inline read has to stall update() for at least the 300 ms the phone
+    dawdles, or this test could not tell the two apart. (Here it is the
+    whole 0.5 s timeout: the phone is on this thread, and cannot send
+    while update() waits for it.)"""
+    if not _on_laptop():
+        return 2, "needs a laptop's sockets and gzip"
+    import gzip
+    import os
+    page = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        "nhs_lib", "controller.html")
+    with open(page, "rb") as f:
+        html = f.read()
+    c = _served_controller()
+    inline = _InlinePage(c.server_socket, html)
+    before, _ = _slow_phone_load(inline, b"/")
+    if before < 300:
+        return 0, "the inline read stalled only %.1f ms" % before
+
+    worst, got = _slow_phone_load(c, b"/")
+    head, _, body = got.partition(b"\r\n\r\n")
+    if b"Content-Encoding: gzip" not in head:
+        return 0, "headers were %r" % head
+    if gzip.decompress(body) != html:
+        return 0, "the phone got %d bytes that are not controller.html" % len(body)
+    if worst > STALL_LIMIT_MS:
+        return 0, "update() stalled %.1f ms while the page loaded (inline: %.0f ms)" % (
+            worst, before)
+
+    worst, got = _slow_phone_load(c, b"/ssid", request_after_ms=0)
+    if not got.endswith(b"\r\n\r\nAlvik-Test"):
+        return 0, "/ssid answered %r" % got
+    if c.pages.busy():
+        return 0, "connections left open after both loads"
+    return 1, ""
+
+
+def _real_web_gamepad():
+    """web_gamepad.py, on the real controller. Loaded by path on a laptop
+    for the same reason _real_controller() is."""
+    controller = _real_controller()
+    if not _on_laptop():
+        import web_gamepad
+        return web_gamepad
+    import importlib.util
+    import os
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        "nhs_lib", "web_gamepad.py")
+    spec = importlib.util.spec_from_file_location("_real_web_gamepad", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.time = controller.time
+    return module
+
+
+def _bare_web_gamepad(link):
+    """A real WebGamepad with no AP of its own, reading link, or the HTTP
+    transport if link is None."""
+    module = _real_web_gamepad()
+
+    class _BareWebGamepad(module.WebGamepad):
+        def __init__(self):
+            pass
+
+    g = _BareWebGamepad()
+    g.transport = "ws" if link else "http"
+    g.axes = [0, 0, 0, 0]
+    g.buttons = 0
+    g._link = link
+    g.reset_stats()
+    return g
+
+
+def test_web_gamepad_reads_the_websocket():
+    """Over the WebSocket, get_axis() and is_pressed() read what the
+    Controller decoded, with Y still negative for up as the HTTP page
+    sent it, and web_gamepad.html is the page on the socket either way.
+    Both transports count their packets for stats()."""
+    module = _real_controller()
+    c = _served_controller()
+    sock = FakeWsSocket()
+    c.ws_client = sock
+    c._readinto = sock.readinto
+    c.connected = True
+    g = _bare_web_gamepad(c)
+    sock.chunks.append(_ws_frame(_compact_frame(
+        module.KIND_FULL, {0: 0, 1: 0.5, 2: -0.25, 3: 0, 4: 0, 5: 0},
+        buttons=(1 << 0) | (1 << 12))))
+    g.update()
+    if (g.get_axis(0), g.get_axis(1), g.get_axis(2)) != (0, -50, -25):
+        return 0, "axes read %s" % g.axes
+    if not (g.is_pressed(0) and g.is_pressed(12)) or g.is_pressed(1):
+        return 0, "buttons read %s" % bin(g.buttons)
+    stats = g.stats()
+    if stats["transport"] != "ws" or stats["packets"] != 1 or stats["update_us_max"] is None:
+        return 0, "ws stats %s" % stats
+
+    # web_gamepad.html's own packet, for ax=10,-20,0,0&btn=3: Controller's
+    # 32 bytes, Y flipped to up
+    import struct
+    sock.chunks.append(_ws_frame(struct.pack(
+        "<ffffffII", 0.1, 0.2, 0.0, 0.0, 0.0, 0.0, 3, 123)))
+    g.update()
+    if g.get_axis(0) != 10 or g.get_axis(1) != -20 or not g.is_pressed(1):
+        return 0, "the page's packet read axes %s, buttons %s" % (g.axes, bin(g.buttons))
+
+    # The ws transport puts web_gamepad.html on Controller's socket
+    made = []
+
+    class _Controller:
+        def __init__(self, ssid, password, page="controller.html"):
+            made.append(page)
+            self.ap = self
+
+        def ifconfig(self):
+            return ("192.168.4.1",)
+
+        def reset_stats(self):
+            pass
+
+    real = sys.modules.get("controller")
+    stand_in = type(sys)("controller")
+    stand_in.Controller = _Controller
+    sys.modules["controller"] = stand_in
+    try:
+        _real_web_gamepad().WebGamepad()
+    finally:
+        if real is None:
+            del sys.modules["controller"]
+        else:
+            sys.modules["controller"] = real
+    if made != ["web_gamepad.html"]:
+        return 0, "the ws transport served %s" % made
+    if _on_laptop():
+        import gzip
+        import os
+        c._load_pages("web_gamepad.html")
+        page = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            "nhs_lib", "web_gamepad.html")
+        with open(page, "rb") as f:
+            if gzip.decompress(c._page.partition(b"\r\n\r\n")[2]) != f.read():
+                return 0, "Controller did not load web_gamepad.html"
+
+    g = _bare_web_gamepad(None)
+    reply = g._handle_request(None, b"GET /data?ax=10,-20,0,0&btn=3&t=123 HTTP/1.1\r\n\r\n")
+    if reply != _real_web_gamepad().DATA_OK:
+        return 0, "/data answered %r" % reply
+    if g.get_axis(1) != -20 or not g.is_pressed(1):
+        return 0, "http axes %s, buttons %s" % (g.axes, bin(g.buttons))
+    stats = g.stats()
+    if (stats["packets"], stats["latency_ms"]) != (1, 0):
+        return 0, "http stats %s" % stats
+    return 1, ""
+
+
+def test_controller_under_load():
+    """tests/controller_bench.py, short. A phone at 60 Hz against a 100 Hz
+    loop: nearly every frame is applied, frames do not pile up, and no
+    update() stalls. A phone at 200 Hz against a 20 Hz loop: the backlog
+    is coalesced, one state per update, instead of queueing."""
+    if not _on_laptop():
+        return 2, "the bench needs threads and a laptop's sockets"
+    import controller_bench
+    steady = controller_bench.run(rate_hz=60, loop_hz=100, seconds=1.0)
+    if steady["received"] < 0.8 * steady["sent"] or steady["states_per_s"] < 45:
+        return 0, "steady: " + controller_bench.report(steady)
+    if steady["queue_max"] > 8 or steady["update_worst_ms"] > STALL_LIMIT_MS:
+        return 0, "steady: " + controller_bench.report(steady)
+    flood = controller_bench.run(rate_hz=200, loop_hz=20, seconds=1.0, format="plain")
+    if flood["dropped"] < flood["received"] / 2 or flood["states_per_s"] > 25:
+        return 0, "flood: " + controller_bench.report(flood)
+    if flood["update_worst_ms"] > STALL_LIMIT_MS:
+        return 0, "flood: " + controller_bench.report(flood)
+    return 1, ""
+
+
+def test_pages_are_built():
+    """Every nhs_lib/*.html has a .gz that unpacks to it: the robot serves
+    the .gz, so an edit to the page without a rebuild would never be seen.
+    How the .gz was packed does not matter."""
+    if not _on_laptop():
+        return 2, "the robot has no gzip to check with"
+    import importlib.util
+    import os
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        "init_bot", "build_pages.py")
+    spec = importlib.util.spec_from_file_location("_build_pages", path)
+    build_pages = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(build_pages)
+    stale = build_pages.build(check=True)
+    if stale:
+        return 0, "stale, run init_bot/build_pages.py: %s" % ", ".join(
+            os.path.basename(p) for p in stale)
+
+    # Another zlib packs the same page into other bytes: still built
+    import gzip
+    import tempfile
+    page = b"<h1>Alvik</h1>" * 50
+    with tempfile.TemporaryDirectory() as tmp:
+        target = os.path.join(tmp, "page.html.gz")
+        with open(target, "wb") as f:
+            f.write(gzip.compress(page, compresslevel=1))
+        if not build_pages.unpacks_to(target, page):
+            return 0, "a .gz packed another way counts as stale"
+        if build_pages.unpacks_to(target, page + b"!"):
+            return 0, "an edited page counts as built"
+        with open(target, "wb") as f:
+            f.write(gzip.compress(page)[:20])
+        if build_pages.unpacks_to(target, page):
+            return 0, "a cut-off .gz counts as built"
+    return 1, ""
+
+
+def test_mpy_build_recompiles_only_what_changed():
+    """init_bot/build_mpy.py against a made-up mpy-cross. The first build
+    compiles every .py and copies everything else; a rebuild with nothing
+    changed compiles nothing; editing one module compiles that one; a
+    deleted source takes its .mpy with it; a new compiler version
+    compiles everything again, because its .mpy format may differ; and
+    each lib builds into a tree of its own."""
+    if not _on_laptop():
+        return 2, "the robot has no mpy-cross to build with"
+    import contextlib
+    import importlib.util
+    import io
+    import os
+    import tempfile
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        "init_bot", "build_mpy.py")
+    spec = importlib.util.spec_from_file_location("_build_mpy", path)
+    build_mpy = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(build_mpy)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "lib")
+        out = os.path.join(tmp, "build")
+        compiled = os.path.join(tmp, "compiled.txt")
+        fake = os.path.join(tmp, "mpy_cross.py")
+        with open(fake, "w") as f:
+            f.write("import os, sys\n"
+                    "if sys.argv[1] == '--version':\n"
+                    "    print(os.environ.get('FAKE_MPY', 'fake 1.0'))\n"
+                    "    sys.exit()\n"
+                    "open(sys.argv[sys.argv.index('-o') + 1], 'w').write('mpy')\n"
+                    "open(%r, 'a').write(sys.argv[-1] + '\\n')\n" % compiled)
+        for name, text in (("a.py", "A = 1"), ("pkg/__init__.py", ""),
+                           ("pkg/b.py", "B = 2"), ("page.html.gz", "gz")):
+            os.makedirs(os.path.dirname(os.path.join(source, name)), exist_ok=True)
+            with open(os.path.join(source, name), "w") as f:
+                f.write(text)
+        command = [sys.executable, fake]
+
+        def run():
+            open(compiled, "w").close()
+            with contextlib.redirect_stdout(io.StringIO()):
+                build_mpy.build(source, out, command)
+            with open(compiled) as f:
+                return sorted(os.path.relpath(line.strip(), source)
+                              for line in f if line.strip())
+
+        first = run()
+        if first != ["a.py", "pkg/__init__.py", "pkg/b.py"]:
+            return 0, "first build compiled %s" % first
+        shipped = sorted(build_mpy.sources(out))
+        if shipped != ["a.mpy", "manifest.json", "page.html.gz",
+                       "pkg/__init__.mpy", "pkg/b.mpy"]:
+            return 0, "first build shipped %s" % shipped
+        if run():
+            return 0, "nothing changed, still compiled something"
+        with open(os.path.join(source, "pkg", "b.py"), "w") as f:
+            f.write("B = 3")
+        os.remove(os.path.join(source, "a.py"))
+        again = run()
+        if again != ["pkg/b.py"]:
+            return 0, "one module edited, compiled %s" % again
+        if os.path.exists(os.path.join(out, "a.mpy")):
+            return 0, "a.py deleted, a.mpy still in the build"
+        os.environ["FAKE_MPY"] = "fake 2.0"
+        try:
+            fresh = run()
+        finally:
+            del os.environ["FAKE_MPY"]
+        if fresh != ["pkg/__init__.py", "pkg/b.py"]:
+            return 0, "new mpy-cross, compiled %s" % fresh
+
+        # A robot dir's lib that links to another shares its build; a lib
+        # of its own, like factory_alivk's, must never land in it
+        linked = os.path.join(tmp, "robot_lib")
+        os.symlink(source, linked)
+        if build_mpy.out_for(linked) != build_mpy.out_for(source):
+            return 0, "a linked lib got a build of its own"
+        if build_mpy.out_for(build_mpy.NHS_LIB) == build_mpy.out_for(source):
+            return 0, "two different libs share %s" % build_mpy.out_for(source)
+    return 1, ""
+
+
+
+def test_import_cost_bench_accounts_every_module():
+    """tests/import_cost_bench.py on `import nhs_robotics`, in a fresh
+    interpreter because this one imported it long ago. Every module SuperBot
+    pulls in gets a row, nested under what imported it, and a module's own
+    share is never more than the whole of it."""
+    if not _on_laptop():
+        return 2, "run tests/import_cost_bench.py on the robot after a reset"
+    import ast
+    import os
+    import subprocess
+    here = os.path.dirname(os.path.abspath(__file__))
+    done = subprocess.run(
+        [sys.executable, "-c", "import import_cost_bench as b; "
+         "print(repr(b.profile('nhs_robotics')))"],
+        cwd=here, capture_output=True, text=True, timeout=60)
+    if done.returncode:
+        return 0, done.stderr.strip().splitlines()[-1]
+    rows = ast.literal_eval(done.stdout.strip().splitlines()[-1])
+    depth = dict((row[0], row[1]) for row in rows)
+    for name in ("nhs_robotics.superbot", "nhs_robotics.vision",
+                 "nhs_robotics.navigation", "nhs_robotics.line_follower",
+                 "qwiic_huskylens", "controller"):
+        if name not in depth:
+            return 0, "no row for %s" % name
+    if depth["nhs_robotics"] != 0 or depth["nhs_robotics.vision"] <= \
+            depth["nhs_robotics.superbot"]:
+        return 0, "vision not nested under superbot: %s" % depth
+    for name, _, us, _, self_us, _ in rows:
+        if not 0 <= self_us <= us:
+            return 0, "%s: own %d us of %d us" % (name, self_us, us)
+    top = sum(row[2] for row in rows if row[1] == 0)
+    if sum(row[4] for row in rows) != top:
+        return 0, "own shares do not add up to the import"
+    return 1, ""
+
+# The least a written page can cost: command, address and the 258-byte
+# frame down the wire, the acks back, and the STM32 programming it.
+# Writing a byte per uart.write() and polling for the ack every 10 ms cost
+# 51 ms a page.
+def _stm32_wire_ms_per_page(bench):
+    return ((2 + 1 + 5 + 1 + 258 + 1) * bench.BYTE_US + bench.PROGRAM_US) / 1000
+
+
+def test_stm32_flash_bench():
+    """tests/stm32_flash_bench.py, short. The image lands in flash and
+    reads back, only the pages it covers are erased, and a page costs
+    little more than its time on the wire, in a handful of writes."""
+    if not _on_laptop():
+        return 2, "the bench stands in for the STM32 on a laptop"
+    import stm32_flash_bench
+    result = stm32_flash_bench.run(kb=16)
+    if not result["verified"]:
+        return 0, "the image did not land: " + stm32_flash_bench.report(result)
+    if not result["kept"]:
+        return 0, "erased past the image: " + stm32_flash_bench.report(result)
+    wire = _stm32_wire_ms_per_page(stm32_flash_bench)
+    if result["write_ms_per_page"] > 1.1 * wire or result["writes_per_page"] > 3:
+        return 0, "%.1f ms on the wire: %s" % (wire, stm32_flash_bench.report(result))
+    return 1, ""
+
+
+def test_stm32_differential_update():
+    """update_firmware(differential=True) against the simulated bootloader.
+    With the record of the last update, one changed page costs a fraction
+    of a full update. With no record, or a record of firmware flashed some
+    other way since, it finds the changed pages by reading back. Every way,
+    exactly the changed pages are rewritten and the flash ends up as the
+    image."""
+    if not _on_laptop():
+        return 2, "the bench stands in for the STM32 on a laptop"
+    import stm32_flash_bench
+    for record in ("good", "none", "stale"):
+        result = stm32_flash_bench.run_differential(kb=16, changed=1, record=record)
+        if not result["verified"] or result["found"] != result["edited"]:
+            return 0, stm32_flash_bench.report_differential(result)
+    result = stm32_flash_bench.run_differential(kb=64, changed=1, record="good")
+    if result["compare_ms"] + result["write_ms"] > result["full_ms"] / 3:
+        return 0, stm32_flash_bench.report_differential(result)
+    return 1, ""
+
+
+print("Loaded regression_host.py V13")
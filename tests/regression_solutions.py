@@ -1,14 +1,24 @@
-# tests/regression_solutions.py -- solution-level regression. V02
+# tests/regression_solutions.py -- solution-level regression. V16
 #
 # Runs the real files out of solutions/, unmodified, inside the testbench.
 # Every test returns (status, message) the way the rest of the suite does:
 # 1 pass, 0 fail, 2 skip.
 
+import contextlib
+import io
+import math
 import os
+import time
 
-from tb import scoreboard
+from tb import scoreboard, wiring
+from tb.arena import Arena, TOF_RANGE_CM
 from tb.env import Environment, solution
-from tb.plant import Plant, Target, DEFAULT_DEFECTS
+from tb.floor import RasterFloor
+from tb.plant import (Plant, Target, DEFAULT_DEFECTS, TARGET_RADIUS_CM,
+                      LINE_HALF_WIDTH_CM, SENSOR_ON_VALUE, SENSOR_OFF_VALUE,
+                      SENSOR_FORWARD_CM, SENSOR_HALF_SPACING_CM,
+                      SENSOR_SPOT_CM)
+from tb.scenario import Scenario
 from tb.stimulus import ApproachStimulus, Coverage
 
 # Line alignment. Parked for Term 2 and renamed to sol1x. The checks
@@ -413,6 +423,1006 @@ def test_p09_cancel_stops_it_before_the_match():
                           scoreboard.check_stopped_cleanly(env.monitor))
 
 
+# --------------------------------------------------------------------------
+# P09 -- many pushes from one patrol
+# --------------------------------------------------------------------------
+
+# Long enough that the robot has met the rim a few times and is somewhere
+# nobody chose, which is the point of dropping the pushes in there.
+P09_BRANCH_MS = 20000
+
+
+def _sumo_env():
+    plant = Plant(ring=RING, start=(0.0, 0.0, 0.0))
+    return Environment(plant=plant, stimulus=_PressCrossAt(200),
+                       watchdog_ms=60000)
+
+
+def _sumo_scenario():
+    return Scenario(solution(P09), _sumo_env, "twenty seconds of patrol",
+                    lambda env: env.clock.now_ms >= P09_BRANCH_MS)
+
+
+def _drop_target(mode, bearing_deg, gap_cm, speed_cms=0.0):
+    """A target placed relative to wherever the patrol has taken the robot,
+    at the moment of the branch. bearing_deg is off the robot's nose,
+    positive to its left."""
+    def apply(env):
+        plant = env.plant
+        nose_x, nose_y = plant.nose_point()
+        radians = math.radians(plant.theta + bearing_deg)
+        reach = gap_cm + TARGET_RADIUS_CM
+        plant.target = Target(nose_x + reach * math.cos(radians),
+                              nose_y + reach * math.sin(radians),
+                              mode, speed_cms=speed_cms, gap_cm=gap_cm)
+    return apply
+
+
+P09_PUSHES = (
+    ("empty ring", lambda env: None),
+    ("glued to the nose", _drop_target("glued", 0.0, 2.0)),
+    ("parked dead ahead", _drop_target("stand", 0.0, 8.0)),
+    ("charging from the left", _drop_target("chase", 60.0, 25.0, 12.0)),
+    ("charging from the right", _drop_target("chase", -60.0, 25.0, 12.0)),
+    ("charging from behind", _drop_target("chase", 180.0, 20.0, 12.0)),
+    ("backing away ahead", _drop_target("flee", 0.0, 2.0, 20.0)),
+)
+
+
+def _sumo_verdict(env):
+    return _first_failure(
+        _ran_without_raising(env),
+        scoreboard.check_stayed_in_ring(env),
+        scoreboard.check_stopped_cleanly(env.monitor),
+    )
+
+
+def _sumo_fingerprint(env):
+    """Enough of the end state that two runs agreeing on it ran the same."""
+    return (round(env.plant.x, 6), round(env.plant.y, 6),
+            round(env.plant.theta, 6), len(env.monitor.transactions),
+            env.clock.now_ms)
+
+
+def test_p09_pushes_from_one_patrol():
+    """Every push, all from the same twenty seconds of patrol, forked
+    there if the patrol takes longer to run than a fork costs."""
+    if not _have(P09):
+        return 2, "%s not written yet" % P09
+    verdicts = _sumo_scenario().run(P09_PUSHES, _sumo_verdict)
+    for name, _apply in P09_PUSHES:
+        status, message = verdicts[name]
+        if status == 0:
+            return 0, "%s: %s" % (name, message)
+    return 1, ""
+
+
+def test_p09_fork_matches_replay():
+    """A fork, and a variant carried on in-process from the branch point,
+    have to land exactly where a replay from boot lands, or a verdict from
+    either is about some other run."""
+    if not _have(P09):
+        return 2, "%s not written yet" % P09
+    pushes = P09_PUSHES[1:3]
+    replayed = _sumo_scenario().replay(pushes, _sumo_fingerprint)
+    for how, run in (
+            ("forked", lambda s: s.fork(pushes, _sumo_fingerprint)),
+            ("carried on", lambda s: s._branch(pushes, _sumo_fingerprint,
+                                               lambda count: False))):
+        got = run(_sumo_scenario())
+        for name, _apply in pushes:
+            if got[name] != replayed[name]:
+                return 0, "%s: %s %s, replayed %s" % (
+                    name, how, got[name], replayed[name])
+    return 1, ""
+
+
+def test_checkpoint_restores_the_world():
+    """Plant, clock and monitor come back exactly, and more than once."""
+    env = Environment(plant=Plant(ring=RING, target=Target(22.0, 0.0)))
+    saved = env.checkpoint()
+    before = (env.plant.x, env.plant.target.x, env.clock.now_ms,
+              len(env.monitor.transactions))
+    for _ in range(2):
+        env.plant.drive(20.0, 30.0)
+        env.plant.target.x = 99.0
+        env.monitor.record("drive", 20.0, 30.0)
+        env.clock.advance(1000)
+        env.restore(saved)
+        after = (env.plant.x, env.plant.target.x, env.clock.now_ms,
+                 len(env.monitor.transactions))
+        if after != before:
+            return 0, "restored to %s, expected %s" % (after, before)
+    return 1, ""
+
+
+def _reference_line_sensors(plant):
+    """The line sensors worked out the long way, every time, with nothing
+    kept between calls. What the floor map must agree with."""
+    radians = math.radians(plant.theta)
+    nose_x = plant.x + SENSOR_FORWARD_CM * math.cos(radians)
+    nose_y = plant.y + SENSOR_FORWARD_CM * math.sin(radians)
+    points = [(nose_x - off * math.sin(radians), nose_y + off * math.cos(radians))
+              for off in (SENSOR_HALF_SPACING_CM, 0.0, -SENSOR_HALF_SPACING_CM)]
+    if plant.ring is not None:
+        inner = plant.ring[0] - plant.ring[1]
+        return tuple(SENSOR_OFF_VALUE if math.hypot(x, y) > inner
+                     else SENSOR_ON_VALUE for x, y in points)
+    radians = math.radians(plant.line_angle)
+    readings = []
+    for x, y in points:
+        dx = x - plant.line_point[0]
+        dy = y - plant.line_point[1]
+        gap = abs(dx * math.sin(radians) - dy * math.cos(radians))
+        readings.append(SENSOR_ON_VALUE if gap <= LINE_HALF_WIDTH_CM
+                        else SENSOR_OFF_VALUE)
+    return tuple(readings)
+
+
+def test_floor_map_agrees_with_the_geometry():
+    """The line sensors read what the geometry says, on the tape and in
+    the ring, at poses chosen to straddle the edges -- including after the
+    line is moved under a plant that has already built its floor map, and
+    after the sensors' own defects are changed part way through a run."""
+    import random
+    rng = random.Random(27)
+    for ring in (None, RING):
+        plant = Plant(ring=ring)
+        for trial in range(400):
+            if trial == 200:
+                plant.line_point = (10.0, -5.0)
+                plant.line_angle = 30.0
+            if ring is None:
+                plant.x = rng.uniform(25.0, 45.0)
+            else:
+                plant.x = rng.uniform(20.0, 45.0)
+            plant.y = rng.uniform(-20.0, 20.0)
+            plant.theta = rng.uniform(0.0, 360.0)
+            for _poll in range(2):
+                got = plant.get_line_sensors()
+                want = _reference_line_sensors(plant)
+                if got != want:
+                    return 0, "ring=%s pose %.2f,%.2f,%.1f: read %s, expected %s" % (
+                        ring, plant.x, plant.y, plant.theta, got, want)
+
+    # The left sensor half over the edge of a strip of tape
+    plant = Plant(floor=Arena.from_dict(
+        {"tape": [{"polyline": [[-20, 2.4], [20, 2.4]]}]}))
+    polled = [plant.get_line_sensors()]
+    plant.defects["line_on"] = (700, 800, 900)
+    polled.append(plant.get_line_sensors())
+    plant.sensor_spot_cm = SENSOR_SPOT_CM
+    polled.append(plant.get_line_sensors())
+    if polled[0] != (SENSOR_ON_VALUE, SENSOR_OFF_VALUE, SENSOR_OFF_VALUE) or \
+            polled[1] != (700, SENSOR_OFF_VALUE, SENSOR_OFF_VALUE) or \
+            not SENSOR_OFF_VALUE < polled[2][0] < 700:
+        return 0, "as line_on then the spot changed, read %s" % polled
+    return 1, ""
+
+
+def test_raster_floor_matches_within_a_cell():
+    """A rasterised ring reads the same as the exact one everywhere more
+    than a cell's diagonal from the rim."""
+    import random
+    exact = Plant(ring=RING).floor_map()
+    cell = 0.5
+    raster = RasterFloor(exact, (-50.0, -50.0, 50.0, 50.0), cell_cm=cell)
+    inner = RING[0] - RING[1]
+    rng = random.Random(28)
+    for _ in range(2000):
+        x, y = rng.uniform(-50.0, 50.0), rng.uniform(-50.0, 50.0)
+        if abs(math.hypot(x, y) - inner) <= cell * 1.5:
+            continue
+        if raster.is_dark(x, y) != exact.is_dark(x, y):
+            return 0, "raster and exact disagree at %.2f,%.2f" % (x, y)
+    if raster.is_dark(80.0, 0.0):
+        return 0, "off the edge of the raster read as dark"
+    return 1, ""
+
+
+def floor_report():
+    """Cost of one line-sensor poll from the floor map, against the same
+    geometry worked out the long way, the same pose polled twice per pass
+    of a DUT's loop and then a new pose. Wall-clock, so it moves with the
+    machine."""
+    plant = Plant(ring=RING)
+    polls = 20000
+    start = time.perf_counter()
+    for index in range(polls):
+        if index % 2 == 0:
+            plant.x = (index % 400) * 0.05
+        _reference_line_sensors(plant)
+    reference_s = time.perf_counter() - start
+    start = time.perf_counter()
+    for index in range(polls):
+        if index % 2 == 0:
+            plant.x = (index % 400) * 0.05
+        plant.get_line_sensors()
+    mapped_s = time.perf_counter() - start
+    return ("  line sensors, %d polls: long way %.2f us/poll, floor map "
+            "%.2f us/poll" % (polls, reference_s / polls * 1e6,
+                              mapped_s / polls * 1e6))
+
+
+def scenario_report():
+    """What the P09 pushes cost replayed from boot, forced to fork, and
+    run(), which forks only if the patrol it would share costs more than
+    forking. The prefix and what each fork cost over it are measured on
+    their own, so FORK_COST_S can be checked against them. Wall-clock, so
+    it moves with the machine."""
+    from tb import scenario as scenario_module
+    count = len(P09_PUSHES)
+    timings = []
+    for how in ("replay", "fork", "run"):
+        scenario = _sumo_scenario()
+        start = time.perf_counter()
+        getattr(scenario, how)(P09_PUSHES, _sumo_verdict)
+        timings.append(time.perf_counter() - start)
+        if how == "fork":
+            prefix_s = scenario.prefix_s
+        if how == "run":
+            forked = scenario.forked
+    replay_s, fork_s, run_s = timings
+    # A fork runs the prefix once and every variant's own tail; a replay
+    # runs the prefix once per variant. The rest of a fork is its children.
+    tails_s = replay_s - count * prefix_s
+    per_fork_s = (fork_s - prefix_s - tails_s) / count
+    return ("  %d pushes branched at %d ms, prefix %.1f ms, each fork "
+            "%+.1f ms over carrying on (FORK_COST_S %.1f ms)\n"
+            "  replay %.0f ms, fork %.0f ms (x%.2f), run %.0f ms (%s)" % (
+                count, P09_BRANCH_MS, prefix_s * 1000, per_fork_s * 1000,
+                scenario_module.FORK_COST_S * 1000, replay_s * 1000,
+                fork_s * 1000, replay_s / fork_s, run_s * 1000,
+                "forked" if forked else "did not fork"))
+
+
+# --------------------------------------------------------------------------
+# Isolated runs -- side by side in one interpreter
+# --------------------------------------------------------------------------
+
+def _isolated_sumo(target=None):
+    plant = Plant(ring=RING, target=target, start=(0.0, 0.0, 0.0))
+    return Environment(plant=plant, stimulus=_PressCrossAt(200),
+                       watchdog_ms=30000, isolated=True, seed=9)
+
+
+def test_isolated_runs_side_by_side():
+    """Four sumo runs on four threads at once, each in its own sandbox,
+    must each land exactly where the same run lands on its own -- and a
+    plain run, seeded the same, must land there too. Nothing process-wide
+    may be left changed."""
+    import random
+    import sys
+    import threading
+    if not _have(P09):
+        return 2, "%s not written yet" % P09
+    # Built afresh for every run: the plant moves its target in place.
+    targets = (lambda: None, lambda: Target(22.0, 0.0, "stand"),
+               lambda: Target(10.0, 0.0, "glued", gap_cm=2.0),
+               lambda: Target(0.0, 25.0, "chase", speed_cms=12.0))
+
+    alone = []
+    for target in targets:
+        env = _isolated_sumo(target())
+        env.run(solution(P09))
+        alone.append(_sumo_fingerprint(env))
+
+    random.seed(9)
+    plain = _run_sumo(target=Target(22.0, 0.0, "stand"), watchdog_ms=30000)
+    if _sumo_fingerprint(plain) != alone[1]:
+        return 0, "plain run %s, isolated %s" % (_sumo_fingerprint(plain),
+                                                 alone[1])
+
+    time_before = sys.modules["time"]
+    envs = [_isolated_sumo(target()) for target in targets]
+    threads = [threading.Thread(target=env.run, args=(solution(P09),))
+               for env in envs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for index, env in enumerate(envs):
+        if env.result.error is not None:
+            return 0, "thread %d raised %r" % (index, env.result.error)
+        if _sumo_fingerprint(env) != alone[index]:
+            return 0, "thread %d ended at %s, alone at %s" % (
+                index, _sumo_fingerprint(env), alone[index])
+    if sys.modules["time"] is not time_before or wiring.ACTIVE is not None:
+        return 0, "an isolated run left the process changed"
+    return 1, ""
+
+
+def isolation_report():
+    """What a run costs before the DUT gets going: a P09 run that Cancel
+    ends at once, plain and isolated. Wall-clock."""
+    runs = 200
+    lines = []
+    for label, isolated in (("plain", False), ("isolated", True)):
+        start = time.perf_counter()
+        for _ in range(runs):
+            plant = Plant(ring=RING)
+            env = Environment(plant=plant, stimulus=_HoldCancelAndCross(),
+                              watchdog_ms=20000, isolated=isolated)
+            env.run(solution(P09))
+        elapsed = time.perf_counter() - start
+        lines.append("  %-8s %6.0f us/run" % (label, elapsed / runs * 1e6))
+    return "\n".join(lines)
+
+
+# --------------------------------------------------------------------------
+# Courses -- arenas from tb/arenas, and the real LineFollower on them
+# --------------------------------------------------------------------------
+
+ARENAS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tb", "arenas")
+
+# The teacher's own hardware smoke test, run as it is. It follows the line
+# with the real LineFollower until Cancel.
+FOLLOW_LINE_HW = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              "test_follow_line_hw.py")
+
+# Furthest the centre sensor may stray from the middle of the tape. The
+# tape is 2 cm wide, so this is "still touching it".
+LAP_STRAY_CM = 1.5
+
+class _CancelAfterLap:
+    """Holds Cancel once the robot comes back across the start line: the
+    line through where it started, square to the way it faced, within
+    home_cm of the start, crossed going forwards at least half way round.
+    turned is how far round it had turned then. Latched: a DUT may poll
+    Cancel once a loop and still has to see it."""
+
+    def __init__(self, plant, home_cm=10.0):
+        self.start = (plant.x, plant.y, plant.theta)
+        self.home_cm = home_cm
+        self.lap_ms = None
+        self.turned = None
+        self._ahead = None       # how far past the start line, last look
+
+    def touch(self, name, env):
+        if name != "cancel":
+            return False
+        if self.lap_ms is None:
+            self._look(env)
+        return self.lap_ms is not None
+
+    def _look(self, env):
+        plant = env.plant
+        x, y, theta = self.start
+        turned = abs(plant.theta - theta)
+        heading = math.radians(theta)
+        dx, dy = plant.x - x, plant.y - y
+        ahead = dx * math.cos(heading) + dy * math.sin(heading)
+        aside = dy * math.cos(heading) - dx * math.sin(heading)
+        if self._ahead is not None and self._ahead < 0.0 <= ahead and \
+                turned >= 180.0 and abs(aside) <= self.home_cm:
+            self.lap_ms = env.clock.now_ms
+            self.turned = turned
+        self._ahead = ahead
+
+
+def _whole_turns(lap):
+    """Turns made by the start line, to the nearest whole one. Out of the
+    last bend the robot squares up to the tape from below without
+    overshooting, so at the line it is a fraction of a degree short of
+    360 and would be for as long as it followed the straight."""
+    return int(round(lap.turned / 360.0))
+
+
+def _run_lap(arena_name, watchdog_ms=150000, defects=None,
+             dut_path=FOLLOW_LINE_HW):
+    arena = Arena.load(os.path.join(ARENAS, arena_name))
+    plant = Plant.from_arena(arena, sensor_spot_cm=SENSOR_SPOT_CM,
+                             defects=defects)
+    stimulus = _CancelAfterLap(plant)
+    env = Environment(plant=plant, stimulus=stimulus, watchdog_ms=watchdog_ms)
+    env.worst_stray_cm = 0.0
+    env.turn_rates = []
+    env.set_off_ms = None
+    env.off_line_ms = 0
+    last_ms = [None]
+
+    def stray(env):
+        # Counted once it sets off along the tape. Calibrating first
+        # sweeps the sensors across it on purpose, without going anywhere.
+        if env.plant.distance_travelled_cm == 0.0:
+            return
+        if env.set_off_ms is None:
+            env.set_off_ms = env.clock.now_ms
+        centre = env.plant.sensor_positions()[1]
+        gap = arena.distance_to_tape(*centre)
+        gap = float("inf") if gap is None else gap
+        env.worst_stray_cm = max(env.worst_stray_cm, gap)
+        env.turn_rates.append(env.plant.yaw_rate_deg_s)
+        # Off the line: not one of the three sensors over the tape
+        now = env.clock.now_ms
+        if last_ms[0] is not None and all(
+                _off_tape(arena, *spot) for spot in env.plant.sensor_positions()):
+            env.off_line_ms += now - last_ms[0]
+        last_ms[0] = now
+
+    env.probes.append(stray)
+    # The smoke test prints a line every pass once it has run 15 s.
+    with contextlib.redirect_stdout(io.StringIO()):
+        env.run(dut_path)
+    return env, stimulus
+
+
+def _off_tape(arena, x, y):
+    gap = arena.distance_to_tape(x, y)
+    return gap is None or gap > LINE_HALF_WIDTH_CM
+
+
+def _lap_ms(env, lap):
+    """From setting off to back home, or None for no lap."""
+    if lap.lap_ms is None:
+        return None
+    return lap.lap_ms - env.set_off_ms
+
+
+def test_line_follower_laps_the_oval():
+    """Two straights and two bends, followed all the way round by the real
+    LineFollower. Scored on the plant's own position against the tape."""
+    env, lap = _run_lap("oval.json")
+    if lap.lap_ms is None:
+        return 0, "no lap in %d ms; stopped at %.1f,%.1f" % (
+            env.clock.now_ms, env.plant.x, env.plant.y)
+    if _whole_turns(lap) != 1:
+        return 0, "turned %.1f deg by the start line" % lap.turned
+    if env.worst_stray_cm > LAP_STRAY_CM:
+        return 0, "strayed %.1f cm from the tape" % env.worst_stray_cm
+    return _first_failure(_ran_without_raising(env))
+
+
+# Robots whose three line sensors read the tape differently, left to
+# right. REFERENCE.md measured anywhere from 300 to 650.
+LINE_SWEEP = [(400, 400, 400), (650, 400, 300), (300, 650, 300),
+              (300, 400, 650)]
+
+# How much the turn rate may change from one 10 ms tick to the next,
+# averaged over the lap. A follower that kicks on every few counts of
+# floor noise swings it by tens of deg/s every tick.
+LAP_CHURN_DEG_S = 5.0
+
+
+def _churn(env):
+    rates = env.turn_rates
+    steps = [abs(b - a) for a, b in zip(rates, rates[1:])]
+    return sum(steps) / len(steps) if steps else 0.0
+
+
+def test_line_follower_is_steady_on_every_robot():
+    """The oval again, on robots whose sensors disagree about the tape.
+    The smoke test calibrates first, so each has to lap as well as the
+    next, without sawing at the wheels, on what it measured."""
+    for line_on in LINE_SWEEP:
+        env, lap = _run_lap("oval.json", defects=dict(DEFAULT_DEFECTS,
+                                                      line_on=line_on))
+        where = "tape reading %s: " % (line_on,)
+        if lap.lap_ms is None:
+            return 0, where + "no lap in %d ms" % env.clock.now_ms
+        if env.worst_stray_cm > LAP_STRAY_CM:
+            return 0, where + "strayed %.1f cm from the tape" % env.worst_stray_cm
+        if _churn(env) > LAP_CHURN_DEG_S:
+            return 0, where + "turn rate churns %.1f deg/s a tick" % _churn(env)
+        highs = env.namespace["lf"].highs
+        if highs != line_on:
+            return 0, where + "calibrated to %s" % (highs,)
+        failure = _first_failure(_ran_without_raising(env))
+        if failure[0] != 1:
+            return failure
+    return 1, ""
+
+
+def line_report():
+    """Lap time, worst stray and turn-rate churn on each robot."""
+    lines = ["  %-17s %7s %7s %9s" % ("tape reads", "lap s", "stray", "churn")]
+    for line_on in LINE_SWEEP:
+        env, lap = _run_lap("oval.json", defects=dict(DEFAULT_DEFECTS,
+                                                      line_on=line_on))
+        lap_ms = _lap_ms(env, lap)
+        lap_s = "-" if lap_ms is None else "%.1f" % (lap_ms / 1000.0)
+        lines.append("  %-17s %7s %5.2f cm %5.1f/tick" % (
+            line_on, lap_s, env.worst_stray_cm, _churn(env)))
+    return "\n".join(lines)
+
+
+# The teacher's full-speed smoke test, run as it is. It follows at the
+# wheels' top speed and leaves slowing for the bends to LineFollower.
+LINE_RACE_HW = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "test_line_race_hw.py")
+
+# Wheels that take from no time at all to a fifth of a second to reach a
+# new speed. Nobody has measured it; these bracket it.
+RACE_RESPONSE_MS = (0, 100, 200)
+
+# The curves at full speed: a lap in this long from setting off, and the
+# centre sensor no further than this off the middle of the tape.
+RACE_LAP_MS = 35000
+RACE_STRAY_CM = 0.75
+
+
+def _race(response_ms):
+    return _run_lap("curves.json", dut_path=LINE_RACE_HW,
+                    defects=dict(DEFAULT_DEFECTS, wheel_response_ms=response_ms))
+
+
+def test_line_follower_races_the_curves():
+    """Four 10 cm bends, two of them hairpins, at full speed. Scored on
+    lap time and on how close to the tape it stayed getting there."""
+    for response_ms in RACE_RESPONSE_MS:
+        env, lap = _race(response_ms)
+        where = "wheels settling in %d ms: " % response_ms
+        if lap.lap_ms is None:
+            return 0, where + "no lap in %d ms" % env.clock.now_ms
+        if _lap_ms(env, lap) > RACE_LAP_MS:
+            return 0, where + "lap took %d ms" % _lap_ms(env, lap)
+        if env.worst_stray_cm > RACE_STRAY_CM:
+            return 0, where + "strayed %.2f cm from the tape" % env.worst_stray_cm
+        failure = _first_failure(_ran_without_raising(env))
+        if failure[0] != 1:
+            return failure
+    return 1, ""
+
+
+def race_report():
+    """Lap time and worst stray on the curves, for each wheel response."""
+    lines = []
+    for response_ms in RACE_RESPONSE_MS:
+        env, lap = _race(response_ms)
+        lap_ms = _lap_ms(env, lap)
+        lap_s = "-" if lap_ms is None else "%.1f s" % (lap_ms / 1000.0)
+        lines.append("  wheels %3d ms: lap %s, stray %.2f cm" % (
+            response_ms, lap_s, env.worst_stray_cm))
+    return "\n".join(lines)
+
+
+# Two hairpins of 2 cm radius, tighter than the robot can take at speed:
+# it runs off the end of each and has to turn back for the line. In all,
+# this long off it a lap, counted from the plant's own sensor spots.
+HAIRPIN_OFF_LINE_MS = 2000
+
+
+def _hairpins(response_ms):
+    return _run_lap("hairpins.json", dut_path=LINE_RACE_HW,
+                    defects=dict(DEFAULT_DEFECTS, wheel_response_ms=response_ms))
+
+
+def test_line_follower_finds_the_hairpins():
+    """Full speed round two hairpins it cannot make. Each time it runs off,
+    LineFollower has to turn back the way the line went and pick it up
+    again, without the smoke test stopping to wait."""
+    for response_ms in RACE_RESPONSE_MS:
+        env, lap = _hairpins(response_ms)
+        where = "wheels settling in %d ms: " % response_ms
+        if lap.lap_ms is None:
+            return 0, where + "no lap in %d ms; stopped at %.1f,%.1f" % (
+                env.clock.now_ms, env.plant.x, env.plant.y)
+        if env.off_line_ms > HAIRPIN_OFF_LINE_MS:
+            return 0, where + "off the line %d ms in a lap" % env.off_line_ms
+        lf = env.namespace["lf"]
+        if lf.recoveries == 0 or lf.recovery_ms is None:
+            return 0, where + "never ran off, so nothing was tested"
+        failure = _first_failure(_ran_without_raising(env))
+        if failure[0] != 1:
+            return failure
+    return 1, ""
+
+
+def hairpin_report():
+    """Lap time, time off the line and recoveries on the hairpins."""
+    lines = []
+    for response_ms in RACE_RESPONSE_MS:
+        env, lap = _hairpins(response_ms)
+        lap_ms = _lap_ms(env, lap)
+        lap_s = "-" if lap_ms is None else "%.1f s" % (lap_ms / 1000.0)
+        lf = env.namespace["lf"]
+        lines.append("  wheels %3d ms: lap %s, off the line %d ms, "
+                     "%d recoveries, last %s ms" % (
+                         response_ms, lap_s, env.off_line_ms, lf.recoveries,
+                         lf.recovery_ms))
+    return "\n".join(lines)
+
+
+# The teacher's drive_distance smoke test, run as it is: five moves, out
+# and back, each followed by a pause.
+DRIVE_DISTANCE_HW = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 "test_drive_distance_hw.py")
+
+# Where each move may stop, against what it asked for. The first move of
+# a run has not had a brake to learn the roll from yet, so it gets more.
+DRIVE_STOP_CM = 1.0
+DRIVE_FIRST_STOP_CM = 1.5
+
+# The robots it has to work on: drive() short by 15% or not at all, slow
+# or instant off the mark, and a brake that rolls from a little to three
+# times what REFERENCE.md measured.
+DRIVE_SWEEP = [dict(DEFAULT_DEFECTS, drive_scale=scale, drive_lag_ms=lag,
+                    brake_settle_ms=settle)
+               for scale in (0.85, 1.0)
+               for lag in (0, 400)
+               for settle in (200, 500, 800)]
+
+
+def _run_drive_distance(defects):
+    """Run the smoke test on one robot. Returns the env and, for every
+    move, (asked cm, stopped cm, ms it took). Where it stopped comes from
+    the plant's wheels when the next move starts, so it includes the roll
+    after the brake, in the same degrees-per-cm the library counts in."""
+    env = Environment(plant=Plant(defects=defects), watchdog_ms=60000)
+    wheels = []
+    env.probes.append(lambda env: wheels.append(
+        (env.clock.now_ms,
+         (env.plant.wheel_left_deg + env.plant.wheel_right_deg) / 2.0)))
+    with contextlib.redirect_stdout(io.StringIO()):
+        env.run(DRIVE_DISTANCE_HW)
+
+    def wheel_at(ms):
+        deg = 0.0
+        for when, value in wheels:
+            if when > ms:
+                break
+            deg = value
+        return deg
+
+    results = env.namespace.get("RESULTS", [])
+    per_cm = env.namespace["nav"].DEGREES_PER_CM
+    moves = []
+    for i, (asked, start, done) in enumerate(results):
+        end = results[i + 1][1] if i + 1 < len(results) else env.clock.now_ms
+        stopped = (wheel_at(end) - wheel_at(start)) / per_cm
+        moves.append((asked, stopped, done - start))
+    return env, moves
+
+
+def test_drive_distance_lands_on_every_robot():
+    """Every move of the smoke test, on every robot in the sweep, stops
+    within DRIVE_STOP_CM of where it was sent."""
+    for defects in DRIVE_SWEEP:
+        env, moves = _run_drive_distance(defects)
+        robot = "scale %.2f, lag %d ms, brake %d ms" % (
+            defects["drive_scale"], defects["drive_lag_ms"],
+            defects["brake_settle_ms"])
+        status, message = _ran_without_raising(env)
+        if status == 0:
+            return 0, "%s: %s" % (robot, message)
+        if len(moves) != 5:
+            return 0, "%s: %d of 5 moves finished" % (robot, len(moves))
+        for i, (asked, stopped, _ms) in enumerate(moves):
+            limit = DRIVE_FIRST_STOP_CM if i == 0 else DRIVE_STOP_CM
+            if abs(stopped - asked) > limit:
+                return 0, "%s: asked %+d cm, stopped at %+.1f cm" % (
+                    robot, asked, stopped)
+    return 1, ""
+
+
+def drive_report():
+    """Each move of the smoke test on the default robot: where it stopped
+    and how long the move took, settle included."""
+    _env, moves = _run_drive_distance(dict(DEFAULT_DEFECTS))
+    return "\n".join("  %+4d cm: stopped %+.2f cm off, %d ms"
+                     % (asked, stopped - asked, ms)
+                     for asked, stopped, ms in moves)
+
+
+# The teacher's turn_to_heading smoke test, run as it is: six turns, big
+# and small, each followed by a pause.
+TURN_TO_HEADING_HW = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                  "test_turn_to_heading_hw.py")
+TURN_TOLERANCE_DEG = 2.0
+
+# Mean time per turn across the sweep. The bang-bang loop this replaced
+# averaged 2220 ms on the turns it finished, and with a long brake it
+# rolled out of tolerance on every one.
+TURN_MEAN_MS = 2000
+
+# IMU zero anywhere, so the turns cross the wrap at different places; a
+# short brake and a long one; drive() short or not.
+TURN_SWEEP = [dict(DEFAULT_DEFECTS, yaw_offset_deg=offset, brake_settle_ms=settle,
+                   drive_scale=scale)
+              for offset in (0.0, 180.0, 359.0)
+              for settle in (200, 800)
+              for scale in (0.85, 1.0)]
+
+
+def _run_turn_to_heading(defects):
+    """Run the smoke test on one robot. Returns the env and, for every
+    turn, (degrees off the target once it had stopped, ms the call took)."""
+    env = Environment(plant=Plant(defects=defects), watchdog_ms=60000)
+    yaws = []
+    env.probes.append(lambda env: yaws.append(
+        (env.clock.now_ms, env.plant.get_orientation()[2])))
+    with contextlib.redirect_stdout(io.StringIO()):
+        env.run(TURN_TO_HEADING_HW)
+
+    def yaw_at(ms):
+        yaw = None
+        for when, value in yaws:
+            if when > ms:
+                break
+            yaw = value
+        return yaw
+
+    results = env.namespace.get("RESULTS", [])
+    turns = []
+    for i, (target, start, done) in enumerate(results):
+        end = results[i + 1][1] if i + 1 < len(results) else env.clock.now_ms
+        off = (yaw_at(end) - target + 180.0) % 360.0 - 180.0
+        turns.append((off, done - start))
+    return env, turns
+
+
+def test_turn_to_heading_settles_on_every_robot():
+    """Every turn of the smoke test, on every robot in the sweep, comes to
+    rest within tolerance, and on average faster than TURN_MEAN_MS."""
+    times = []
+    for defects in TURN_SWEEP:
+        env, turns = _run_turn_to_heading(defects)
+        robot = "yaw zero %.0f, brake %d ms, scale %.2f" % (
+            defects["yaw_offset_deg"], defects["brake_settle_ms"],
+            defects["drive_scale"])
+        status, message = _ran_without_raising(env)
+        if status == 0:
+            return 0, "%s: %s" % (robot, message)
+        if len(turns) != 6:
+            return 0, "%s: %d of 6 turns finished" % (robot, len(turns))
+        for i, (off, ms) in enumerate(turns):
+            if abs(off) > TURN_TOLERANCE_DEG:
+                return 0, "%s: turn %d came to rest %+.1f deg off" % (robot, i + 1, off)
+            times.append(ms)
+    mean = sum(times) / len(times)
+    if mean > TURN_MEAN_MS:
+        return 0, "turns took %d ms on average, more than %d" % (mean, TURN_MEAN_MS)
+    return 1, ""
+
+
+def turn_report():
+    """Each turn of the smoke test on the default robot: where it came to
+    rest and how long the call took."""
+    _env, turns = _run_turn_to_heading(dict(DEFAULT_DEFECTS))
+    return "\n".join("  turn %d: rest %+.2f deg off, %d ms" % (i + 1, off, ms)
+                     for i, (off, ms) in enumerate(turns))
+
+
+# The teacher's motion-queue smoke test: the same course blocking and
+# queued, three 20 cm drives and a quarter turn.
+MOTION_QUEUE_HW = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               "test_motion_queue_hw.py")
+QUEUE_COURSE_CM = 60.0
+
+# Where the course ends: within a centimetre when queued, a course with one
+# stop at the end; blocking stops three times, each within DRIVE_STOP_CM.
+QUEUE_STOP_CM = {"queued": DRIVE_STOP_CM, "blocking": 3 * DRIVE_STOP_CM}
+
+# The longest the queued run's main loop may go between ticks: its own
+# 10 ms sleep and a little. A blocking call holds it for the whole move.
+QUEUE_GAP_MS = 20
+
+
+def _run_motion_queue(defects):
+    """Run the smoke test on one robot. Returns the env and, for each run,
+    (how, cm driven, degrees off the heading at rest, ms, worst loop gap)."""
+    env = Environment(plant=Plant(defects=defects), watchdog_ms=60000)
+    samples = []
+    env.probes.append(lambda env: samples.append(
+        (env.clock.now_ms,
+         (env.plant.wheel_left_deg + env.plant.wheel_right_deg) / 2.0,
+         env.plant.get_orientation()[2])))
+    with contextlib.redirect_stdout(io.StringIO()):
+        env.run(MOTION_QUEUE_HW)
+
+    def at(ms):
+        found = samples[0]
+        for sample in samples:
+            if sample[0] > ms:
+                break
+            found = sample
+        return found
+
+    results = env.namespace.get("RESULTS", [])
+    per_cm = env.namespace["nav"].DEGREES_PER_CM
+    runs = []
+    for i, (how, target, start, done, worst) in enumerate(results):
+        end = results[i + 1][2] if i + 1 < len(results) else env.clock.now_ms
+        _when, wheels_end, yaw = at(end)
+        driven = (wheels_end - at(start)[1]) / per_cm
+        # A quarter turn on the spot moves the wheel average not at all
+        off = (yaw - target + 180.0) % 360.0 - 180.0
+        runs.append((how, driven, off, done - start, worst))
+    return env, runs
+
+
+def test_motion_queue_blends_without_holding_the_loop():
+    """On every robot in the drive sweep, the queued run of the smoke test
+    ends where the blocking one does, takes less time, and never holds its
+    main loop longer than QUEUE_GAP_MS."""
+    for defects in DRIVE_SWEEP:
+        env, runs = _run_motion_queue(defects)
+        robot = "scale %.2f, lag %d ms, brake %d ms" % (
+            defects["drive_scale"], defects["drive_lag_ms"],
+            defects["brake_settle_ms"])
+        status, message = _ran_without_raising(env)
+        if status == 0:
+            return 0, "%s: %s" % (robot, message)
+        if len(runs) != 2:
+            return 0, "%s: %d of 2 runs finished" % (robot, len(runs))
+        for how, driven, off, _ms, _worst in runs:
+            if abs(driven - QUEUE_COURSE_CM) > QUEUE_STOP_CM[how]:
+                return 0, "%s: %s run drove %.1f cm" % (robot, how, driven)
+            if abs(off) > TURN_TOLERANCE_DEG:
+                return 0, "%s: %s run came to rest %+.1f deg off" % (robot, how, off)
+        blocking, queued = runs
+        if queued[3] >= blocking[3]:
+            return 0, "%s: queued took %d ms, blocking %d ms" % (
+                robot, queued[3], blocking[3])
+        if queued[4] > QUEUE_GAP_MS:
+            return 0, "%s: the queued loop went %d ms between ticks" % (robot, queued[4])
+    return 1, ""
+
+
+def queue_report():
+    """Both runs of the smoke test on the default robot."""
+    _env, runs = _run_motion_queue(dict(DEFAULT_DEFECTS))
+    return "\n".join("  %-8s %.2f cm, %+.2f deg off, %d ms, loop held %d ms"
+                     % run for run in runs)
+
+
+def _brute_arena(arena):
+    """The same questions asked of every piece of the arena, no index."""
+    def is_dark(x, y):
+        return any(p.distance(x, y) <= p.half_width_cm for p in arena.tape)
+
+    def distance_to_tape(x, y):
+        return min(p.distance(x, y) for p in arena.tape)
+
+    def ray(x, y, angle_deg):
+        radians = math.radians(angle_deg)
+        ux, uy = math.cos(radians), math.sin(radians)
+        hits = [p.ray(x, y, ux, uy) for p in arena.walls + arena.obstacles]
+        hits = [hit for hit in hits if hit is not None and hit <= TOF_RANGE_CM]
+        return min(hits) if hits else None
+
+    return is_dark, distance_to_tape, ray
+
+
+def test_arena_index_agrees_with_every_piece():
+    """Whatever the grid files where, it must answer what asking every
+    piece would answer."""
+    import random
+    arena = Arena.load(os.path.join(ARENAS, "oval.json"))
+    is_dark, distance_to_tape, _ray = _brute_arena(arena)
+    rng = random.Random(28)
+    for _ in range(3000):
+        x, y = rng.uniform(-45.0, 145.0), rng.uniform(-25.0, 85.0)
+        if arena.is_dark(x, y) != is_dark(x, y):
+            return 0, "dark? disagrees at %.2f,%.2f" % (x, y)
+        if abs(arena.distance_to_tape(x, y) - distance_to_tape(x, y)) > 1e-9:
+            return 0, "distance to tape disagrees at %.2f,%.2f" % (x, y)
+    return 1, ""
+
+
+def test_tof_zones_see_which_side():
+    """Five zones, left to right, and each sees only its own slice. A
+    target off to one side lights that side's zones and leaves the other
+    side's reading no echo. Nothing is seen past TOF_RANGE_CM."""
+    for bearing, lit, dark in ((20.0, (0, 1), (3, 4)),
+                               (0.0, (2,), (0, 4)),
+                               (-20.0, (3, 4), (0, 1))):
+        radians = math.radians(bearing)
+        reach = 30.0 + TARGET_RADIUS_CM
+        plant = Plant(target=Target(SENSOR_FORWARD_CM + reach * math.cos(radians),
+                                    reach * math.sin(radians)))
+        zones = plant.get_distance()
+        if not all(zones[index] for index in lit) or \
+                any(zones[index] for index in dark):
+            return 0, "target %+.0f deg off the nose read %s" % (
+                bearing, zones)
+        if abs(min(gap for gap in zones if gap) - 30.0) > 0.5:
+            return 0, "target 30 cm away read %s" % (zones,)
+
+    # A wall across the arena at an angle, square to a line 37 degrees
+    # to the left: nearer with every zone leftwards, and every zone sees it.
+    arena = Arena.from_dict({"walls": [[[80, -40], [20, 40]]]})
+    zones = Plant.from_arena(arena, start=(0.0, 0.0, 0.0)).get_distance()
+    if 0 in zones or list(zones) != sorted(zones):
+        return 0, "a wall leaning in from the left read %s" % (zones,)
+
+    # Nothing past TOF_RANGE_CM, arena or no arena
+    for reach in (TOF_RANGE_CM - 20.0, TOF_RANGE_CM + 20.0):
+        for arena in (None, Arena.from_dict({})):
+            plant = Plant(target=Target(
+                SENSOR_FORWARD_CM + reach + TARGET_RADIUS_CM, 0.0), arena=arena)
+            seen = plant.get_distance()[2]
+            if bool(seen) != (reach <= TOF_RANGE_CM):
+                return 0, "target %.0f cm ahead read %s %s an arena" % (
+                    reach, seen, "in" if arena else "without")
+    return 1, ""
+
+
+def test_tof_rays_agree_with_every_piece():
+    """A ray walked through the grid hits what testing it against every
+    wall and obstacle would hit."""
+    import random
+    rng = random.Random(29)
+    arena = _crowded_arena(rng)
+    _dark, _distance, ray = _brute_arena(arena)
+    for _ in range(3000):
+        x, y = rng.uniform(-20.0, 420.0), rng.uniform(-20.0, 420.0)
+        angle = rng.uniform(0.0, 360.0)
+        want = ray(x, y, angle)
+        got = arena.ray(x, y, angle)
+        if (got is None) != (want is None) or \
+                (got is not None and abs(got - want) > 1e-9):
+            return 0, "ray from %.2f,%.2f at %.1f deg: %s, expected %s" % (
+                x, y, angle, got, want)
+    return 1, ""
+
+
+def _crowded_arena(rng):
+    """Forty pieces of tape, a walled box and two hundred cans."""
+    box = [[0, 0], [400, 0], [400, 400], [0, 400], [0, 0]]
+    return Arena.from_dict({
+        "tape": [{"polyline": [[rng.uniform(0, 400), rng.uniform(0, 400)]
+                               for _ in range(40)]}],
+        "walls": list(zip(box, box[1:])),
+        "obstacles": [{"centre": [rng.uniform(0, 400), rng.uniform(0, 400)],
+                       "radius": 5} for _ in range(200)]})
+
+
+def tof_report():
+    """Cost of one get_distance() -- all five zones, fifteen rays -- with
+    the robot moved between every call, so nothing comes from the cache.
+    Wall-clock, so it moves with the machine."""
+    import random
+    rng = random.Random(29)
+    plants = (
+        ("one target", Plant(target=Target(40.0, 5.0))),
+        ("the oval", Plant.from_arena(Arena.load(os.path.join(ARENAS,
+                                                              "oval.json")))),
+        ("crowded", Plant.from_arena(_crowded_arena(rng),
+                                     start=(200.0, 200.0, 0.0))),
+    )
+    calls = 2000
+    lines = []
+    for label, plant in plants:
+        x, y = plant.x, plant.y
+        start = time.perf_counter()
+        for index in range(calls):
+            plant.theta = index * 0.37
+            plant.get_distance()
+        elapsed = time.perf_counter() - start
+        plant.x, plant.y = x, y
+        lines.append("  get_distance, %-10s %6.1f us/call"
+                     % (label, elapsed / calls * 1e6))
+    return "\n".join(lines)
+
+
+def arena_report():
+    """What a query costs on a crowded arena, indexed against asking every
+    piece. Wall-clock, so it moves with the machine."""
+    import random
+    rng = random.Random(28)
+    arena = _crowded_arena(rng)
+    is_dark, _distance, ray = _brute_arena(arena)
+    points = [(rng.uniform(0, 400), rng.uniform(0, 400), rng.uniform(0, 360))
+              for _ in range(2000)]
+    lines = ["  %d tape pieces, %d walls, %d obstacles"
+             % (len(arena.tape), len(arena.walls), len(arena.obstacles))]
+    for label, indexed, brute in (
+            ("line sensor", lambda x, y, h: arena.is_dark(x, y),
+             lambda x, y, h: is_dark(x, y)),
+            ("ToF ray", lambda x, y, h: arena.ray(x, y, h),
+             lambda x, y, h: ray(x, y, h))):
+        timings = []
+        for query in (brute, indexed):
+            start = time.perf_counter()
+            for x, y, h in points:
+                query(x, y, h)
+            timings.append((time.perf_counter() - start) / len(points) * 1e6)
+        lines.append("  %-11s every piece %7.1f us, grid %5.1f us"
+                     % (label, timings[0], timings[1]))
+    return "\n".join(lines)
+
+
 # --------------------------------------------------------------------------
 # Every solution -- shape checks that need no per-project knowledge
 # --------------------------------------------------------------------------
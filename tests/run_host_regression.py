@@ -33,10 +33,54 @@ def main():
     runner.run_test("Host: Stick Deadzone", regression_host.test_stick_deadzone)
     runner.run_test("Host: Gamepad held/pressed", regression_host.test_gamepad_held_and_pressed)
     runner.run_test("Host: Touch held/pressed", regression_host.test_touch_held_and_pressed)
+    runner.run_test("Host: Touch tap between polls counts",
+                    regression_host.test_touch_tap_between_polls_counts)
     runner.run_test("Host: Unknown Button Name", regression_host.test_unknown_button_name_raises)
+    runner.run_test("Host: Controller decodes only the newest frame",
+                    regression_host.test_controller_decodes_only_the_newest_frame)
+    runner.run_test("Host: Controller reassembles split frames",
+                    regression_host.test_controller_reassembles_split_frames)
+    runner.run_test("Host: Controller counts drops and latency",
+                    regression_host.test_controller_counts_drops_and_latency)
+    runner.run_test("Host: Controller close frame drops the phone",
+                    regression_host.test_controller_close_frame_drops_the_phone)
+    runner.run_test("Host: Controller skips a frame too big for the buffer",
+                    regression_host.test_controller_skips_a_frame_too_big_for_the_buffer)
+    runner.run_test("Host: Controller applies compact deltas",
+                    regression_host.test_controller_applies_compact_deltas)
+    runner.run_test("Host: Controller says hello and echoes",
+                    regression_host.test_controller_says_hello_and_echoes)
+    runner.run_test("Host: Controller streams the gzipped page",
+                    regression_host.test_controller_streams_the_gzipped_page)
+    runner.run_test("Host: WebGamepad reads the WebSocket",
+                    regression_host.test_web_gamepad_reads_the_websocket)
+    runner.run_test("Host: Controller under load",
+                    regression_host.test_controller_under_load)
+    runner.run_test("Host: Web pages are built",
+                    regression_host.test_pages_are_built)
+    runner.run_test("Host: .mpy build recompiles only what changed",
+                    regression_host.test_mpy_build_recompiles_only_what_changed)
+    runner.run_test("Host: import cost of every module",
+                    regression_host.test_import_cost_bench_accounts_every_module)
+    runner.run_test("Host: stm32_flash against a simulated bootloader",
+                    regression_host.test_stm32_flash_bench)
+    runner.run_test("Host: stm32_flash differential update",
+                    regression_host.test_stm32_differential_update)
+    runner.run_test("Host: factory touch edges from packets",
+                    regression_host.test_factory_touch_edges_from_packets)
     runner.run_test("Host: Closest valid distance", regression_host.test_closest_valid)
+    runner.run_test("Host: PoseEstimator unwraps and trusts the IMU",
+                    regression_host.test_pose_estimator_unwraps_and_trusts_the_imu)
+    runner.run_test("Host: LineFollower tracks past the centre sensor",
+                    regression_host.test_line_follower_tracks_past_the_centre_sensor)
+    runner.run_test("Host: LineFollower turns back the way the line went",
+                    regression_host.test_line_follower_turns_back_the_way_the_line_went)
+    runner.run_test("Host: SuperBot builds the camera only when asked",
+                    regression_host.test_superbot_builds_the_camera_only_when_asked)
     runner.run_test("Host: Missing HuskyLens is not an error",
                     regression_host.test_missing_huskylens_is_not_an_error)
+    runner.run_test("Host: Nothing at an address is never asked",
+                    regression_host.test_nothing_at_an_address_is_never_asked)
 
     print("\n--- Running Solution Tests (testbench) ---")
     import regression_solutions
@@ -1,9 +1,9 @@
 # tests/run_solution_regression.py
 #
-# The solution-level regression. V02
+# The solution-level regression. V12
 #
 #     python3 tests/run_solution_regression.py
-#     python3 tests/run_solution_regression.py -v      # coverage report too
+#     python3 tests/run_solution_regression.py -v      # coverage and forking too
 #
 # Runs the real files out of solutions/ inside the testbench in tests/tb/.
 # No robot, no simulator, no wall-clock time -- the DUT's own sleep drives
@@ -52,6 +52,38 @@ TESTS = [
      solutions.test_p09_waits_for_the_start_button),
     ("P09: Cancel stops it before the match",
      solutions.test_p09_cancel_stops_it_before_the_match),
+    ("P09: every push from one patrol",
+     solutions.test_p09_pushes_from_one_patrol),
+    ("P09: a fork lands where a replay lands",
+     solutions.test_p09_fork_matches_replay),
+    ("Testbench: isolated runs side by side",
+     solutions.test_isolated_runs_side_by_side),
+    ("Testbench: checkpoint restores the world",
+     solutions.test_checkpoint_restores_the_world),
+    ("Testbench: floor map agrees with the geometry",
+     solutions.test_floor_map_agrees_with_the_geometry),
+    ("Testbench: raster floor matches within a cell",
+     solutions.test_raster_floor_matches_within_a_cell),
+    ("Testbench: arena index agrees with every piece",
+     solutions.test_arena_index_agrees_with_every_piece),
+    ("Testbench: ToF zones see which side",
+     solutions.test_tof_zones_see_which_side),
+    ("Testbench: ToF rays agree with every piece",
+     solutions.test_tof_rays_agree_with_every_piece),
+    ("Course: LineFollower laps the oval",
+     solutions.test_line_follower_laps_the_oval),
+    ("Course: LineFollower steady on every robot",
+     solutions.test_line_follower_is_steady_on_every_robot),
+    ("Course: LineFollower races the curves",
+     solutions.test_line_follower_races_the_curves),
+    ("Course: LineFollower finds the hairpins",
+     solutions.test_line_follower_finds_the_hairpins),
+    ("Course: drive_distance lands on every robot",
+     solutions.test_drive_distance_lands_on_every_robot),
+    ("Course: turn_to_heading settles on every robot",
+     solutions.test_turn_to_heading_settles_on_every_robot),
+    ("Course: motion queue blends without holding the loop",
+     solutions.test_motion_queue_blends_without_holding_the_loop),
 
     ("Line: squares up (directed)", solutions.test_line_squares_up_from_one_approach),
     ("Line: squares up (40 generated approaches)",
@@ -82,6 +114,26 @@ def main():
     if verbose:
         print("\n--- Coverage ---")
         print(solutions.coverage_report())
+        print("\n--- Scenario forking ---")
+        print(solutions.scenario_report())
+        print("\n--- Floor map ---")
+        print(solutions.floor_report())
+        print("\n--- Run setup ---")
+        print(solutions.isolation_report())
+        print("\n--- Arena index ---")
+        print(solutions.arena_report())
+        print("\n--- ToF zones ---")
+        print(solutions.tof_report())
+        print("\n--- LineFollower ---")
+        print(solutions.line_report())
+        print(solutions.race_report())
+        print(solutions.hairpin_report())
+        print("\n--- drive_distance ---")
+        print(solutions.drive_report())
+        print("\n--- turn_to_heading ---")
+        print(solutions.turn_report())
+        print("\n--- motion queue ---")
+        print(solutions.queue_report())
 
     runner.print_summary()
     return 1 if runner.fails else 0
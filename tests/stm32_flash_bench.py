@@ -0,0 +1,476 @@
+# tests/stm32_flash_bench.py -- stm32_flash against a simulated bootloader. V02
+#
+#     python3 tests/stm32_flash_bench.py [--kb K] [--mass] [--source FILE]
+#     python3 tests/stm32_flash_bench.py --changed N [--kb K] [--record R]
+#
+# Reflashing the motor board goes through init_bot/factory_alivk's
+# stm32_flash.py: the ESP32 puts the STM32 into its ROM bootloader and talks
+# AN3155 to it over the UART. That could only be timed with a robot and a
+# stopwatch. This runs the real stm32_flash.py in CPython against a
+# simulated bootloader on a simulated clock: every byte takes its time on
+# the wire at 115200 8E1, the STM32 takes its time to program and erase,
+# every call into the UART costs a little, and sleep_ms() moves the clock.
+# The report says what reflashing one robot would cost:
+#
+#   erase        the erase before writing, ms
+#   write/page   each 256-byte page written and acknowledged, ms
+#   read/page    each 256-byte page read back, ms
+#   uart writes  uart.write() calls per page written
+#   kept         whether the flash past the image survived the erase
+#
+# The image is checked against the simulated flash afterwards, so a faster
+# flasher that writes the wrong thing fails. --source runs another copy of
+# stm32_flash.py, e.g. an old one from git, for a before and after.
+#
+# --changed N is update_firmware(differential=True) instead: the board
+# already holds the image with N erase pages different, and the report
+# sets the compare, and the erase, write and verify of what it found,
+# against a full update of the same image. --record says what the ESP32
+# has on record of the last update: the board as it is ("good", the
+# usual case), nothing ("none", so the whole flash is read back), or
+# another firmware altogether ("stale", flashed by some other route since,
+# which the spot check has to catch).
+#
+# test_stm32_flash_bench and test_stm32_differential_update in
+# regression_host.py run short ones of each.
+
+import os
+import random
+import sys
+import tempfile
+import types
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+STM32_FLASH = os.path.join(os.path.dirname(HERE), "init_bot", "factory_alivk", "lib",
+                           "arduino_alvik", "stm32_flash.py")
+
+BYTE_US = 11 * 1000000 / 115200     # start, 8 data, parity, stop
+CALL_US = 40                # one MicroPython call into the UART driver
+PROGRAM_US = 2600           # 256 bytes, 32 double words at ~82 us
+PAGE_ERASE_US = 22000       # one 2 KB page, STM32L4 datasheet typical
+MASS_ERASE_US = 25000
+
+FLASH_BASE = 0x08000000
+FLASH_SIZE = 1024 * 1024
+ERASE_PAGE = 2048
+
+ACK = 0x79
+NACK = 0x1F
+
+
+class Clock:
+    """MicroPython's time module on a simulated clock, in microseconds."""
+
+    def __init__(self):
+        self.now_us = 0.0
+
+    def advance(self, us):
+        self.now_us += us
+
+    def ticks_ms(self):
+        return int(self.now_us // 1000)
+
+    def ticks_diff(self, later, earlier):
+        return later - earlier
+
+    def sleep_ms(self, ms):
+        self.now_us += ms * 1000
+
+
+class Bootloader:
+    """The STM32's ROM bootloader, AN3155, as far as stm32_flash uses it:
+    GET, GET ID, GET VERSION, READ, WRITE and EXTENDED ERASE. Programming
+    flash that is not erased is refused, the way the STM32L4 refuses it."""
+
+    def __init__(self, clock, old_firmware=b""):
+        self.clock = clock
+        self.flash = bytearray(b"\xff" * FLASH_SIZE)
+        self.flash[:len(old_firmware)] = old_firmware
+        self.line_free_us = 0.0     # host -> STM32, when the wire is next free
+        self.reply_free_us = 0.0    # STM32 -> host
+        self.byte_us = 0.0          # when the byte being handled arrived
+        self.replies = []           # (ready us, byte), oldest first
+        self.writes = 0
+        self.written_pages = 0
+        self._target = self._session()
+        next(self._target)
+
+    # --- the wire ---
+
+    def receive(self, data):
+        for b in data:
+            start = max(self.clock.now_us, self.line_free_us)
+            self.line_free_us = start + BYTE_US
+            self.byte_us = self.line_free_us
+            self._target.send(b)
+
+    def _reply(self, data, delay_us=0):
+        t = max(self.reply_free_us, self.byte_us + delay_us)
+        for b in data:
+            t += BYTE_US
+            self.replies.append((t, b))
+        self.reply_free_us = t
+
+    def ready(self):
+        """How many reply bytes have arrived by now."""
+        n = 0
+        for when, _b in self.replies:
+            if when > self.clock.now_us:
+                break
+            n += 1
+        return n
+
+    # --- the target ---
+
+    def _session(self):
+        while (yield) != 0x7F:
+            pass
+        self._reply([ACK])
+        while True:
+            cmd = yield
+            if cmd ^ (yield) != 0xFF:
+                self._reply([NACK])
+                continue
+            if cmd == 0x00:
+                self._reply([ACK, 4, 0x31, 0x00, 0x01, 0x02, 0x11, ACK])
+            elif cmd == 0x01:
+                self._reply([ACK, 0x31, 0x00, 0x00, ACK])
+            elif cmd == 0x02:
+                self._reply([ACK, 1, 0x04, 0x15, ACK])
+            elif cmd == 0x11:
+                yield from self._read()
+            elif cmd == 0x31:
+                yield from self._write()
+            elif cmd == 0x44:
+                yield from self._erase()
+            else:
+                self._reply([NACK])
+
+    def _address(self):
+        """Four address bytes and their checksum; the offset into flash,
+        or None after a NACK."""
+        raw = []
+        for _ in range(5):
+            raw.append((yield))
+        address = int.from_bytes(bytes(raw[:4]), "big")
+        if raw[0] ^ raw[1] ^ raw[2] ^ raw[3] != raw[4] \
+                or not FLASH_BASE <= address < FLASH_BASE + FLASH_SIZE:
+            self._reply([NACK])
+            return None
+        self._reply([ACK])
+        return address - FLASH_BASE
+
+    def _read(self):
+        self._reply([ACK])
+        offset = yield from self._address()
+        if offset is None:
+            return
+        n = yield
+        if n ^ (yield) != 0xFF:
+            self._reply([NACK])
+            return
+        self._reply([ACK])
+        self._reply(self.flash[offset:offset + n + 1])
+
+    def _write(self):
+        self._reply([ACK])
+        offset = yield from self._address()
+        if offset is None:
+            return
+        n = yield
+        checksum = n
+        data = bytearray()
+        for _ in range(n + 1):
+            b = yield
+            data.append(b)
+            checksum ^= b
+        if checksum != (yield):
+            self._reply([NACK])
+            return
+        if any(b != 0xFF for b in self.flash[offset:offset + n + 1]):
+            self._reply([NACK], PROGRAM_US)
+            return
+        self.flash[offset:offset + n + 1] = data
+        self.written_pages += 1
+        self._reply([ACK], PROGRAM_US)
+
+    def _erase(self):
+        self._reply([ACK])
+        hi = yield
+        lo = yield
+        n = (hi << 8) | lo
+        checksum = hi ^ lo
+        if n >= 0xFFF0:
+            if checksum != (yield):
+                self._reply([NACK])
+                return
+            if n == 0xFFFF:
+                self.flash[:] = b"\xff" * FLASH_SIZE
+                self._reply([ACK], MASS_ERASE_US)
+            else:
+                self._reply([NACK])
+            return
+        pages = []
+        for _ in range(n + 1):
+            hi = yield
+            lo = yield
+            checksum ^= hi ^ lo
+            pages.append((hi << 8) | lo)
+        if checksum != (yield) or max(pages) >= FLASH_SIZE // ERASE_PAGE:
+            self._reply([NACK])
+            return
+        for page in pages:
+            start = page * ERASE_PAGE
+            self.flash[start:start + ERASE_PAGE] = b"\xff" * ERASE_PAGE
+        self._reply([ACK], PAGE_ERASE_US * len(pages))
+
+
+class UART:
+    """machine.UART on the laptop, wired to a Bootloader. read() and
+    readinto() wait up to timeout ms for what they asked for, as
+    MicroPython's do; with the default 0 they return what is there."""
+
+    def __init__(self, bootloader, timeout=0):
+        self.bootloader = bootloader
+        self.timeout = timeout
+
+    def write(self, data):
+        self.bootloader.clock.advance(CALL_US)
+        self.bootloader.writes += 1
+        self.bootloader.receive(bytes(data))
+        return len(data)
+
+    def any(self):
+        return self.bootloader.ready()
+
+    def _take(self, n):
+        boot = self.bootloader
+        boot.clock.advance(CALL_US)
+        if boot.ready() < n and self.timeout:
+            deadline = boot.clock.now_us + self.timeout * 1000
+            want = boot.replies[n - 1][0] if len(boot.replies) >= n else deadline
+            boot.clock.now_us = max(boot.clock.now_us, min(want, deadline))
+        count = min(n, boot.ready())
+        taken = bytes(b for _t, b in boot.replies[:count])
+        del boot.replies[:count]
+        return taken
+
+    def read(self, n=1):
+        data = self._take(n)
+        return data or None
+
+    def readinto(self, buf, nbytes=None):
+        data = self._take(len(buf) if nbytes is None else nbytes)
+        if not data:
+            return None
+        buf[:len(data)] = data
+        return len(data)
+
+
+class _Pin:
+    IN = 0
+    OUT = 1
+
+    def __init__(self, *args, **kwargs):
+        self._value = 1
+
+    def value(self, *v):
+        if v:
+            self._value = v[0]
+        return self._value
+
+
+def load_stm32_flash(bootloader, path=STM32_FLASH):
+    """stm32_flash.py, loaded by path, with machine and time standing in
+    for the ESP32's and its UART wired to bootloader."""
+    import builtins
+
+    clock = bootloader.clock
+    machine = types.ModuleType("machine")
+    machine.Pin = _Pin
+    machine.UART = lambda *a, **k: UART(bootloader, k.get("timeout", 0))
+    mtime = types.ModuleType("time")
+    mtime.sleep_ms = clock.sleep_ms
+    mtime.ticks_ms = clock.ticks_ms
+    mtime.ticks_diff = clock.ticks_diff
+    fakes = {"machine": machine, "time": mtime}
+
+    def _import(name, *args, **kwargs):
+        if name in fakes:
+            return fakes[name]
+        return builtins.__import__(name, *args, **kwargs)
+
+    module = types.ModuleType("_bench_stm32_flash")
+    module.__dict__["__builtins__"] = dict(builtins.__dict__, __import__=_import)
+    with open(path) as f:
+        exec(compile(f.read(), path, "exec"), module.__dict__)
+    return module
+
+
+def _image(size, seed):
+    """size bytes of firmware-like image: random, with a blank page in it
+    where a real image has padding."""
+    rng = random.Random(seed)
+    image = bytearray(rng.getrandbits(8) for _ in range(size))
+    if size > 1024:
+        image[512:768] = b"\xff" * 256
+    return bytes(image)
+
+
+def run(kb=16, mass=False, source=STM32_FLASH, read_pages=8, seed=1):
+    """Flash a kb KB image onto a board holding a bigger old firmware,
+    the way update_firmware does, then read some back. Returns what the
+    simulated clock and bootloader saw."""
+    import contextlib
+    import io
+
+    image = _image(kb * 1024, seed)
+    old = _image(kb * 1024 + 3 * ERASE_PAGE, seed + 1)
+    clock = Clock()
+    boot = Bootloader(clock, old)
+    module = load_stm32_flash(boot, source)
+
+    fd, path = tempfile.mkstemp(suffix=".bin")
+    with os.fdopen(fd, "wb") as f:
+        f.write(image)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            if module.STM32_startCommunication() != module.STM32_ACK:
+                raise RuntimeError("the bootloader did not answer")
+            t0 = clock.now_us
+            if mass or not hasattr(module, "STM32_imagePages"):
+                module.STM32_eraseMEM(0xFFFF)
+            else:
+                module.STM32_eraseMEM(module.STM32_imagePages(path))
+            t1 = clock.now_us
+            writes = boot.writes
+            module.STM32_writeMEM(path)
+            t2 = clock.now_us
+            writes = boot.writes - writes
+            address = bytearray(module.STM32_ADDRESS)
+            read_ok = True
+            for i in range(read_pages):
+                module._STM32_readMode()
+                module._STM32_sendAddress(address)
+                page = module._STM32_readPage()
+                if bytes(page) != image[i * 256:(i + 1) * 256]:
+                    read_ok = False
+                module._incrementAddress(address)
+            t3 = clock.now_us
+    finally:
+        os.remove(path)
+
+    pages = (len(image) + 255) // 256
+    covered = (len(image) + ERASE_PAGE - 1) // ERASE_PAGE * ERASE_PAGE
+    return {
+        "kb": kb,
+        "pages": pages,
+        "written": boot.written_pages,
+        "erase_ms": (t1 - t0) / 1000,
+        "write_ms_per_page": (t2 - t1) / 1000 / pages,
+        "read_ms_per_page": (t3 - t2) / 1000 / read_pages,
+        "writes_per_page": writes / boot.written_pages if boot.written_pages else 0,
+        "verified": bytes(boot.flash[:len(image)]) == image and read_ok,
+        "kept": bytes(boot.flash[covered:len(old)]) == old[covered:],
+    }
+
+
+def run_differential(kb=16, changed=2, record="good", seed=1):
+    """Update a board that holds the kb KB image with `changed` erase pages
+    different, the way update_firmware(differential=True) does, with
+    `record` as the ESP32's record of the last update. Returns the
+    simulated times and whether the flash ended up as the image."""
+    import contextlib
+    import io
+
+    image = _image(kb * 1024, seed)
+    rng = random.Random(seed + 2)
+    old = bytearray(image)
+    pages = (len(image) + ERASE_PAGE - 1) // ERASE_PAGE
+    edited = sorted(rng.sample(range(pages), changed))
+    for page in edited:
+        old[page * ERASE_PAGE + rng.randrange(ERASE_PAGE)] ^= 0x5A
+    clock = Clock()
+    boot = Bootloader(clock, bytes(old))
+    module = load_stm32_flash(boot)
+
+    workdir = tempfile.mkdtemp()
+    path = os.path.join(workdir, "new.bin")
+    manifest = os.path.join(workdir, "stm32_flash.pages")
+    with open(path, "wb") as f:
+        f.write(image)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            if record != "none":
+                recorded = os.path.join(workdir, "recorded.bin")
+                with open(recorded, "wb") as f:
+                    f.write(old if record == "good" else _image(len(image), seed + 3))
+                module.STM32_writeManifest(recorded, manifest)
+            module.STM32_startCommunication()
+            t0 = clock.now_us
+            found = module.STM32_changedPages(path, manifest)
+            t1 = clock.now_us
+            ok = module.STM32_writePages(path, found)
+            t2 = clock.now_us
+    finally:
+        for name in os.listdir(workdir):
+            os.remove(os.path.join(workdir, name))
+        os.rmdir(workdir)
+
+    full = run(kb, seed=seed, read_pages=1)
+    return {
+        "kb": kb,
+        "record": record,
+        "pages": pages,
+        "edited": edited,
+        "found": found,
+        "compare_ms": (t1 - t0) / 1000,
+        "write_ms": (t2 - t1) / 1000,
+        "full_ms": full["erase_ms"] + full["write_ms_per_page"] * full["pages"],
+        "verified": ok and bytes(boot.flash[:len(image)]) == image,
+    }
+
+
+def report_differential(result):
+    return "\n".join([
+        "%d KB image, %d erase pages, %d changed on the board (found %d), record %s: %s" % (
+            result["kb"], result["pages"], len(result["edited"]), len(result["found"]),
+            result["record"], "verified" if result["verified"] else "WRONG"),
+        "  compare      %.0f ms" % result["compare_ms"],
+        "  write        %.0f ms, erase and verify included" % result["write_ms"],
+        "  total        %.0f ms, against %.0f ms for a full update" % (
+            result["compare_ms"] + result["write_ms"], result["full_ms"]),
+    ])
+
+
+def report(result):
+    return "\n".join([
+        "%d KB image, %d pages (%d written, the rest blank): %s" % (
+            result["kb"], result["pages"], result["written"],
+            "verified" if result["verified"] else "WRONG"),
+        "  erase        %.1f ms" % result["erase_ms"],
+        "  write/page   %.2f ms" % result["write_ms_per_page"],
+        "  read/page    %.2f ms" % result["read_ms_per_page"],
+        "  uart writes  %.1f per page" % result["writes_per_page"],
+        "  kept         %s" % ("yes" if result["kept"] else "no, erased"),
+    ])
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Time stm32_flash against a simulated bootloader.")
+    parser.add_argument("--kb", type=int, default=64, help="image size")
+    parser.add_argument("--mass", action="store_true", help="mass erase first, as before")
+    parser.add_argument("--source", default=STM32_FLASH, help="stm32_flash.py to run")
+    parser.add_argument("--changed", type=int, help="differential update, N pages differ")
+    parser.add_argument("--record", choices=("good", "none", "stale"), default="good",
+                        help="the ESP32's record of the last update")
+    args = parser.parse_args(argv)
+    if args.changed is not None:
+        print(report_differential(run_differential(args.kb, args.changed, args.record)))
+    else:
+        print(report(run(args.kb, args.mass, args.source)))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,14 @@
-# tests/tb/ -- the solution testbench. V01
+# tests/tb/ -- the solution testbench. V04
 #
 # plant.py      the world model: where the robot and the line really are
+# floor.py      what is under the line sensors, answered in O(1)
+# arena.py      a whole course read from a file in arenas/, grid-indexed
 # simtime.py    the simulation clock, standing in for MicroPython's time
 # fakes/        the BFM: arduino_alvik and nhs_robotics stand-ins
-# wiring.py     the single global the fakes reach for
+# wiring.py     how the fakes find the environment they belong to
 # monitor.py    every call the DUT made, in order, timestamped
 # scoreboard.py checks, all computed from the plant and never from the DUT
 # stimulus.py   generated approaches and coverage
 # env.py        wires it together and runs one unmodified solution
+# isolation.py  runs one with its own imports, so many can run at once
+# scenario.py   runs a solution once to a branch point, then forks it
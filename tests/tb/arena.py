@@ -0,0 +1,387 @@
+# tests/tb/arena.py -- a whole course, read from a file. V04
+#
+# The plant on its own knows one infinite strip of tape, one ring, one wall
+# and one target. A real course is a loop of tape with corners in it, a few
+# walls, some cones and a tag or two, and that is what an arena file
+# describes:
+#
+#   {
+#     "name":  "the oval",
+#     "start": [0, 0, 0],
+#     "tape":  [{"polyline": [[0, 0], [100, 0]], "width_cm": 2.0},
+#               {"arc": {"centre": [100, 30], "radius": 30,
+#                        "from_deg": -90, "to_deg": 90}}],
+#     "walls":     [[[-40, -40], [160, -40]]],
+#     "obstacles": [{"centre": [50, 60], "radius": 5}],
+#     "targets":   [{"x": 150, "y": 30, "mode": "stand"}],
+#     "tags":      [{"id": 1, "x": 170, "y": 30, "heading_deg": 180}]
+#   }
+#
+# Every key but "tape" may be left out. Arcs run anticlockwise from
+# from_deg to to_deg; give them the other way round to run clockwise.
+# Tape is 2 cm wide unless it says otherwise.
+#
+# Everything is put into a uniform grid when the file is read, so a question
+# about one point only ever looks at the handful of pieces in that point's
+# cell -- however many pieces the course has, and a ToF ray only ever looks
+# at the cells it passes through. An Arena is a floor in the
+# sense of floor.py, so Plant(floor=arena) just works; Plant.from_arena()
+# also hands it the walls, obstacles and targets.
+
+import json
+import math
+
+from tb.plant import Target, LINE_HALF_WIDTH_CM, TOF_RANGE_CM, ray_to_circle
+
+# The grid's cell. Big enough that a piece of tape lands in a few cells,
+# small enough that a cell holds only a few pieces.
+CELL_CM = 10.0
+
+# Tape is filed this much wider than it is, so a sensor spot that only
+# partly overlaps its edge still finds it in the spot centre's cell.
+SPOT_MARGIN_CM = 1.0
+
+
+# ---------- the pieces ----------
+
+class Segment:
+    """A straight piece: tape, or a wall."""
+
+    def __init__(self, a, b, half_width_cm=0.0):
+        self.ax, self.ay = float(a[0]), float(a[1])
+        self.bx, self.by = float(b[0]), float(b[1])
+        self.half_width_cm = half_width_cm
+        self._dx = self.bx - self.ax
+        self._dy = self.by - self.ay
+        self._length_squared = self._dx * self._dx + self._dy * self._dy
+
+    def bounds(self):
+        pad = self.half_width_cm
+        return (min(self.ax, self.bx) - pad, min(self.ay, self.by) - pad,
+                max(self.ax, self.bx) + pad, max(self.ay, self.by) + pad)
+
+    def nearest(self, x, y):
+        if self._length_squared == 0.0:
+            return self.ax, self.ay
+        t = ((x - self.ax) * self._dx + (y - self.ay) * self._dy) \
+            / self._length_squared
+        t = max(0.0, min(1.0, t))
+        return self.ax + t * self._dx, self.ay + t * self._dy
+
+    def distance(self, x, y):
+        nx, ny = self.nearest(x, y)
+        return math.hypot(x - nx, y - ny)
+
+    def ray(self, x, y, ux, uy):
+        """Distance along the unit ray (ux, uy) from (x, y) to this
+        segment, or None if it misses."""
+        denominator = ux * self._dy - uy * self._dx
+        if abs(denominator) < 1e-12:
+            return None
+        wx, wy = self.ax - x, self.ay - y
+        t = (wx * self._dy - wy * self._dx) / denominator
+        s = (wx * uy - wy * ux) / denominator
+        if t < 0.0 or s < 0.0 or s > 1.0:
+            return None
+        return t
+
+
+class Arc:
+    """A curved piece of tape: part of a circle, anticlockwise from
+    from_deg to to_deg."""
+
+    def __init__(self, centre, radius, from_deg, to_deg,
+                 half_width_cm=LINE_HALF_WIDTH_CM):
+        self.cx, self.cy = float(centre[0]), float(centre[1])
+        self.radius = float(radius)
+        self.start_deg = float(from_deg) % 360.0
+        self.sweep_deg = (float(to_deg) - float(from_deg)) % 360.0 or 360.0
+        self.half_width_cm = half_width_cm
+        self._ends = [(self.cx + self.radius * math.cos(math.radians(a)),
+                       self.cy + self.radius * math.sin(math.radians(a)))
+                      for a in (self.start_deg,
+                                self.start_deg + self.sweep_deg)]
+
+    def bounds(self):
+        # The whole circle. A little generous for a short arc, and never
+        # wrong.
+        reach = self.radius + self.half_width_cm
+        return (self.cx - reach, self.cy - reach,
+                self.cx + reach, self.cy + reach)
+
+    def _covers(self, angle_deg):
+        return (angle_deg - self.start_deg) % 360.0 <= self.sweep_deg
+
+    def distance(self, x, y):
+        dx, dy = x - self.cx, y - self.cy
+        if self._covers(math.degrees(math.atan2(dy, dx))):
+            return abs(math.hypot(dx, dy) - self.radius)
+        return min(math.hypot(x - ex, y - ey) for ex, ey in self._ends)
+
+
+class Circle:
+    """A round obstacle the ToF can see: a cone, a can."""
+
+    def __init__(self, centre, radius):
+        self.cx, self.cy = float(centre[0]), float(centre[1])
+        self.radius = float(radius)
+
+    def bounds(self):
+        return (self.cx - self.radius, self.cy - self.radius,
+                self.cx + self.radius, self.cy + self.radius)
+
+    def ray(self, x, y, ux, uy):
+        return ray_to_circle(self.cx, self.cy, self.radius, x, y, ux, uy)
+
+
+class Tag:
+    """An AprilTag standing on the floor, facing heading_deg."""
+
+    def __init__(self, tag_id, x, y, heading_deg=0.0):
+        self.id = int(tag_id)
+        self.x = float(x)
+        self.y = float(y)
+        self.heading_deg = float(heading_deg)
+
+
+# ---------- the index ----------
+
+class GridIndex:
+    """Pieces filed by every CELL_CM square their bounds touch."""
+
+    def __init__(self, cell_cm=CELL_CM):
+        self.cell_cm = float(cell_cm)
+        self._cells = {}
+        # The cells anything was filed in, as (first column, first row,
+        # last column, last row), so a search can stop at the edge of the
+        # arena rather than at the edge of its reach.
+        self._extent = None
+
+    def _cell(self, x, y):
+        return (int(math.floor(x / self.cell_cm)),
+                int(math.floor(y / self.cell_cm)))
+
+    def insert(self, piece, pad_cm=0.0):
+        min_x, min_y, max_x, max_y = piece.bounds()
+        min_x, min_y = min_x - pad_cm, min_y - pad_cm
+        max_x, max_y = max_x + pad_cm, max_y + pad_cm
+        first_column, first_row = self._cell(min_x, min_y)
+        last_column, last_row = self._cell(max_x, max_y)
+        for column in range(first_column, last_column + 1):
+            for row in range(first_row, last_row + 1):
+                self._cells.setdefault((column, row), []).append(piece)
+        if self._extent is None:
+            self._extent = (first_column, first_row, last_column, last_row)
+        else:
+            a, b, c, d = self._extent
+            self._extent = (min(a, first_column), min(b, first_row),
+                            max(c, last_column), max(d, last_row))
+
+    def at(self, x, y):
+        return self._cells.get(self._cell(x, y), ())
+
+    def rings(self, x, y, reach_cm):
+        """(nearest possible distance, pieces) for each square ring of
+        cells around (x, y), working outwards as far as reach_cm. A search
+        can stop as soon as it holds an answer nearer than the ring it is
+        about to open.
+        """
+        if self._extent is None:
+            return
+        column, row = self._cell(x, y)
+        first_column, first_row, last_column, last_row = self._extent
+        # Past this many rings every cell is outside the arena.
+        last_step = max(column - first_column, last_column - column,
+                        row - first_row, last_row - row)
+        last_step = min(last_step, int(reach_cm / self.cell_cm) + 1)
+        seen = set()
+        for step in range(last_step + 1):
+            pieces = []
+            for c in range(column - step, column + step + 1):
+                edge = c == column - step or c == column + step
+                for r in (range(row - step, row + step + 1) if edge
+                          else (row - step, row + step)):
+                    cell = self._cells.get((c, r))
+                    if cell is None:
+                        continue
+                    for piece in cell:
+                        if id(piece) not in seen:
+                            seen.add(id(piece))
+                            pieces.append(piece)
+            yield max(step - 1, 0) * self.cell_cm, pieces
+
+    def cast(self, x, y, ux, uy, reach_cm):
+        """Distance along the unit ray (ux, uy) from (x, y) to the first
+        piece it hits, or None if it hits nothing within reach_cm.
+
+        Walks the cells the ray passes through in order, one step per cell
+        (Amanatides and Woo). A piece is filed in every cell its bounds
+        touch, so a hit found in one cell may lie beyond it; the walk only
+        stops once the nearest hit so far is no further than the edge of
+        the cell it is in.
+        """
+        if self._extent is None:
+            return None
+        first_column, first_row, last_column, last_row = self._extent
+        size = self.cell_cm
+        column, row = self._cell(x, y)
+        step_column = 1 if ux > 0 else -1
+        step_row = 1 if uy > 0 else -1
+        # Distance along the ray to the next column and row boundary, and
+        # between boundaries. A ray parallel to an axis never crosses one.
+        if ux != 0.0:
+            edge = (column + (ux > 0)) * size
+            next_column_t = (edge - x) / ux
+            column_t = size / abs(ux)
+        else:
+            next_column_t = column_t = float("inf")
+        if uy != 0.0:
+            edge = (row + (uy > 0)) * size
+            next_row_t = (edge - y) / uy
+            row_t = size / abs(uy)
+        else:
+            next_row_t = row_t = float("inf")
+
+        best = None
+        seen = set()
+        while True:
+            for piece in self._cells.get((column, row), ()):
+                if id(piece) in seen:
+                    continue
+                seen.add(id(piece))
+                hit = piece.ray(x, y, ux, uy)
+                if hit is not None and (best is None or hit < best):
+                    best = hit
+            leave_t = min(next_column_t, next_row_t)
+            if best is not None and best <= leave_t:
+                break
+            if leave_t > reach_cm:
+                break
+            if next_column_t < next_row_t:
+                column += step_column
+                next_column_t += column_t
+                if (column > last_column and step_column > 0) or \
+                        (column < first_column and step_column < 0):
+                    break
+            else:
+                row += step_row
+                next_row_t += row_t
+                if (row > last_row and step_row > 0) or \
+                        (row < first_row and step_row < 0):
+                    break
+        if best is not None and best > reach_cm:
+            return None
+        return best
+
+
+# ---------- the arena ----------
+
+class Arena:
+
+    def __init__(self, tape=(), walls=(), obstacles=(), targets=(), tags=(),
+                 start=(0.0, 0.0, 0.0), name="", cell_cm=CELL_CM):
+        self.name = name
+        self.start = tuple(float(v) for v in start)
+        self.tape = list(tape)
+        self.walls = list(walls)
+        self.obstacles = list(obstacles)
+        self.targets = list(targets)
+        self.tags = list(tags)
+
+        self._floor = GridIndex(cell_cm)
+        for piece in self.tape:
+            self._floor.insert(piece, SPOT_MARGIN_CM)
+        self._solid = GridIndex(cell_cm)
+        for piece in self.walls + self.obstacles:
+            self._solid.insert(piece)
+
+    # --- reading a file ---
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as handle:
+            return cls.from_dict(json.load(handle))
+
+    @classmethod
+    def from_dict(cls, spec):
+        tape = []
+        for piece in spec.get("tape", ()):
+            half = float(piece.get("width_cm", 2.0 * LINE_HALF_WIDTH_CM)) / 2.0
+            if "polyline" in piece:
+                points = piece["polyline"]
+                if len(points) < 2:
+                    raise ValueError("a polyline needs two points: %r" % piece)
+                tape.extend(Segment(a, b, half)
+                            for a, b in zip(points, points[1:]))
+            elif "arc" in piece:
+                arc = piece["arc"]
+                tape.append(Arc(arc["centre"], arc["radius"],
+                                arc["from_deg"], arc["to_deg"], half))
+            else:
+                raise ValueError("tape must be a polyline or an arc: %r" % piece)
+        return cls(
+            tape=tape,
+            walls=[Segment(a, b) for a, b in spec.get("walls", ())],
+            obstacles=[Circle(o["centre"], o["radius"])
+                       for o in spec.get("obstacles", ())],
+            targets=[Target(t["x"], t["y"], t.get("mode", "stand"),
+                            speed_cms=t.get("speed_cms", 0.0),
+                            notice_cm=t.get("notice_cm", 60.0),
+                            gap_cm=t.get("gap_cm", 2.0))
+                     for t in spec.get("targets", ())],
+            tags=[Tag(t["id"], t["x"], t["y"], t.get("heading_deg", 0.0))
+                  for t in spec.get("tags", ())],
+            start=spec.get("start", (0.0, 0.0, 0.0)),
+            name=spec.get("name", ""),
+        )
+
+    # --- the floor ---
+
+    def is_dark(self, x, y):
+        for piece in self._floor.at(x, y):
+            if piece.distance(x, y) <= piece.half_width_cm:
+                return True
+        return False
+
+    def darkness(self, x, y, spot_cm):
+        """How much of a sensor spot of radius spot_cm centred on (x, y)
+        is over tape, 0.0 to 1.0, ramping straight across the tape's edge.
+        A spot is not a point: a real sensor's reading rises over the
+        last few millimetres before the tape, not all at once."""
+        best = 0.0
+        for piece in self._floor.at(x, y):
+            inside = piece.half_width_cm + spot_cm - piece.distance(x, y)
+            if inside > 0.0:
+                best = max(best, min(1.0, inside / (2.0 * spot_cm)))
+        return best
+
+    def distance_to_tape(self, x, y, reach_cm=TOF_RANGE_CM):
+        """From (x, y) to the middle of the nearest tape, or None if there
+        is none within reach_cm."""
+        best = None
+        for nearest_possible, pieces in self._floor.rings(x, y, reach_cm):
+            if best is not None and best <= nearest_possible:
+                break
+            for piece in pieces:
+                gap = piece.distance(x, y)
+                if best is None or gap < best:
+                    best = gap
+        if best is not None and best > reach_cm:
+            return None
+        return best
+
+    # --- what the ToF can see ---
+
+    def ray(self, x, y, angle_deg, reach_cm=TOF_RANGE_CM, targets=()):
+        """Distance from (x, y) along angle_deg to the first wall,
+        obstacle or target, or None if the ray reaches nothing."""
+        radians = math.radians(angle_deg)
+        ux, uy = math.cos(radians), math.sin(radians)
+        best = self._solid.cast(x, y, ux, uy, reach_cm)
+        for target in targets:
+            hit = ray_to_circle(target.x, target.y, target.radius_cm,
+                              x, y, ux, uy)
+            if hit is not None and hit <= reach_cm and \
+                    (best is None or hit < best):
+                best = hit
+        return best
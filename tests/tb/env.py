@@ -1,4 +1,4 @@
-# tests/tb/env.py -- the environment. V01
+# tests/tb/env.py -- the environment. V03
 #
 # Wires plant, clock, monitor and fakes together, runs one solution file
 # unmodified, and hands back the result.
@@ -8,12 +8,17 @@
 # it, so the environment works by making those names resolve to fakes:
 # tests/tb/fakes goes on the front of sys.path, and `time` is replaced in
 # sys.modules for the duration of the run. Both are restored afterwards.
+#
+# Or, with isolated=True, by handing the DUT its own __import__ instead, so
+# nothing process-wide changes and runs can go side by side. isolation.py.
 
 import os
+import random
 import sys
 import traceback
 
 from tb import wiring
+from tb.isolation import Sandbox, compiled
 from tb.simtime import SimTime
 from tb.plant import Plant
 from tb.monitor import Monitor
@@ -55,10 +60,14 @@ class Environment:
         button(name, env)  -> bool
         stick(name, env)   -> float
     Anything it does not provide reads as not-pressed / centred.
+
+    isolated runs the DUT without touching sys.path, sys.modules or
+    wiring.ACTIVE, and hands it a random of its own, seeded with seed. A
+    plain run's DUT shares the process's random.
     """
 
     def __init__(self, plant=None, stimulus=None, watchdog_ms=60000,
-                 tick_ms=10, start_ticks_ms=0):
+                 tick_ms=10, start_ticks_ms=0, isolated=False, seed=0):
         self.plant = plant or Plant()
         self.stimulus = stimulus
         self.watchdog_ms = watchdog_ms
@@ -68,6 +77,14 @@ class Environment:
         self.monitor = Monitor(self.clock)
         self.forced_cancel = False
         self.result = RunResult()
+        self.isolated = isolated
+        self.random = random.Random(seed) if isolated else random
+
+        # Called with this environment after every advance of the clock.
+        # Nothing in a plain run uses them; a Scenario hangs its branch
+        # point here, because the DUT's own sleep is the only moment the
+        # testbench ever gets control back mid-run.
+        self.probes = []
 
     # ---------- time ----------
 
@@ -81,6 +98,34 @@ class Environment:
             remaining -= slice_ms
         if self.clock.now_ms >= self.watchdog_ms:
             self.forced_cancel = True
+        for probe in list(self.probes):
+            probe(self)
+
+    # ---------- checkpoints ----------
+
+    def checkpoint(self):
+        """Plant, clock and monitor as they are right now.
+
+        The DUT is not in here and cannot be: its state lives in its own
+        locals, part way down its own call stack. This is the testbench's
+        half of a snapshot. scenario.py supplies the other half by forking.
+        `random` is included because the DUTs use it, and a restored world
+        that rolls different dice is not the same world.
+        """
+        return {
+            "plant": self.plant.checkpoint(),
+            "clock": self.clock.checkpoint(),
+            "monitor": self.monitor.checkpoint(),
+            "forced_cancel": self.forced_cancel,
+            "random": self.random.getstate(),
+        }
+
+    def restore(self, state):
+        self.plant.restore(state["plant"])
+        self.clock.restore(state["clock"])
+        self.monitor.restore(state["monitor"])
+        self.forced_cancel = state["forced_cancel"]
+        self.random.setstate(state["random"])
 
     # ---------- stimulus ----------
 
@@ -107,7 +152,8 @@ class Environment:
 
     def run(self, dut_path):
         """Execute a solution file with the fakes installed."""
-        source = open(dut_path).read()
+        if self.isolated:
+            return self._run_isolated(dut_path)
         saved_path = list(sys.path)
         saved_modules = {name: sys.modules.pop(name)
                          for name in SHADOWED if name in sys.modules}
@@ -119,11 +165,7 @@ class Environment:
 
         namespace = {"__name__": "__dut__", "__file__": dut_path}
         try:
-            exec(compile(source, dut_path, "exec"), namespace)
-            self.result.finished = True
-        except BaseException as exc:                  # noqa: BLE001
-            self.result.error = exc
-            self.result.traceback = traceback.format_exc()
+            self._execute(dut_path, namespace)
         finally:
             wiring.ACTIVE = previous
             sys.path[:] = saved_path
@@ -133,6 +175,27 @@ class Environment:
             import time as _real_time       # restore a real one for the TB
             sys.modules["time"] = _real_time
 
+        return self._finish(namespace)
+
+    def _run_isolated(self, dut_path):
+        token = wiring.bind(self)
+        try:
+            sandbox = Sandbox(self)
+            namespace = sandbox.namespace(dut_path)
+            self._execute(dut_path, namespace)
+        finally:
+            wiring.unbind(token)
+        return self._finish(namespace)
+
+    def _execute(self, dut_path, namespace):
+        try:
+            exec(compiled(dut_path), namespace)
+            self.result.finished = True
+        except BaseException as exc:                  # noqa: BLE001
+            self.result.error = exc
+            self.result.traceback = traceback.format_exc()
+
+    def _finish(self, namespace):
         self.result.watchdog = self.forced_cancel
         self.result.sim_ms = self.clock.now_ms
         self.namespace = namespace
@@ -1,4 +1,4 @@
-# tests/tb/fakes/arduino_alvik/__init__.py -- the BFM. V01
+# tests/tb/fakes/arduino_alvik/__init__.py -- the BFM. V03
 #
 # Shadows the real arduino_alvik package while a DUT runs. It decides
 # nothing. Every call is translated into a plant command or a plant query,
@@ -79,6 +79,12 @@ class ArduinoAlvik:
     def get_orientation(self):
         return wiring.active().plant.get_orientation()
 
+    def get_wheels_position(self, unit=None):
+        return wiring.active().plant.get_wheels_position()
+
+    def get_gyros(self):
+        return wiring.active().plant.get_gyros()
+
     # --- sensors ---
 
     def get_line_sensors(self):
@@ -1,4 +1,4 @@
-# tests/tb/fakes/nhs_robotics/__init__.py -- SuperBot's stand-in. V01
+# tests/tb/fakes/nhs_robotics/__init__.py -- SuperBot's stand-in. V06
 #
 # NOT the real SuperBot. The real one needs I2C, a Qwiic bus and an OLED,
 # none of which exist on a laptop.
@@ -8,8 +8,42 @@
 # is imported from the real library rather than reimplemented, so a change
 # to the real rule shows up here instead of being quietly mirrored. If a
 # fake reimplements the thing under test, it stops being a test.
+#
+# LineFollower, RobotNavigation and PoseEstimator go one further: they
+# ARE the real classes. They only ever talk to the alvik and ui they are
+# handed and to `time`, and all of those are fakes during a run, so there
+# is nothing to stand in for.
+
+import os
 
 from tb import wiring
+from tb.isolation import compiled
+
+_REAL_LIBRARY = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.dirname(os.path.abspath(__file__)))))),
+    "nhs_lib", "nhs_robotics")
+
+
+def _real(module_name, class_name):
+    """One class from the real library, loaded by file path.
+
+    By path because this package shadows the real one, so an ordinary
+    import of nhs_robotics.line_follower would find this directory. This
+    module is executed afresh for every run, and the real module runs with
+    this one's builtins, so its own `import time` is the run's clock --
+    in a plain run and an isolated one alike.
+    """
+    path = os.path.join(_REAL_LIBRARY, module_name + ".py")
+    namespace = {"__name__": "nhs_robotics." + module_name, "__file__": path,
+                 "__builtins__": __builtins__}
+    exec(compiled(path), namespace)
+    return namespace[class_name]
+
+
+LineFollower = _real("line_follower", "LineFollower")
+RobotNavigation = _real("navigation", "RobotNavigation")
+PoseEstimator = _real("pose", "PoseEstimator")
 
 try:
     from nhs_robotics.superbot import SuperBot as _RealSuperBot
@@ -49,6 +83,16 @@ class Button:
         return fired
 
 
+class _UI:
+    """RobotUI's logging, onto the monitor."""
+
+    def log_info(self, *args, sep=' '):
+        wiring.active().monitor.record("log", sep.join(str(a) for a in args))
+
+    def log_error(self, *args, sep=' '):
+        wiring.active().monitor.record("log", "ERROR " + sep.join(str(a) for a in args))
+
+
 class SuperBot:
     TOUCH_NAMES = ('up', 'down', 'left', 'right', 'ok', 'cancel')
 
@@ -57,6 +101,22 @@ class SuperBot:
         self.nano_led = NanoLED()
         self._edges = {name: Button(lambda n=name: wiring.active().touch(n))
                        for name in self.TOUCH_NAMES}
+        self.line = LineFollower(alvik)
+        self.ui = _UI()
+        self.nav = RobotNavigation(alvik, self.ui)
+        self.pose = PoseEstimator(alvik)
+
+    # --- line following, the real thing ---
+
+    def follow_line(self, base_speed, recover=False):
+        return self.line.follow(base_speed, recover)
+
+    @property
+    def line_lost(self):
+        return self.line.line_lost
+
+    def reset_line(self):
+        self.line.reset()
 
     # --- sensing ---
 
@@ -66,6 +126,12 @@ class SuperBot:
     def get_yaw(self):
         return self.alvik.get_orientation()[2]
 
+    def get_pose(self):
+        return self.pose.update()
+
+    def reset_pose(self, x=0.0, y=0.0, theta=0.0):
+        self.pose.reset(x, y, theta)
+
     # --- buttons ---
 
     def _check(self, name):
@@ -0,0 +1,91 @@
+# tests/tb/floor.py -- what is under the line sensors. V01
+#
+# The plant asks one question of the floor, once per sensor per poll: is
+# this point dark? Every answer used to be worked out from scratch -- trig
+# for the line's direction, a hypot for the ring -- and every DUT polls the
+# sensors every pass of its loop. A floor here answers in O(1):
+#
+#   TapeLine     one straight strip of tape, the line projects
+#   RingFloor    the sumo ring: black inside, a white rim outside
+#   RasterFloor  any floor at all, sampled once onto a grid
+#
+# The first two are exact, with everything that can be worked out ahead of
+# time worked out in the constructor. The raster is for floors with no
+# cheap closed form -- a curved track, a course made of many pieces -- and
+# is exact everywhere except within one cell of an edge.
+#
+# Dark means what the sensor means by it: tape, or the black of the ring.
+# The sensor reads HIGH over dark.
+
+import math
+
+
+class TapeLine:
+    """An infinite strip of tape through point, at angle_deg."""
+
+    def __init__(self, point, angle_deg, half_width_cm):
+        radians = math.radians(angle_deg)
+        # The unit normal to the line, and the line's offset along it, so
+        # the distance from any point is one dot product.
+        self._nx = math.sin(radians)
+        self._ny = -math.cos(radians)
+        self._offset = point[0] * self._nx + point[1] * self._ny
+        self.half_width_cm = half_width_cm
+
+    def distance(self, x, y):
+        return abs(x * self._nx + y * self._ny - self._offset)
+
+    def is_dark(self, x, y):
+        return self.distance(x, y) <= self.half_width_cm
+
+
+class RingFloor:
+    """A sumo ring centred on the origin: black out to the rim, white on it.
+
+    Compared squared, so there is no square root in the question.
+    """
+
+    def __init__(self, radius_cm, rim_width_cm):
+        inner = radius_cm - rim_width_cm
+        self._inner_squared = inner * inner
+
+    def is_dark(self, x, y):
+        return x * x + y * y <= self._inner_squared
+
+
+class RasterFloor:
+    """Any floor, sampled at the centre of each cell of a grid.
+
+    source is anything with is_dark(x, y). bounds is (min_x, min_y,
+    max_x, max_y) in cm; outside it the floor reads as `outside`. The
+    sampling cost is paid once, in the constructor -- about a second of
+    CPython for a square metre at 0.25 cm, which is why the analytic floors
+    above exist for the cases that have a closed form.
+    """
+
+    def __init__(self, source, bounds, cell_cm=0.25, outside=False):
+        self.min_x, self.min_y, max_x, max_y = bounds
+        self.cell_cm = float(cell_cm)
+        self.columns = int(math.ceil((max_x - self.min_x) / self.cell_cm))
+        self.rows = int(math.ceil((max_y - self.min_y) / self.cell_cm))
+        self.outside = outside
+        self._scale = 1.0 / self.cell_cm
+
+        cells = bytearray(self.columns * self.rows)
+        half = self.cell_cm / 2.0
+        index = 0
+        for row in range(self.rows):
+            y = self.min_y + row * self.cell_cm + half
+            for column in range(self.columns):
+                if source.is_dark(self.min_x + column * self.cell_cm + half, y):
+                    cells[index] = 1
+                index += 1
+        self._cells = cells
+
+    def is_dark(self, x, y):
+        column = int((x - self.min_x) * self._scale)
+        row = int((y - self.min_y) * self._scale)
+        if x < self.min_x or y < self.min_y or \
+                column >= self.columns or row >= self.rows:
+            return self.outside
+        return self._cells[row * self.columns + column] == 1
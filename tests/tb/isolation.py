@@ -0,0 +1,75 @@
+# tests/tb/isolation.py -- a DUT run that touches no globals. V01
+#
+# A plain run installs the fakes the blunt way: tests/tb/fakes on the front
+# of sys.path, the clock in sys.modules["time"], the environment in
+# wiring.ACTIVE. All three are process-wide, so two runs at once would
+# tread on each other, and every run imports the fakes from disk again.
+#
+# An isolated run changes none of them. The DUT executes with its own
+# __builtins__, whose __import__ hands out this environment's clock, its
+# own seeded random, and its own copies of arduino_alvik and nhs_robotics.
+# Everything else imports as normal. The fakes are compiled once per
+# process and only executed per run, into fresh module objects, so no two
+# runs share a class or a module global. Runs can share an interpreter --
+# threads, asyncio -- and each one is as deterministic as a plain run.
+
+import builtins
+import os
+import types
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FAKES = os.path.join(HERE, "fakes")
+
+# In the order they are loaded.
+FAKE_MODULES = ("arduino_alvik", "nhs_robotics")
+
+_CODE = {}
+
+
+def compiled(path):
+    """The code object for a file, compiled on first use and kept."""
+    code = _CODE.get(path)
+    if code is None:
+        with open(path) as handle:
+            source = handle.read()
+        code = _CODE[path] = compile(source, path, "exec")
+    return code
+
+
+class Sandbox:
+    """The modules one environment's DUT can see, and the __import__ that
+    hands them out."""
+
+    def __init__(self, env):
+        self.modules = {"time": env.clock, "random": env.random}
+        self.builtins = dict(builtins.__dict__)
+        self.builtins["__import__"] = self._import
+        for name in FAKE_MODULES:
+            self.modules[name] = self._load(name)
+
+    def _load(self, name):
+        path = os.path.join(FAKES, name, "__init__.py")
+        module = types.ModuleType(name)
+        module.__file__ = path
+        module.__builtins__ = self.builtins
+        exec(compiled(path), module.__dict__)
+        return module
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level == 0:
+            top = name.partition(".")[0]
+            if top in self.modules or top in FAKE_MODULES:
+                if name != top:
+                    # The fakes are single modules. The real library's
+                    # submodules are deliberately out of reach, exactly as
+                    # they are behind the fakes in a plain run.
+                    raise ImportError("No module named %r" % name)
+                module = self.modules.get(top)
+                if module is None:
+                    raise ImportError("%r is still being loaded" % name)
+                return module
+        return builtins.__import__(name, globals, locals, fromlist, level)
+
+    def namespace(self, dut_path):
+        return {"__name__": "__dut__", "__file__": dut_path,
+                "__builtins__": self.builtins}
@@ -1,4 +1,4 @@
-# tests/tb/monitor.py -- the transaction stream. V01
+# tests/tb/monitor.py -- the transaction stream. V02
 #
 # Everything the DUT does to the outside world, in order, with the sim
 # timestamp. The scoreboard reads this; nothing writes to the DUT here.
@@ -11,6 +11,16 @@ class Monitor:
     def record(self, kind, *args):
         self.transactions.append((self.clock.now_ms, kind, args))
 
+    # --- checkpoints ---
+
+    def checkpoint(self):
+        """A copy of the stream so far. The entries themselves are tuples
+        and never change, so a shallow copy is a real snapshot."""
+        return list(self.transactions)
+
+    def restore(self, state):
+        self.transactions = list(state)
+
     # --- queries the checks use ---
 
     def of(self, kind):
@@ -1,4 +1,4 @@
-# tests/tb/plant.py -- the reference model of the robot's world. V02
+# tests/tb/plant.py -- the reference model of the robot's world. V12
 #
 # The plant owns the truth: where the robot really is, where the line
 # really is, what the sensors would really report. The DUT never sees any
@@ -16,13 +16,28 @@
 # that claim does not depend on the exact spacing. Measure and update if a
 # test ever turns on the absolute numbers.
 
+import copy
 import math
 
+from tb.floor import TapeLine, RingFloor
+
 # --- robot geometry, modelled ---
 SENSOR_FORWARD_CM = 5.0        # line sensors ahead of the wheel axle
 SENSOR_HALF_SPACING_CM = 1.5   # outer sensors either side of centre
 LINE_HALF_WIDTH_CM = 1.0       # 2 cm tape
 
+# Measured, REFERENCE.md: 33 mm wheels on an 88 mm track. The encoders
+# count how far each wheel really turned, in degrees. RobotNavigation's
+# DEGREES_PER_CM (33.88) is its own figure, not this one's 34.7.
+WHEEL_DIAMETER_CM = 3.3
+WHEEL_TRACK_CM = 8.8
+WHEEL_DEG_PER_CM = 360.0 / (math.pi * WHEEL_DIAMETER_CM)
+
+# The library's own figure (robot_definitions.py): no wheel turns faster,
+# whatever set_wheels_speed() asks. A follower steering at full speed has
+# nothing left on the outside wheel.
+MOTOR_MAX_RPM = 70.0
+
 # Measured 2026-08-09: white paper reads about 50, a sensor solidly on
 # the line reads 300-650. The sensor reads HIGH over black, whatever the
 # black happens to be -- tape on paper in the line projects, the floor of
@@ -32,10 +47,56 @@ LINE_HALF_WIDTH_CM = 1.0       # 2 cm tape
 SENSOR_ON_VALUE = 400
 SENSOR_OFF_VALUE = 50
 
+# How big a patch of floor one line sensor sees, modelled. Left at None a
+# sensor is a point and reads one value or the other. A spot reads in
+# between across a tape edge, which is what a PID's derivative term needs:
+# on point sensors every edge is a step, and LineFollower's KD turns one
+# step into a full-lock spin that never gets off the first bend.
+SENSOR_SPOT_CM = 0.4
+
 # --- things in front of the robot ---
 TARGET_RADIUS_CM = 5.0     # an Alvik-sized object, measured from centre
 SENSOR_CONE_DEG = 30.0     # the ToF sees roughly what is ahead of it
 
+# How far the ToF can see. The datasheet figure, not measured on a robot.
+TOF_RANGE_CM = 350.0
+
+# The ToF reports five zones across that cone, left to right, the order
+# ArduinoAlvik.get_distance() hands them back in. Each zone is the nearest
+# hit of a few rays spread across it. Zone widths are the cone split
+# evenly -- modelled, not measured.
+TOF_ZONES = 5
+TOF_RAYS_PER_ZONE = 3
+
+
+def _zone_rays():
+    """Ray angles off the nose, in degrees, one tuple per zone, left
+    (positive) first."""
+    width = 2.0 * SENSOR_CONE_DEG / TOF_ZONES
+    zones = []
+    for zone in range(TOF_ZONES):
+        left_edge = SENSOR_CONE_DEG - zone * width
+        zones.append(tuple(left_edge - (ray + 0.5) * width / TOF_RAYS_PER_ZONE
+                           for ray in range(TOF_RAYS_PER_ZONE)))
+    return tuple(zones)
+
+
+TOF_ZONE_RAYS_DEG = _zone_rays()
+
+
+def ray_to_circle(cx, cy, radius, x, y, ux, uy):
+    """Distance along the unit ray (ux, uy) from (x, y) to the circle, or
+    None if it misses. A ray that starts inside is touching it: 0."""
+    wx, wy = cx - x, cy - y
+    along = wx * ux + wy * uy
+    across_squared = wx * wx + wy * wy - along * along
+    if across_squared > radius * radius:
+        return None
+    t = along - math.sqrt(radius * radius - across_squared)
+    if t < 0.0:
+        return 0.0 if wx * wx + wy * wy <= radius * radius else None
+    return t
+
 
 class Target:
     """Something the distance sensor can see: a hand, a clown, another bot.
@@ -76,13 +137,18 @@ DEFAULT_DEFECTS = {
     "sensor_dead_ms": 0,        # sensors return None this long after boot
     "yaw_offset_deg": 0.0,      # where the IMU happens to start
     "oled_present": True,       # a loose OLED silently shows nothing
+    "wheel_response_ms": 0,     # rolling, how long a new speed takes to land
+    # What each line sensor, left to right, reads solidly on the tape.
+    # Alike here; a real robot's three read anywhere in 300-650.
+    "line_on": (SENSOR_ON_VALUE,) * 3,
 }
 
 
 class Plant:
     def __init__(self, line_point=(40.0, 0.0), line_angle_deg=90.0,
                  start=(0.0, 0.0, 0.0), wall_distance_cm=None, defects=None,
-                 target=None, ring=None):
+                 target=None, ring=None, floor=None, arena=None,
+                 sensor_spot_cm=None):
         self.defects = dict(DEFAULT_DEFECTS)
         if defects:
             self.defects.update(defects)
@@ -97,6 +163,32 @@ class Plant:
         # instead of a strip of tape.
         self.ring = ring
         self.target = target
+
+        # What the line sensors see. Left as None, it is built from the
+        # line or the ring above, and rebuilt if a test moves either of
+        # them. Handed in, it replaces both -- a RasterFloor of a curved
+        # track, say. See floor.py.
+        self.floor = floor
+        self.sensor_spot_cm = sensor_spot_cm
+        self._built_floor = None
+        self._built_from = None
+
+
+        # The same for the ToF, which is worth it: fifteen rays a poll.
+        # Keyed on the targets as well, which move on their own.
+        self._ranged_key = None
+        self._ranged = None
+
+        # A whole course, from arena.py. Its tape is the floor unless a
+        # floor is handed in as well, and its walls, obstacles and targets
+        # are what the ToF sees. The arena itself is never changed; its
+        # targets are copied here because the plant moves them.
+        self.arena = arena
+        self.arena_targets = []
+        if arena is not None:
+            if floor is None:
+                self.floor = arena
+            self.arena_targets = copy.deepcopy(arena.targets)
         self.max_radius_cm = math.hypot(self.x, self.y)
         self.left_ring = False
         self.wall_distance_cm = wall_distance_cm
@@ -112,13 +204,62 @@ class Plant:
         self._cmd_age_ms = 0
         self._braking_ms = 0
 
+        # What the wheels are really doing: the command, reached over
+        # wheel_response_ms rather than at once.
+        self._v = 0.0
+        self._w = 0.0
+
         self.elapsed_ms = 0
         self.distance_travelled_cm = 0.0
 
+        # Wheel encoders, in degrees. They see the wheels' true travel;
+        # drive_scale is the wheels not turning as far as asked, and they
+        # count that honestly.
+        self.wheel_left_deg = 0.0
+        self.wheel_right_deg = 0.0
+
+        # What the gyro sees: the true turn rate, deg/s, positive to the left
+        self.yaw_rate_deg_s = 0.0
+
+    @classmethod
+    def from_arena(cls, arena, **kwargs):
+        """A plant on the arena's course, starting where the arena says."""
+        kwargs.setdefault("start", arena.start)
+        return cls(arena=arena, **kwargs)
+
+    # ---------- checkpoints ----------
+
+    def checkpoint(self):
+        """A deep copy of the whole world: robot, target, defects, the lot.
+
+        Deep because the target is an object the plant steps in place, and
+        a snapshot that shares it would move along with the live run. The
+        arena and a floor handed in are never changed, so they are shared
+        rather than copied -- a raster floor is a lot of bytes to copy for
+        nothing.
+        """
+        return copy.deepcopy(self.__dict__, self._shared())
+
+    def restore(self, state):
+        # Copied again on the way in, so one checkpoint can be restored
+        # any number of times.
+        self.__dict__.clear()
+        self.__dict__.update(copy.deepcopy(state, self._shared(state)))
+
+    def _shared(self, state=None):
+        state = self.__dict__ if state is None else state
+        return {id(state[name]): state[name]
+                for name in ("arena", "floor") if state.get(name) is not None}
+
     # ---------- commands in ----------
 
     def drive(self, forward_cms, turn_deg_s):
-        if (forward_cms, turn_deg_s) != (self._cmd_v, self._cmd_w):
+        # The lag is the robot getting going from a standstill. A robot
+        # already rolling takes a new command at once -- otherwise a DUT
+        # that steers by changing its wheel speeds every pass, as a line
+        # follower does, would never move at all.
+        at_rest = (self._cmd_v, self._cmd_w) == (0.0, 0.0)
+        if at_rest and (forward_cms, turn_deg_s) != (0.0, 0.0):
             self._cmd_age_ms = 0
         self._cmd_v = float(forward_cms)
         self._cmd_w = float(turn_deg_s)
@@ -127,15 +268,20 @@ class Plant:
     def set_wheels_speed(self, left_rpm, right_rpm):
         """Modelled, not measured. Enough to move the robot sensibly for
         the gamepad projects; no test scores absolute distance on it."""
-        wheel_circumference_cm = math.pi * 3.3
+        left_rpm = max(-MOTOR_MAX_RPM, min(MOTOR_MAX_RPM, left_rpm))
+        right_rpm = max(-MOTOR_MAX_RPM, min(MOTOR_MAX_RPM, right_rpm))
+        wheel_circumference_cm = math.pi * WHEEL_DIAMETER_CM
         left_cms = left_rpm * wheel_circumference_cm / 60.0
         right_cms = right_rpm * wheel_circumference_cm / 60.0
-        track_cm = 8.8
         self.drive((left_cms + right_cms) / 2.0,
-                   math.degrees((right_cms - left_cms) / track_cm))
+                   math.degrees((right_cms - left_cms) / WHEEL_TRACK_CM))
 
     def brake(self):
-        self._braking_ms = self.defects["brake_settle_ms"]
+        # Asked again while already rolling to a stop, the roll carries on
+        # from where it is. A DUT that brakes on every pass of its loop
+        # would otherwise roll at nearly full speed for ever.
+        if self._braking_ms == 0:
+            self._braking_ms = self.defects["brake_settle_ms"]
 
     def move(self, distance_cm):
         """move() is accurate -- 495 mm on a 500 mm command."""
@@ -169,10 +315,19 @@ class Plant:
             if self._cmd_age_ms < self.defects["drive_lag_ms"]:
                 fraction = 0.0
 
+        response_ms = self.defects["wheel_response_ms"]
+        if response_ms:
+            share = dt_ms / float(response_ms + dt_ms)
+            self._v += share * (self._cmd_v - self._v)
+            self._w += share * (self._cmd_w - self._w)
+        else:
+            self._v, self._w = self._cmd_v, self._cmd_w
+
         scale = self.defects["drive_scale"] * fraction
         seconds = dt_ms / 1000.0
-        self._advance_pose(self._cmd_v * scale * seconds,
-                           self._cmd_w * scale * seconds)
+        self.yaw_rate_deg_s = self._w * scale
+        self._advance_pose(self._v * scale * seconds,
+                           self._w * scale * seconds)
 
     def _advance_pose(self, distance_cm, turn_deg):
         # Small enough steps that straight-line integration is fine; the
@@ -183,16 +338,28 @@ class Plant:
         self.y += distance_cm * math.sin(radians)
         self.distance_travelled_cm += abs(distance_cm)
 
+        swing_cm = math.radians(turn_deg) * WHEEL_TRACK_CM / 2.0
+        self.wheel_left_deg += (distance_cm - swing_cm) * WHEEL_DEG_PER_CM
+        self.wheel_right_deg += (distance_cm + swing_cm) * WHEEL_DEG_PER_CM
+
         radius = math.hypot(self.x, self.y)
         self.max_radius_cm = max(self.max_radius_cm, radius)
         if self.ring is not None and radius > self.ring[0]:
             self.left_ring = True
 
+    def targets(self):
+        """Everything the ToF can see that moves: the test's target, then
+        the arena's."""
+        if self.target is None:
+            return self.arena_targets
+        return [self.target] + self.arena_targets
+
     def _step_target(self, dt_ms):
-        target = self.target
-        if target is None or target.mode == "stand":
-            return
+        for target in self.targets():
+            if target.mode != "stand":
+                self._step_one_target(target, dt_ms)
 
+    def _step_one_target(self, target, dt_ms):
         nose_x, nose_y = self.nose_point()
 
         if target.mode == "glued":
@@ -241,6 +408,14 @@ class Plant:
                 ry + (self.y - oy),
                 rtheta + (self.theta - otheta) * self.defects["theta_scale"])
 
+    def get_wheels_position(self):
+        """(left, right) wheel rotation in degrees since power-on."""
+        return (self.wheel_left_deg, self.wheel_right_deg)
+
+    def get_gyros(self):
+        """(gx, gy, gz) in deg/s. The robot only ever turns about z."""
+        return (0.0, 0.0, self.yaw_rate_deg_s)
+
     def get_orientation(self):
         """(roll, pitch, yaw). Yaw is the IMU: true, but 0-360 and wrapping."""
         yaw = (self.theta + self.defects["yaw_offset_deg"]) % 360.0
@@ -256,58 +431,91 @@ class Plant:
         return [(nose[0] + off * left[0], nose[1] + off * left[1])
                 for off in offsets]
 
-    def _distance_to_line(self, point):
-        radians = math.radians(self.line_angle)
-        direction = (math.cos(radians), math.sin(radians))
-        dx = point[0] - self.line_point[0]
-        dy = point[1] - self.line_point[1]
-        return abs(dx * direction[1] - dy * direction[0])
+    def floor_map(self):
+        """The floor the line sensors read, built once and kept.
+
+        Rebuilt only when the line or the ring it was built from has been
+        changed under it, which the regression never does mid-run but a
+        scenario variant is allowed to.
+        """
+        if self.floor is not None:
+            return self.floor
+        source = (self.ring, self.line_point, self.line_angle)
+        if source != self._built_from:
+            if self.ring is not None:
+                self._built_floor = RingFloor(self.ring[0], self.ring[1])
+            else:
+                self._built_floor = TapeLine(self.line_point, self.line_angle,
+                                             LINE_HALF_WIDTH_CM)
+            self._built_from = source
+        return self._built_floor
 
     def get_line_sensors(self):
         if self.elapsed_ms < self.defects["sensor_dead_ms"]:
             return (None, None, None)
 
-        if self.ring is not None:
-            # Black floor inside, white rim outside. Black reads high, so
-            # a sensor out on the rim reads LOW -- the edge is a drop.
-            inner_radius = self.ring[0] - self.ring[1]
-            return tuple(
-                SENSOR_OFF_VALUE
-                if math.hypot(point[0], point[1]) > inner_radius
-                else SENSOR_ON_VALUE
-                for point in self.sensor_positions())
-
-        return tuple(
-            SENSOR_ON_VALUE if self._distance_to_line(p) <= LINE_HALF_WIDTH_CM
-            else SENSOR_OFF_VALUE
-            for p in self.sensor_positions())
+        # In the ring, black floor inside and white rim outside. Black
+        # reads high, so a sensor out on the rim reads LOW -- the edge is
+        # a drop. On the line projects the tape is the dark thing. Either
+        # way the floor map answers "dark?" and the reading follows.
+        points = self.sensor_positions()
+        floor = self.floor_map()
+        spot = self.sensor_spot_cm
+        on = self.defects["line_on"]
+        if spot and hasattr(floor, "darkness"):
+            return tuple(int(round(SENSOR_OFF_VALUE + (high - SENSOR_OFF_VALUE)
+                                   * floor.darkness(x, y, spot)))
+                         for (x, y), high in zip(points, on))
+        return tuple(high if floor.is_dark(x, y) else SENSOR_OFF_VALUE
+                     for (x, y), high in zip(points, on))
 
     def get_distance(self):
-        """Five ToF zones: a target, a wall straight ahead, or nothing."""
-        if self.target is not None:
-            gap = self._gap_to_target()
-            if gap is None:
-                return (0, 0, 0, 0, 0)  # nothing in the cone -- no echo
-            return tuple([gap] * 5)
-
-        if self.wall_distance_cm is None:
-            return (0, 0, 0, 0, 0)      # no echo -- SuperBot turns this into 999
-        remaining = max(0.0, self.wall_distance_cm - self.distance_travelled_cm)
-        return tuple([remaining] * 5)
-
-    def _gap_to_target(self):
-        """Centimetres of clear air ahead, or None if the target is not in
-        front of the robot. Turning away really does lose sight of it,
-        which is what makes a retreat testable."""
-        nose_x, nose_y = self.nose_point()
-        dx = self.target.x - nose_x
-        dy = self.target.y - nose_y
-        bearing = math.degrees(math.atan2(dy, dx))
-        error = (bearing - self.theta + 180.0) % 360.0 - 180.0
-        if abs(error) > SENSOR_CONE_DEG:
-            return None
-        gap = math.hypot(dx, dy) - self.target.radius_cm
-        return max(gap, 0.5)
+        """Five ToF zones, left to right. Each is the nearest thing any of
+        its rays hits -- the arena, a target -- or 0 for no echo, which
+        SuperBot turns into 999. With neither an arena nor a target, the
+        old one-dimensional wall straight ahead."""
+        targets = self.targets()
+        if self.arena is None and not targets:
+            if self.wall_distance_cm is None:
+                return (0, 0, 0, 0, 0)
+            remaining = max(0.0,
+                            self.wall_distance_cm - self.distance_travelled_cm)
+            return tuple([remaining] * 5)
+
+        key = (self.x, self.y, self.theta,
+               tuple((target.x, target.y) for target in targets))
+        if key != self._ranged_key:
+            nose_x, nose_y = self.nose_point()
+            zones = []
+            for rays in TOF_ZONE_RAYS_DEG:
+                best = None
+                for offset in rays:
+                    hit = self._cast(nose_x, nose_y, self.theta + offset,
+                                     targets)
+                    if hit is not None and (best is None or hit < best):
+                        best = hit
+                zones.append(0 if best is None else max(best, 0.5))
+            self._ranged = tuple(zones)
+            self._ranged_key = key
+        return self._ranged
+
+    def _cast(self, x, y, angle_deg, targets):
+        """One ray: the arena's index if there is an arena, the targets
+        one by one if there is not, out to TOF_RANGE_CM either way.
+        Turning away really does lose sight of a target, which is what
+        makes a retreat testable."""
+        if self.arena is not None:
+            return self.arena.ray(x, y, angle_deg, targets=targets)
+        radians = math.radians(angle_deg)
+        ux, uy = math.cos(radians), math.sin(radians)
+        best = None
+        for target in targets:
+            hit = ray_to_circle(target.x, target.y, target.radius_cm,
+                                x, y, ux, uy)
+            if hit is not None and hit <= TOF_RANGE_CM and \
+                    (best is None or hit < best):
+                best = hit
+        return best
 
     # ---------- truth, for the scoreboard only ----------
 
@@ -0,0 +1,197 @@
+# tests/tb/scenario.py -- run once to a branch point, then fork. V03
+#
+# Ten different pushes in the sumo ring used to be ten runs from boot, and
+# every one of them replayed the same patrol before anything different
+# happened. A Scenario runs the DUT once, up to a named point, and forks
+# there: one child per variant, each applying its own stimulus and running
+# on to the end. Only the verdict comes back, up a pipe.
+#
+# Forking is the only way to branch a DUT in mid-flight. It is a module-level
+# script, and its state is in its own locals part way down its own call
+# stack, where no checkpoint of the testbench can reach. Copying the process
+# copies that too. Where os.fork does not exist the scenario replays from
+# boot instead, which gives the same answers -- and
+# test_p09_fork_matches_replay holds the two to that.
+#
+# A fork is not free: each child pays for the fork, for copying the pages
+# it writes to, and for a pipe and a pickle. It only beats replaying when
+# the prefix it saves costs more than that. run() times the prefix and
+# decides at the branch point; when forking would not pay, the first
+# variant carries on in this process and the rest replay from boot.
+
+import gc
+import os
+import pickle
+import random
+import sys
+import time
+
+# What one forked child costs over carrying on in-process, in seconds. On
+# the P09 pushes, one CPU, a median of 3.4 ms against an 11 ms prefix;
+# about 27 ms before the collector was frozen across the fork.
+# scenario_report() in regression_solutions prints both.
+FORK_COST_S = 0.005
+
+
+class Branched(BaseException):
+    """Unwinds the parent's own copy of the DUT once the children are out.
+
+    A BaseException, like the KeyboardInterrupt a student would send, so a
+    DUT that catches Exception cannot swallow it and keep driving.
+    """
+
+
+class Scenario:
+    """One DUT, run to a named point, then branched.
+
+        scenario = Scenario(solution(P09), make_env, "patrolling",
+                            lambda env: env.clock.now_ms >= 20000)
+        verdicts = scenario.fork(variants, check)
+
+    make_env()   builds a fresh Environment. Called once for a fork, once
+                 per variant for a replay.
+    when(env)    true at the branch point. Polled after every advance.
+    variants     [(name, apply)], where apply(env) is the one thing that
+                 differs -- a target dropped in, a button held.
+    check(env)   the verdict on one variant once its DUT has finished.
+                 Anything picklable; normally a (status, message) pair.
+
+    Every way of running returns {name: verdict}. After a run,
+    branch_ms is when the branch happened, branch_state is the testbench
+    checkpoint taken there, prefix_s is how long the run took to reach it,
+    and forked says whether run() forked there.
+    """
+
+    def __init__(self, dut_path, make_env, name, when, seed=0):
+        self.dut_path = dut_path
+        self.make_env = make_env
+        self.name = name
+        self.when = when
+        self.seed = seed
+        self.branch_ms = None
+        self.branch_state = None
+        self.prefix_s = None
+        self.forked = False
+
+    def run(self, variants, check):
+        """Run the prefix once and fork at the branch point if that pays;
+        otherwise the first variant carries on and the rest replay."""
+        if not hasattr(os, "fork") or len(variants) < 2:
+            return self.replay(variants, check)
+        return self._branch(variants, check, self._fork_pays)
+
+    def _fork_pays(self, count):
+        """Forking count children saves count - 1 prefixes over carrying
+        the first variant on in-process, and costs count forks."""
+        return self.prefix_s * (count - 1) > FORK_COST_S * count
+
+    # ---------- replaying from boot ----------
+
+    def replay(self, variants, check):
+        verdicts = {}
+        for name, apply in variants:
+            random.seed(self.seed)
+            self.branch_ms = None
+            env = self.make_env()
+            env.probes.append(self._apply_once(apply))
+            env.run(self.dut_path)
+            if self.branch_ms is None:
+                raise RuntimeError("the DUT never reached %r" % self.name)
+            verdicts[name] = self._judge(check, env)
+        return verdicts
+
+    def _apply_once(self, apply):
+        def probe(env):
+            if not self.when(env):
+                return
+            env.probes.remove(probe)
+            self.branch_ms = env.clock.now_ms
+            self.branch_state = env.checkpoint()
+            apply(env)
+        return probe
+
+    # ---------- forking at the branch point ----------
+
+    def fork(self, variants, check):
+        """Fork at the branch point whatever it costs."""
+        return self._branch(variants, check, None)
+
+    def _branch(self, variants, check, pays):
+        random.seed(self.seed)
+        self.branch_ms = None
+        self.forked = False
+        env = self.make_env()
+        children = []           # (name, pid, read end of its pipe)
+        mine = []               # the write end, in a child only
+        started = time.perf_counter()
+
+        def probe(env):
+            if not self.when(env):
+                return
+            env.probes.remove(probe)
+            self.prefix_s = time.perf_counter() - started
+            self.branch_ms = env.clock.now_ms
+            self.branch_state = env.checkpoint()
+            self.forked = pays is None or pays(len(variants))
+            if not self.forked:
+                variants[0][1](env)
+                return                      # this process drives on
+            # Out of the collector's sight while the children run: a
+            # collection in a child otherwise writes to, and so copies,
+            # every page of the testbench it walks.
+            gc.freeze()
+            for name, apply in variants:
+                read_fd, write_fd = os.pipe()
+                sys.stdout.flush()
+                pid = os.fork()
+                if pid == 0:
+                    os.close(read_fd)
+                    mine.append(write_fd)
+                    # CPython reseeds `random` in every forked child, so
+                    # the dice have to be put back by hand or no two
+                    # forks of the same variant agree. env.random is that
+                    # module, or an isolated run's own Random.
+                    env.random.setstate(self.branch_state["random"])
+                    apply(env)
+                    return                  # the child drives on
+                os.close(write_fd)
+                children.append((name, pid, read_fd))
+            gc.unfreeze()
+            raise Branched()
+
+        env.probes.append(probe)
+        env.run(self.dut_path)
+
+        if mine:
+            # A child, and its DUT has finished. It must never return into
+            # the caller: that would run the rest of the suite once more
+            # per variant.
+            try:
+                payload = pickle.dumps(self._judge(check, env))
+                with os.fdopen(mine[0], "wb") as pipe:
+                    pipe.write(payload)
+            finally:
+                os._exit(0)
+
+        if self.branch_ms is None:
+            raise RuntimeError("the DUT never reached %r" % self.name)
+        if not self.forked:
+            verdicts = {variants[0][0]: self._judge(check, env)}
+            verdicts.update(self.replay(variants[1:], check))
+            return verdicts
+
+        verdicts = {}
+        for name, pid, read_fd in children:
+            with os.fdopen(read_fd, "rb") as pipe:
+                payload = pipe.read()
+            os.waitpid(pid, 0)
+            verdicts[name] = (pickle.loads(payload) if payload
+                              else (0, "variant died without a verdict"))
+        return verdicts
+
+    @staticmethod
+    def _judge(check, env):
+        try:
+            return check(env)
+        except Exception as exc:                    # noqa: BLE001
+            return 0, "check raised %r" % exc
@@ -1,4 +1,4 @@
-# tests/tb/simtime.py -- the simulation clock. V01
+# tests/tb/simtime.py -- the simulation clock. V02
 #
 # The DUT imports `time` and calls ticks_ms(), ticks_diff() and sleep_ms().
 # Those are MicroPython names that CPython does not have, so a shim is
@@ -31,6 +31,13 @@ class SimTime:
 
     # --- the world advances only through here ---
 
+    def checkpoint(self):
+        """Everything needed to put this clock back where it is now."""
+        return (self.now_ms, self.origin_ms)
+
+    def restore(self, state):
+        self.now_ms, self.origin_ms = state
+
     def advance(self, dt_ms):
         """Push simulated time forward and step whatever is watching."""
         if dt_ms <= 0:
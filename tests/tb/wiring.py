@@ -1,16 +1,37 @@
-# tests/tb/wiring.py -- the one global the fakes look at. V01
+# tests/tb/wiring.py -- how the fakes find their environment. V02
 #
 # The DUT builds its own ArduinoAlvik() and SuperBot() at module level, so
 # the fakes cannot be handed a plant through a constructor argument. They
-# reach for whatever environment is active instead. Exactly one run
-# happens at a time, so a module global is the whole mechanism.
+# reach for whatever environment is active instead.
+#
+# A plain run sets ACTIVE, a module global, and exactly one of those can
+# happen at a time. An isolated run binds its environment to the current
+# context instead -- per thread, and per asyncio task -- so any number can
+# run side by side. A binding wins over ACTIVE.
+
+import contextvars
 
 ACTIVE = None
 
+_BOUND = contextvars.ContextVar("tb_environment", default=None)
+
 
 def active():
+    env = _BOUND.get()
+    if env is not None:
+        return env
     if ACTIVE is None:
         raise RuntimeError(
             "A fake robot was built with no environment active. The DUT was "
             "imported outside Environment.run().")
     return ACTIVE
+
+
+def bind(env):
+    """Make env the active one in this context. Hand the token back to
+    unbind()."""
+    return _BOUND.set(env)
+
+
+def unbind(token):
+    _BOUND.reset(token)
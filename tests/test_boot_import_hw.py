@@ -0,0 +1,27 @@
+# test_boot_import_hw.py — TEACHER HARDWARE SMOKE TEST (not for students)
+# Reset the robot (Ctrl-D in the REPL) and run this FIRST, before anything
+# else imports the library -- a module already imported costs nothing.
+# It imports what a student's program starts with and prints how long that
+# took, the free heap before and after, and whether /lib is the compiled
+# .mpy build (initialize_robot.sh -m) or the .py source.
+# Pass = runs. Sync once each way and compare: the .mpy build should import
+# faster and leave more heap free. import_cost_bench.py splits the same
+# import up module by module.
+import gc
+from time import ticks_ms, ticks_diff
+
+gc.collect()
+free_before = gc.mem_free()
+start = ticks_ms()
+from arduino_alvik import ArduinoAlvik    # noqa: E402,F401
+from nhs_robotics import SuperBot         # noqa: E402,F401
+import nhs_robotics.superbot as superbot  # noqa: E402
+took = ticks_diff(ticks_ms(), start)
+gc.collect()
+free_after = gc.mem_free()
+
+built = "compiled .mpy" if superbot.__file__.endswith(".mpy") else ".py source"
+print("lib is %s (%s)" % (built, superbot.__file__))
+print("import: %d ms" % took)
+print("heap free: %d before, %d after, %d used" % (
+    free_before, free_after, free_before - free_after))
@@ -0,0 +1,44 @@
+# test_drive_distance_hw.py — TEACHER HARDWARE SMOKE TEST (not for students)
+# Put the robot on a clear floor with a metre in front of it, run, and watch.
+# It drives each distance in MOVES_CM with RobotNavigation.drive_distance,
+# pausing between them, and prints how long each took and where the encoders
+# say it stopped. Pass = every stop within a centimetre of the ask.
+from arduino_alvik import ArduinoAlvik
+from nhs_robotics import RobotNavigation
+from time import sleep_ms, ticks_ms, ticks_diff
+
+MOVES_CM = (5, 30, -15, 60, -20)
+SPEED_CM_S = 20
+PAUSE_MS = 1000
+
+
+class _Log:
+    def log_info(self, *args, sep=' '):
+        print(sep.join(str(a) for a in args))
+
+    def log_error(self, *args, sep=' '):
+        print("ERROR", sep.join(str(a) for a in args))
+
+
+alvik = ArduinoAlvik()
+alvik.begin()
+nav = RobotNavigation(alvik, _Log())
+
+# (distance, start ms, done ms) for each move, for whoever is reading
+RESULTS = []
+try:
+    for distance in MOVES_CM:
+        left, right = alvik.get_wheels_position()
+        before = (left + right) / 2.0
+        start = ticks_ms()
+        nav.drive_distance(distance, speed_cm_s=SPEED_CM_S)
+        done = ticks_ms()
+        RESULTS.append((distance, start, done))
+        left, right = alvik.get_wheels_position()
+        moved = ((left + right) / 2.0 - before) / nav.DEGREES_PER_CM
+        print("%+4d cm: %.1f cm in %d ms (coast %.2f s)" % (
+            distance, moved, ticks_diff(done, start), nav.coast_s))
+        sleep_ms(PAUSE_MS)
+finally:
+    alvik.brake()
+    alvik.stop()
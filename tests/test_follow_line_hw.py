@@ -1,5 +1,8 @@
 # test_follow_line_hw.py — TEACHER HARDWARE SMOKE TEST (not for students)
 # Place robot on a taped line, run, press CANCEL (X) to stop.
+# It first sweeps left and right across the tape to calibrate the sensors,
+# then follows. Amber LEDs = off the line and turning back to find it;
+# red = gave up looking.
 # Pass = robot tracks the line for 15 seconds without leaving it.
 from arduino_alvik import ArduinoAlvik
 from nhs_robotics import LineFollower
@@ -10,18 +13,24 @@ BASE_SPEED = 25  # start slow; raise after first clean run
 alvik = ArduinoAlvik()
 alvik.begin()
 lf = LineFollower(alvik)
+if not lf.calibrate():
+    print("calibration failed - is the centre sensor on the tape?")
 start = ticks_ms()
 try:
     while not alvik.get_touch_cancel():
         sleep_ms(15)
-        left, right = lf.follow(BASE_SPEED)
+        left, right = lf.follow(BASE_SPEED, recover=True)
         if lf.line_lost:
             alvik.left_led.set_color(1, 0, 0)   # red = lost
             alvik.right_led.set_color(1, 0, 0)
             alvik.brake()
             continue
-        alvik.left_led.set_color(0, 1, 0)
-        alvik.right_led.set_color(0, 1, 0)
+        if lf.recovering:
+            alvik.left_led.set_color(1, 1, 0)   # amber = turning back to it
+            alvik.right_led.set_color(1, 1, 0)
+        else:
+            alvik.left_led.set_color(0, 1, 0)
+            alvik.right_led.set_color(0, 1, 0)
         alvik.set_wheels_speed(left, right)
         if ticks_diff(ticks_ms(), start) > 15000:
             print("15 s complete - PASS if still on line")
@@ -0,0 +1,45 @@
+# test_line_race_hw.py — TEACHER HARDWARE SMOKE TEST (not for students)
+# Place robot on a taped course with tight bends, run, press CANCEL (X) to
+# stop. It calibrates, then follows flat out: BASE_SPEED is the wheels' top
+# speed, and LineFollower has to slow itself for the bends. Prints the time
+# every LAP_PRINT_MS so a lap can be timed against a stopwatch. Amber LEDs =
+# off the line and turning back to find it; red = gave up looking.
+# Pass = round the course at full speed without leaving the line.
+from arduino_alvik import ArduinoAlvik
+from nhs_robotics import LineFollower
+from time import sleep_ms, ticks_ms, ticks_diff
+
+BASE_SPEED = 70  # rpm, robot_definitions.MOTOR_MAX_RPM
+LAP_PRINT_MS = 5000
+
+alvik = ArduinoAlvik()
+alvik.begin()
+lf = LineFollower(alvik)
+if not lf.calibrate():
+    print("calibration failed - is the centre sensor on the tape?")
+start = ticks_ms()
+printed = start
+try:
+    while not alvik.get_touch_cancel():
+        sleep_ms(15)
+        left, right = lf.follow(BASE_SPEED, recover=True)
+        if lf.line_lost:
+            alvik.left_led.set_color(1, 0, 0)   # red = lost
+            alvik.right_led.set_color(1, 0, 0)
+            alvik.brake()
+            continue
+        if lf.recovering:
+            alvik.left_led.set_color(1, 1, 0)   # amber = turning back to it
+            alvik.right_led.set_color(1, 1, 0)
+        else:
+            alvik.left_led.set_color(0, 1, 0)
+            alvik.right_led.set_color(0, 1, 0)
+        alvik.set_wheels_speed(left, right)
+        if ticks_diff(ticks_ms(), printed) >= LAP_PRINT_MS:
+            printed = ticks_ms()
+            print("%d ms, %.0f rpm" % (ticks_diff(printed, start), lf.speed))
+finally:
+    alvik.brake()
+    alvik.left_led.set_color(0, 0, 0)
+    alvik.right_led.set_color(0, 0, 0)
+    alvik.stop()
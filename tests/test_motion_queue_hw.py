@@ -0,0 +1,75 @@
+# test_motion_queue_hw.py — TEACHER HARDWARE SMOKE TEST (not for students)
+# Put the robot on a clear floor with a metre in front of it, run, and watch.
+# It drives the same course twice -- three 20 cm drives and a quarter turn --
+# first with the blocking calls, then queued and run from a main loop that
+# calls nav.update() every tick. Prints how long each took and the longest
+# the main loop went between ticks. Pass = the queued run is quicker, its
+# loop never stalls, and both end 60 cm on and 90 deg round.
+from arduino_alvik import ArduinoAlvik
+from nhs_robotics import RobotNavigation
+from time import sleep_ms, ticks_ms, ticks_diff
+
+LEGS_CM = (20, 20, 20)
+TURN_DEG = 90
+SPEED_CM_S = 20
+TICK_MS = 10
+PAUSE_MS = 1000
+
+
+class _Log:
+    def log_info(self, *args, sep=' '):
+        print(sep.join(str(a) for a in args))
+
+    def log_error(self, *args, sep=' '):
+        print("ERROR", sep.join(str(a) for a in args))
+
+
+def get_yaw():
+    return alvik.get_orientation()[2]
+
+
+alvik = ArduinoAlvik()
+alvik.begin()
+nav = RobotNavigation(alvik, _Log())
+
+# (how, target heading, start ms, done ms, worst loop gap ms) for each run
+RESULTS = []
+try:
+    # Blocking: the loop is held for the whole of every call
+    target = (get_yaw() + TURN_DEG) % 360
+    start = ticks_ms()
+    worst = 0
+    for leg in LEGS_CM:
+        before = ticks_ms()
+        nav.drive_distance(leg, speed_cm_s=SPEED_CM_S)
+        worst = max(worst, ticks_diff(ticks_ms(), before))
+    before = ticks_ms()
+    nav.turn_to_heading(target, get_yaw)
+    worst = max(worst, ticks_diff(ticks_ms(), before))
+    done = ticks_ms()
+    RESULTS.append(("blocking", target, start, done, worst))
+    print("blocking: %d ms, loop held up to %d ms" % (ticks_diff(done, start), worst))
+    sleep_ms(PAUSE_MS)
+
+    # Queued: one main loop, update() once a tick
+    target = (get_yaw() + TURN_DEG) % 360
+    for leg in LEGS_CM:
+        nav.queue_drive(leg, speed_cm_s=SPEED_CM_S)
+    nav.queue_turn(target, get_yaw)
+    start = ticks_ms()
+    last = start
+    worst = 0
+    while not nav.update():
+        now = ticks_ms()
+        worst = max(worst, ticks_diff(now, last))
+        last = now
+        sleep_ms(TICK_MS)
+    done = ticks_ms()
+    worst = max(worst, ticks_diff(done, last))
+    RESULTS.append(("queued", target, start, done, worst))
+    print("queued:   %d ms, loop held up to %d ms" % (ticks_diff(done, start), worst))
+    sleep_ms(PAUSE_MS)
+finally:
+    nav.clear_queue()
+    alvik.brake()
+    alvik.stop()
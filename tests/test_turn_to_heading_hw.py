@@ -0,0 +1,49 @@
+# test_turn_to_heading_hw.py — TEACHER HARDWARE SMOKE TEST (not for students)
+# Put the robot on a clear floor where it can spin, run, and watch.
+# It turns by each angle in TURNS_DEG with RobotNavigation.turn_to_heading,
+# pausing between them, and prints how long each took and where the IMU
+# says it stopped. Pass = every stop within TOLERANCE_DEG of the ask.
+from arduino_alvik import ArduinoAlvik
+from nhs_robotics import RobotNavigation
+from time import sleep_ms, ticks_ms, ticks_diff
+
+TURNS_DEG = (90, -45, 10, 180, -3, -120)
+TOLERANCE_DEG = 2.0
+PAUSE_MS = 1000
+
+
+class _Log:
+    def log_info(self, *args, sep=' '):
+        print(sep.join(str(a) for a in args))
+
+    def log_error(self, *args, sep=' '):
+        print("ERROR", sep.join(str(a) for a in args))
+
+
+def get_yaw():
+    return alvik.get_orientation()[2]
+
+
+def off_by(target):
+    return (get_yaw() - target + 180) % 360 - 180
+
+
+alvik = ArduinoAlvik()
+alvik.begin()
+nav = RobotNavigation(alvik, _Log())
+
+# (target heading, start ms, done ms) for each turn, for whoever is reading
+RESULTS = []
+try:
+    for turn in TURNS_DEG:
+        target = (get_yaw() + turn) % 360
+        start = ticks_ms()
+        nav.turn_to_heading(target, get_yaw, TOLERANCE_DEG)
+        done = ticks_ms()
+        RESULTS.append((target, start, done))
+        print("%+4d deg: %+.1f off in %d ms" % (
+            turn, off_by(target), ticks_diff(done, start)))
+        sleep_ms(PAUSE_MS)
+finally:
+    alvik.brake()
+    alvik.stop()